@@ -1,21 +1,20 @@
 import os
-import json
 import time
 import tyro
 from datetime import datetime
-from io import BytesIO
-import numpy as np
 from pathlib import Path
-from PIL import Image
-import base64
-from mcap.writer import Writer
-
-from lerobot.common.datasets.lerobot_dataset import LeRobotDataset
-from aloha_lerobot.config import (
-    aloha_14dof_data,
-    aloha_2dof_data,
-    compressed_image_schema_data,
-)
+from typing import Literal, Optional, Tuple
+from multiprocessing import get_context
+
+from common.catalog import Catalog
+from common.encoding import Encoding, encode_compressed_image, encode_compressed_video, encode_joint_states
+from common.image import ImageBackend, ImageEncoder, ImageFormat, to_uint8_hwc
+from common.manifest import MANIFEST_FILE, Manifest, fingerprint
+from common.metrics import Metrics, make_metrics, write_json_line, write_prometheus
+from common.preview import Preview, PreviewSink, preview_path
+from common.sink import JointStateBlock, McapSink, frame_timestamp
+from common.video import iter_video_packets
+from aloha_lerobot.reader import EpisodeReader
 
 list_key_2 = ["base_action"]
 list_key_14 = ["observation.state", "action", "observation.velocity", "observation.effort"]
@@ -30,20 +29,73 @@ list_key_image = [
 def mcap_builder(
         dataset_path: Path,
         output_path: Path,
-        episode_idx: int = -1
+        episode_idx: int = -1,
+        episodes: Tuple[int, ...] = (),
+        encoding: Encoding = "json",
+        workers: int = 1,
+        reader: Literal["dataset", "columnar"] = "dataset",
+        video: Literal["reencode", "passthrough"] = "reencode",
+        image_format: ImageFormat = "jpeg",
+        image_quality: int = 75,
+        image_backend: ImageBackend = "auto",
+        preview: bool = False,
+        preview_fps: float = 5.0,
+        preview_width: int = 320,
+        preview_quality: int = 50,
+        async_writes: bool = False,
+        force: bool = False,
+        metrics_path: Optional[Path] = None,
+        prometheus_path: Optional[Path] = None,
 ):
     """
     Transform LeRobotDataset to MCAP, one episode per file.
     - If episode_idx = -1 (by default), build all episode.
     - If episode_idx >= 0 and exist, build only this episode.
+    - episodes: build only these episodes (shards of tools/batch.py), overrides episode_idx.
+    - encoding: message encoding of all channels (json, protobuf or cdr).
+      Binary encodings store images as raw bytes instead of base64.
+    - workers > 1: build episodes in parallel, one process (and one dataset handle) per worker.
+    - reader: "dataset" reads frames with dataset[index], "columnar" reads the episode
+      parquet in one pass and decodes each camera video once, sequentially.
+    - video: "reencode" writes JPEG frames, "passthrough" writes the camera video packets
+      as foxglove.CompressedVideo without decoding (implies the columnar reader).
+      Videos with B-frames are rejected (their packets are out of presentation order).
+    - image_format / image_quality / image_backend: compression of reencoded camera frames,
+      backend "auto" picks the fastest installed one (turbojpeg > cv2 > pil),
+      see benchmarks/image_encoders.py.
+    - preview: also write episode_<n>.preview.mcap in the same pass (common/preview.py):
+      camera frames at preview_fps, preview_width pixels wide, JPEG preview_quality, and the
+      joint states as-is. Thumbnails come from the frames decoded for the full file
+      (no camera in the preview with video = "passthrough", which decodes nothing).
+    - async_writes = True: MCAP chunk compression and file writes run in a background thread
+      (common/sink.py AsyncWriter), overlapping decoding and encoding; the file is the same.
+    - Episodes are recorded in `manifest.json` of output_path (input fingerprint, options,
+      output size and mtime); a rerun skips the episodes that are up to date, unless force = True.
+    - Episode channels are recorded in `catalog.sqlite` of output_path (common/catalog.py).
+    - metrics_path: append per-episode stage timers and counters (dataset read, video decode,
+      image encode, serialize, MCAP write/finish) as JSON lines to this file.
+    - prometheus_path: write the run totals as a Prometheus textfile (node exporter).
+      Without metrics_path / prometheus_path, instrumentation is disabled.
     """
 
     if not os.path.exists(output_path):
         os.makedirs(output_path)
     else:
-        assert not os.listdir(output_path), (
+        assert not os.listdir(output_path) or os.path.exists(os.path.join(output_path, MANIFEST_FILE)), (
             "Error: Output path is not empty. Please provide an empty directory."
         )
+    manifest = Manifest(output_path)
+    manifest.create()
+    image_encoder = ImageEncoder(image_format, image_quality, image_backend)
+    options = {
+        "encoding": encoding, "reader": reader, "video": video,
+        "image_format": image_format, "image_quality": image_quality,
+    }
+    preview_options = Preview(preview_fps, preview_width, preview_quality, image_backend) if preview else None
+    if preview_options is not None:
+        options["preview"] = preview_options.options()
+    metrics_enabled = bool(metrics_path or prometheus_path)
+    total_metrics = Metrics()
 
     dataset = load_lerobot_aloha(dataset_path)
 
@@ -61,141 +113,225 @@ def mcap_builder(
     # FPS chung cho toàn bộ dataset (theo meta)
     fps = dataset.meta.fps
 
+    tasks = []
+    input_fingerprints = {}
     for ep_idx, start_idx, length in episodes_info:
         # Nếu episode_idx != -1 và ep_idx không trùng, bỏ qua
-        if episode_idx != -1 and ep_idx != episode_idx:
+        if episodes:
+            if ep_idx not in episodes:
+                continue
+        elif episode_idx != -1 and ep_idx != episode_idx:
             continue
+        mcap_name = f"episode_{ep_idx}.mcap"
+        input_fingerprints[ep_idx] = fingerprint(episode_inputs(dataset, ep_idx), root=dataset.root)
+        mcap_file = os.path.join(output_path, mcap_name)
+        if (
+                not force and manifest.is_up_to_date(mcap_name, input_fingerprints[ep_idx], options)
+                and (not preview or os.path.exists(preview_path(mcap_file)))
+        ):
+            print(f"Skip Eps {ep_idx}: up to date")
+            continue
+        tasks.append((
+            ep_idx, start_idx, length, fps, mcap_file, encoding, reader, video, image_encoder, metrics_enabled,
+            preview_options, async_writes,
+        ))
+
+    def finish_episode(ep_idx, episode_duration, metrics):
+        # Chỉ process cha ghi manifest và metrics, sau khi file episode đã được rename xong
+        manifest.record(f"episode_{ep_idx}.mcap", input_fingerprints[ep_idx], options)
+        catalog.record(os.path.join(output_path, f"episode_{ep_idx}.mcap"), source=ep_idx, builder="aloha_lerobot")
+        if metrics is not None:
+            total_metrics.merge(metrics)
+            if metrics_path:
+                labels = {"builder": "aloha_lerobot", "episode": ep_idx, "output": os.path.join(output_path, f"episode_{ep_idx}.mcap")}
+                write_json_line(metrics_path, labels, metrics, seconds=episode_duration)
+        print(f"Finish Eps {ep_idx} in {episode_duration:.2f} seconds")
 
+    catalog = Catalog(output_path)
+    build_start_time = time.time()
+    if workers > 1 and len(tasks) > 1:
+        # Mỗi worker tự mở LeRobotDataset, imap giữ đúng thứ tự episode khi in.
+        # spawn: không fork process cha đã khởi tạo torch/dataset
+        with get_context("spawn").Pool(processes=min(workers, len(tasks)), initializer=init_worker, initargs=(dataset_path,)) as pool:
+            for result in pool.imap(build_episode_worker, tasks):
+                finish_episode(*result)
+    else:
+        for task in tasks:
+            finish_episode(*build_episode(dataset, *task))
+    catalog.close()
+    print(f"Finish {len(tasks)} episodes in {time.time() - build_start_time:.2f} seconds")
+    if prometheus_path:
+        write_prometheus(prometheus_path, {"builder": "aloha_lerobot"}, total_metrics.snapshot())
 
-        episode_start_time = time.time()
-
-        mcap_file = os.path.join(output_path, f"episode_{ep_idx}.mcap")
-
-        ts = int(datetime.now().timestamp())
-
-        with open(mcap_file, "wb") as f:
-            writer = Writer(f)
-            writer.start()
+    return "MCAP file successfully built and stored in output path."
 
-            # Đăng ký schema
-            aloha_14dof_schema_id = writer.register_schema(
-                name="aloha_14dof",
-                encoding="jsonschema",
-                data=json.dumps(aloha_14dof_data).encode("utf-8")
-            )
-            aloha_2dof_schema_id = writer.register_schema(
-                name="aloha_2dof",
-                encoding="jsonschema",
-                data=json.dumps(aloha_2dof_data).encode("utf-8")
-            )
-            image_schema_id = writer.register_schema(
-                name="foxglove.CompressedImage",
-                encoding="jsonschema",
-                data=json.dumps(compressed_image_schema_data).encode("utf-8")
-            )
 
+def build_episode(
+        dataset, ep_idx, start_idx, length, fps, mcap_file,
+        encoding: Encoding = "json", reader="dataset", video="reencode", image_encoder=None,
+        metrics_enabled=False, preview=None, async_writes=False,
+):
+    """
+    Build one episode into `mcap_file`, return (ep_idx, duration in seconds, metrics snapshot
+    or None when metrics are disabled). preview: common.preview.Preview options, None for no preview.
+    """
+    episode_start_time = time.time()
+    image_encoder = image_encoder or ImageEncoder()
+    metrics = make_metrics(metrics_enabled)
+
+    start_ts = int(datetime.now().timestamp() * 1000)  # ms
+
+    preview_sink = None
+    if preview is not None:
+        preview_sink = PreviewSink(mcap_file, preview, encoding, metrics, async_writes=async_writes)
+    with McapSink(mcap_file, encoding, metrics=metrics, preview=preview_sink, async_writes=async_writes) as sink:
+        metrics.count("frames", length)
+        if reader == "columnar" or video == "passthrough":
+            write_episode_columnar(sink, dataset, ep_idx, length, start_ts, fps, video, image_encoder)
+        else:
+            # Joint states serialized a block of frames at a time, written in frame order
+            block = JointStateBlock(sink)
             # Duyệt tất cả frame của episode này
-            for index in range(start_idx, start_idx + length):
+            for frame_idx, index in enumerate(range(start_idx, start_idx + length)):
+                ts = frame_timestamp(start_ts, frame_idx, fps)
 
-                frame_data = dataset[index]
+                with metrics.timer("dataset_read"):
+                    frame_data = dataset[index]
 
                 for key, value in frame_data.items():
                     if key in list_key_2:
-                        add_message_data(writer, key, value, ts, aloha_2dof_schema_id)
+                        add_message_data(block, key, value, ts, "aloha_2dof")
                     elif key in list_key_14:
-                        add_message_data(writer, key, value, ts, aloha_14dof_schema_id)
+                        add_message_data(block, key, value, ts, "aloha_14dof")
                     elif key in list_key_image:
-                        add_message_image(writer, key, value, ts, image_schema_id)
+                        add_message_image(block, key, value, ts, image_encoder)
+                block.end_frame()
+            block.flush()
 
-                # Cập nhật ts theo fps (mặc dù ts đang tính bằng giây,
-                # nhưng increment lại là ms.
-                ts += int(1000 / fps)
+    # Đo thời gian kết thúc
+    return ep_idx, time.time() - episode_start_time, metrics.snapshot() if metrics_enabled else None
 
-            writer.finish()
 
-        # Đo thời gian kết thúc
-        episode_end_time = time.time()
-        episode_duration = episode_end_time - episode_start_time
-        print(f"Finish Eps {ep_idx} in {episode_duration:.2f} seconds")
-
-    return "MCAP file successfully built and stored in output path."
-
-
-def compress_tensor_to_jpeg(tensor_img):
-    # tensor_img: torch.Tensor [3,H,W] -> chuyển về numpy [H,W,3]
-    np_img = tensor_img.numpy()  # [3,H,W]
-    np_img = np.transpose(np_img, (1, 2, 0))  # [H,W,3]
-
-    pil_img = Image.fromarray((np_img * 255).astype(np.uint8), mode='RGB')
-
-    buffer = BytesIO()
-    pil_img.save(buffer, format='JPEG')
-    jpg_bytes = buffer.getvalue()
-
-    b64_str = base64.b64encode(jpg_bytes).decode('utf-8')
-    return b64_str
-
-
-def add_message_data(writer, key, data, ts, schema):
-    data_channel_id = writer.register_channel(
-        topic=f"/data/{key}",
-        message_encoding="json",
-        schema_id=schema
-    )
+def write_episode_columnar(sink, dataset, ep_idx, length, start_ts, fps, video="reencode", image_encoder=None):
+    """
+    Same messages as the dataset[index] loop, read through EpisodeReader:
+    numeric columns come as (T, D) arrays, images as uint8 frames of a sequential decode,
+    or as the untouched video packets when video = "passthrough".
+    """
+    metrics = sink.metrics
+    episode = EpisodeReader(dataset, ep_idx)
+    with metrics.timer("parquet_read"):
+        columns = episode.read_columns(list_key_2 + list_key_14)
+    channels = {
+        key: sink.channel_id(f"/data/{key}", "aloha_2dof" if key in list_key_2 else "aloha_14dof")
+        for key in columns
+    }
+    video_keys = [key for key in list_key_image if key in episode.video_keys]
+    if video == "passthrough":
+        videos = {key: iter_video_packets(episode.video_file(key)) for key in video_keys}
+    else:
+        videos = {key: episode.iter_video(key) for key in video_keys}
+
+    timestamps = [frame_timestamp(start_ts, frame_idx, fps) for frame_idx in range(length)]
+    # Whole (T, D) columns at once: one json template pass per key, no per-frame json.dumps
+    with metrics.timer("serialize"):
+        messages = {
+            key: encode_joint_states(sink.encoding, timestamps, values[:length]) for key, values in columns.items()
+        }
+
+    missing_frames = dict.fromkeys(videos, 0)
+    for frame_idx, ts in enumerate(timestamps):
+        for key in columns:
+            sink.add(channels[key], ts, messages[key][frame_idx])
+        for key, frames in videos.items():
+            with metrics.timer("video_demux" if video == "passthrough" else "video_decode"):
+                frame = next(frames, None)
+            if frame is None:
+                missing_frames[key] += 1
+                continue
+            if video == "passthrough":
+                add_message_video_packet(sink, key, *frame, start_ts, fps)
+            else:
+                add_message_image_array(sink, key, frame, ts, image_encoder)
+    # Video ngắn hơn episode: các frame cuối của camera bị thiếu, báo ra thay vì bỏ qua im lặng
+    for key, missing in missing_frames.items():
+        if missing:
+            metrics.count("video_frames_missing", missing)
+            print(f"Warning: Eps {ep_idx} {key}: video has {length - missing} of {length} frames, "
+                  f"the last {missing} are missing")
+
+
+def episode_inputs(dataset, ep_idx):
+    """Files an episode MCAP is built from: the episode parquet and its camera videos."""
+    episode = EpisodeReader(dataset, ep_idx)
+    paths = [episode.data_file()]
+    if episode.video_path:
+        paths += [episode.video_file(key) for key in episode.video_keys]
+    return paths
+
+
+# Dataset handle riêng của mỗi worker process
+_worker_dataset = None
+
+
+def init_worker(dataset_path):
+    global _worker_dataset
+    _worker_dataset = load_lerobot_aloha(dataset_path)
+
+
+def build_episode_worker(task):
+    return build_episode(_worker_dataset, *task)
+
+
+def add_message_data(block, key, data, ts, schema_name):
+    # Serialized with the other joint states of the block (JointStateBlock.flush)
+    data_channel_id = block.sink.channel_id(f"/data/{key}", schema_name)
 
     # Nếu data là GPU tensor, đưa về CPU
     if data.is_cuda:
         data = data.cpu()
 
-    message_data = json.dumps({
-        "timestamp": {
-            "sec": ts // 1000,
-            "nsec": (ts % 1000) * 1_000_000.
-        },
-        "joint_state": data.numpy().tolist(),
-    }).encode("utf-8")
-
-    writer.add_message(
-        channel_id=data_channel_id,
-        log_time=ts * 1_000_000,
-        publish_time=ts * 1_000_000,
-        data=message_data
-    )
-
-
-def add_message_image(writer, key, data, ts, schema):
-    data_channel_id = writer.register_channel(
-        topic=f"/data/{key}",
-        message_encoding="json",
-        schema_id=schema
-    )
+    block.add_joint_state(data_channel_id, ts, data.numpy())
 
+
+def add_message_image(block, key, data, ts, image_encoder):
     # Nếu data là GPU tensor, đưa về CPU
     if data.is_cuda:
         data = data.cpu()
 
-    # Nén sang JPEG, encode base64
-    b64_jpg = compress_tensor_to_jpeg(data)
+    # torch.Tensor [3,H,W] float -> numpy [H,W,3] uint8, một lần copy, vào buffer dùng lại của encoder
+    with block.sink.metrics.timer("image_convert"):
+        np_img = to_uint8_hwc(data, pool=image_encoder.pool())
+    add_message_image_array(block.sink, key, np_img, ts, image_encoder, block)
+
+
+def add_message_image_array(sink, key, np_img, ts, image_encoder, block=None):
+    # np_img: uint8 [H,W,3] RGB, nén thẳng không qua float (base64 chỉ khi encoding json)
+    # block: add through the JointStateBlock of the frame loop, to keep the message order
+    data_channel_id = sink.channel_id(f"/data/{key}", "foxglove.CompressedImage")
+    with sink.metrics.timer("image_encode"):
+        image_data = image_encoder.encode(np_img)
+    with sink.metrics.timer("serialize"):
+        message_data = encode_compressed_image(sink.encoding, ts, key, image_data, image_encoder.format)
+    sink.metrics.count("image_bytes", len(image_data))
+    # Thumbnail of the same decoded frame for the preview file
+    preview_data = None
+    if sink.preview is not None:
+        preview_data = sink.preview.frame_message(f"/data/{key}", ts, key, np_img)
+    (block or sink).add(data_channel_id, ts, message_data, preview_data)
 
-    message_data = json.dumps({
-        "timestamp": {
-            "sec": ts // 1000,
-            "nsec": (ts % 1000) * 1_000_000.
-        },
-        "frame_id": key,
-        "data": b64_jpg,
-        "format": "png"  # Hoặc "jpeg" tuỳ bạn
-    }).encode("utf-8")
 
-    writer.add_message(
-        channel_id=data_channel_id,
-        log_time=ts * 1_000_000,
-        publish_time=ts * 1_000_000,
-        data=message_data
-    )
+def add_message_video_packet(sink, key, frame_index, data, video_format, start_ts, fps):
+    data_channel_id = sink.channel_id(f"/data/{key}", "foxglove.CompressedVideo")
+    ts = frame_timestamp(start_ts, frame_index, fps)
+    with sink.metrics.timer("serialize"):
+        message_data = encode_compressed_video(sink.encoding, ts, key, data, video_format)
+    sink.add(data_channel_id, ts, message_data)
 
 
 def load_lerobot_aloha(path):
+    # lerobot pulls in torch: imported only when a dataset is actually opened
+    from lerobot.common.datasets.lerobot_dataset import LeRobotDataset
     dataset = LeRobotDataset(repo_id="aloha", root=path, local_files_only=True)
     return dataset
 
@@ -1,10 +1,14 @@
-import json
+from common.encoding import load_json_schema
 
-with open("schema/14dof.json", "r") as f:
-    aloha_14dof_data = json.load(f)
-with open("schema/2dof.json", "r") as f:
-    aloha_2dof_data = json.load(f)
+# module attribute -> schema/<file>, loaded on first access (package resources, any cwd)
+SCHEMA_DATA = {
+    "aloha_14dof_data": "14dof.json",
+    "aloha_2dof_data": "2dof.json",
+    "compressed_image_schema_data": "compressed_image.json",
+}
 
-with open("schema/compressed_image.json", "r") as f:
-    compressed_image_schema_data = json.load(f)
 
+def __getattr__(name):
+    if name in SCHEMA_DATA:
+        return load_json_schema(SCHEMA_DATA[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+
+class EpisodeReader:
+    """
+    Columnar reader of one LeRobotDataset episode, bypassing `dataset[index]`.
+    - read_columns: numeric columns as contiguous (T, D) numpy arrays, one parquet read.
+    - iter_video: decode a camera video once, sequentially, as uint8 [H,W,3] RGB frames.
+    """
+
+    def __init__(self, dataset, ep_idx):
+        info = dataset.meta.info
+        self.root = Path(dataset.root)
+        self.ep_idx = ep_idx
+        self.ep_chunk = ep_idx // info["chunks_size"]
+        self.data_path = info["data_path"]
+        self.video_path = info.get("video_path")
+        self.video_keys = [key for key, ft in info["features"].items() if ft["dtype"] == "video"]
+
+    def data_file(self):
+        return self.root / self.data_path.format(episode_chunk=self.ep_chunk, episode_index=self.ep_idx)
+
+    def video_file(self, key):
+        return self.root / self.video_path.format(
+            episode_chunk=self.ep_chunk, video_key=key, episode_index=self.ep_idx
+        )
+
+    def read_columns(self, keys):
+        """Return {key: (T, D) float array} for the given keys present in the episode parquet."""
+        import pyarrow.parquet as pq
+
+        schema_names = pq.read_schema(self.data_file()).names
+        keys = [key for key in keys if key in schema_names]
+        table = pq.read_table(self.data_file(), columns=keys)
+        columns = {}
+        for key in keys:
+            column = table[key].combine_chunks()
+            # list<float> / fixed_size_list<float> -> (T, D) sans per-row python objects
+            values = column.flatten().to_numpy() if hasattr(column, "flatten") else column.to_numpy()
+            columns[key] = values.reshape(len(column), -1)
+        return columns
+
+    def iter_video(self, key):
+        """Yield every frame of camera `key` in order, as uint8 [H,W,3] RGB."""
+        import av
+
+        with av.open(str(self.video_file(key))) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            for frame in container.decode(stream):
+                yield frame.to_ndarray(format="rgb24")
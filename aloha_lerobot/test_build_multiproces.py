@@ -1,22 +1,16 @@
 import os
-import json
 import tyro
-import base64
 import time
 from datetime import datetime
-from io import BytesIO
-import numpy as np
 from pathlib import Path
-from PIL import Image
+from typing import Literal
 from multiprocessing import Pool, cpu_count
+from threading import Semaphore
 
-from lerobot.common.datasets.lerobot_dataset import LeRobotDataset
-from mcap.writer import Writer
-from aloha_lerobot.config import (
-    aloha_14dof_data,
-    aloha_2dof_data,
-    compressed_image_schema_data,
-)
+from common.encoding import Encoding, encode_compressed_image, encode_joint_state
+from common.image import ImageBackend, ImageEncoder, ImageFormat, to_uint8_hwc
+from common.sink import McapSink, frame_timestamp
+from aloha_lerobot.reader import EpisodeReader
 
 list_key_2 = ["base_action"]
 list_key_14 = ["observation.state", "action", "observation.velocity", "observation.effort"]
@@ -28,15 +22,31 @@ list_key_image = [
 ]
 
 
-def mcap_builder(dataset_path: Path, output_path: Path):
+def mcap_builder(
+        dataset_path: Path,
+        output_path: Path,
+        encoding: Encoding = "json",
+        max_inflight: int = 0,
+        reader: Literal["dataset", "columnar"] = "dataset",
+        image_format: ImageFormat = "jpeg",
+        image_quality: int = 75,
+        image_backend: ImageBackend = "auto",
+):
     """
     Chuyển dữ liệu từ LeRobotDataset sang định dạng MCAP,
     mỗi episode một file .mcap.
 
-    - Sử dụng multiprocessing để nén ảnh song song.
+    - Pipeline streaming: producer đọc từng frame, pool.imap (có thứ tự) nén ảnh
+      và serialize message, writer ghi ngay khi có kết quả.
+    - Số frame đang xử lý bị giới hạn bởi max_inflight (mặc định 4 x số process),
+      nên bộ nhớ không tăng theo độ dài episode, ghi đĩa chạy song song với nén ảnh.
     - Tránh gọi .numpy() nhiều lần trên GPU.
-    - Vẫn base64 cho ảnh, vẫn ghi tuần tự (mỗi tập tin MCAP cho 1 episode).
+    - Worker trả về ảnh đã nén (image_format, image_quality, image_backend như
+      aloha_lerobot/build.py), base64 chỉ khi encoding json.
     - Tính và in ra thời gian xử lý của mỗi episode.
+    - encoding: json, protobuf hoặc cdr cho tất cả các kênh.
+    - reader: "dataset" đọc dataset[index] từng frame, "columnar" đọc parquet
+      của episode một lần và decode tuần tự mỗi video camera.
     """
 
     if not os.path.exists(output_path):
@@ -52,175 +62,158 @@ def mcap_builder(dataset_path: Path, output_path: Path):
         return "Empty Dataset"
 
     start_idx = 0
+    image_encoder = ImageEncoder(image_format, image_quality, image_backend)
 
     # Thiết lập multiprocessing để nén ảnh
     num_processes = max(1, cpu_count() - 1)
-    pool = Pool(processes=num_processes)
+    max_inflight = max_inflight or 4 * num_processes
 
-    for episode in dataset.meta.episodes:
-        # Bắt đầu tính thời gian cho episode này
-        episode_start_time = time.time()
+    # Lỗi ở episode nào thì `with` terminate pool, không để lại process con
+    with Pool(processes=num_processes) as pool:
+        for episode in dataset.meta.episodes:
+            # Bắt đầu tính thời gian cho episode này
+            episode_start_time = time.time()
 
-        length = episode["length"]
-        fps = dataset.meta.fps
+            length = episode["length"]
+            fps = dataset.meta.fps
 
-        mcap_file = os.path.join(
-            output_path,
-            f"episode_{episode['episode_index']}.mcap",
-        )
-        ts = int(datetime.now().timestamp() * 1000)  # ms
-
-        # Gom toàn bộ frame data cho episode này
-        episode_data = [dataset[i] for i in range(start_idx, start_idx + length)]
-
-        # Tách joint_entries và image_entries
-        joint_entries = []
-        image_entries = []
-
-        for frame_data in episode_data:
-            for key, value in frame_data.items():
-                if key in list_key_2 or key in list_key_14:
-                    joint_entries.append((key, value))
-                elif key in list_key_image:
-                    image_entries.append((key, value))
-
-        # Nén ảnh song song
-        # map() trả về list kết quả tương ứng thứ tự
-        compressed_results = pool.map(compress_image_worker, image_entries)
-
-        # Ghi MCAP (tuần tự)
-        with open(mcap_file, "wb") as f:
-            writer = Writer(f)
-            writer.start()
-
-            aloha_14dof_schema_id = writer.register_schema(
-                name="aloha_14dof",
-                encoding="jsonschema",
-                data=json.dumps(aloha_14dof_data).encode("utf-8")
-            )
-            aloha_2dof_schema_id = writer.register_schema(
-                name="aloha_2dof",
-                encoding="jsonschema",
-                data=json.dumps(aloha_2dof_data).encode("utf-8")
+            mcap_file = os.path.join(
+                output_path,
+                f"episode_{episode['episode_index']}.mcap",
             )
-            image_schema_id = writer.register_schema(
-                name="foxglove.CompressedImage",
-                encoding="jsonschema",
-                data=json.dumps(compressed_image_schema_data).encode("utf-8")
+            start_ts = int(datetime.now().timestamp() * 1000)  # ms
+
+            # Producer bị chặn khi đã có max_inflight frame chưa được ghi
+            slots = InflightSlots(max_inflight)
+            if reader == "columnar":
+                frames = iter_frames_columnar(dataset, episode["episode_index"], length, start_ts, fps, encoding, image_encoder, slots)
+            else:
+                frames = iter_frames(dataset, start_idx, length, start_ts, fps, encoding, image_encoder, slots)
+
+            # Ghi MCAP (tuần tự) ngay khi từng frame được nén xong
+            try:
+                with McapSink(mcap_file, encoding) as sink:
+                    for ts, messages in pool.imap(encode_frame_worker, frames):
+                        for key, schema_name, message_data in messages:
+                            sink.add(sink.channel_id(f"/data/{key}", schema_name), ts, message_data)
+                        slots.release()
+            except BaseException:
+                # Producer chạy trong thread task handler của pool, terminate() join thread đó:
+                # mở khóa để nó dừng thay vì chờ slots mãi
+                slots.cancel()
+                raise
+
+            # Tính thời gian đã xử lý xong 1 episode
+            episode_end_time = time.time()
+            episode_duration = episode_end_time - episode_start_time
+            print(
+                f"Finish Eps {episode['episode_index']} in {episode_duration:.2f} seconds"
             )
 
-            compressed_iter = iter(compressed_results)
-
-            # Duyệt lại từng frame để ghi
-            for frame_data in episode_data:
-                for key, value in frame_data.items():
-                    if key in list_key_2:
-                        add_message_data(
-                            writer, key, value, ts, aloha_2dof_schema_id
-                        )
-                    elif key in list_key_14:
-                        add_message_data(
-                            writer, key, value, ts, aloha_14dof_schema_id
-                        )
-                    elif key in list_key_image:
-                        # Lấy kết quả ảnh nén
-                        img_key, base64_jpg = next(compressed_iter)
-                        add_message_image(
-                            writer, img_key, base64_jpg, ts, image_schema_id
-                        )
-
-                # Tăng timestamp để phù hợp fps
-                ts += int(1000 / fps)
-
-            writer.finish()
-
-        # Tính thời gian đã xử lý xong 1 episode
-        episode_end_time = time.time()
-        episode_duration = episode_end_time - episode_start_time
-        print(
-            f"Finish Eps {episode['episode_index']} in {episode_duration:.2f} seconds"
-        )
+            start_idx += length
 
-        start_idx += length
-
-    # Đóng pool
-    pool.close()
-    pool.join()
+        # Đóng pool
+        pool.close()
+        pool.join()
 
     return "MCAP file successfully built and stored in output path."
 
 
+class InflightSlots:
+    """
+    Số frame đang xử lý giữa producer và writer, tối đa `size`.
+    cancel(): writer gặp lỗi, producer đang chờ được mở khóa và dừng.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.cancelled = False
+        self._semaphore = Semaphore(size)
+
+    def acquire(self):
+        """Chờ một slot; False nếu đã cancel (producer dừng)."""
+        self._semaphore.acquire()
+        return not self.cancelled
+
+    def release(self):
+        self._semaphore.release()
+
+    def cancel(self):
+        self.cancelled = True
+        self._semaphore.release(self.size)
+
+
+def iter_frames(dataset, start_idx, length, start_ts, fps, encoding, image_encoder, slots):
+    """
+    Producer: đọc lần lượt từng frame của episode, chỉ giữ lại các key cần ghi.
+    Chạy trong thread task handler của pool, `slots` giới hạn số frame đang xử lý
+    (imap tự nó đọc hết iterable mà không chờ).
+    """
+    for frame_idx, index in enumerate(range(start_idx, start_idx + length)):
+        if not slots.acquire():
+            return
+        frame_data = dataset[index]
+        entries = []
+        for key, value in frame_data.items():
+            if key in list_key_2 or key in list_key_14 or key in list_key_image:
+                if value.is_cuda:
+                    value = value.cpu()
+                entries.append((key, value.numpy()))
+        yield frame_timestamp(start_ts, frame_idx, fps), encoding, image_encoder, entries
+
+
+def iter_frames_columnar(dataset, ep_idx, length, start_ts, fps, encoding, image_encoder, slots):
+    """
+    Producer dùng EpisodeReader: cột số đọc 1 lần, video decode tuần tự,
+    ảnh là uint8 [H,W,3] thay vì float [3,H,W].
+    """
+    episode = EpisodeReader(dataset, ep_idx)
+    columns = episode.read_columns(list_key_2 + list_key_14)
+    videos = {key: episode.iter_video(key) for key in list_key_image if key in episode.video_keys}
+    for frame_idx in range(length):
+        if not slots.acquire():
+            return
+        entries = [(key, values[frame_idx]) for key, values in columns.items()]
+        for key, frames in videos.items():
+            frame = next(frames, None)
+            if frame is not None:
+                entries.append((key, frame))
+        yield frame_timestamp(start_ts, frame_idx, fps), encoding, image_encoder, entries
+
+
+def encode_frame_worker(args):
+    """
+    Worker: nén ảnh và serialize toàn bộ message của 1 frame.
+    Trả về (ts, [(key, schema_name, message_data), ...]).
+    """
+    ts, encoding, image_encoder, entries = args
+    messages = []
+    for key, value in entries:
+        if key in list_key_2:
+            messages.append((key, "aloha_2dof", encode_joint_state(encoding, ts, value)))
+        elif key in list_key_14:
+            messages.append((key, "aloha_14dof", encode_joint_state(encoding, ts, value)))
+        elif key in list_key_image:
+            _, image_data = compress_image_worker((key, value, image_encoder))
+            message_data = encode_compressed_image(encoding, ts, key, image_data, image_encoder.format)
+            messages.append((key, "foxglove.CompressedImage", message_data))
+    return ts, messages
+
+
 def compress_image_worker(args):
     """
     Worker nén ảnh:
-    - Nhận (key, tensor_img).
-    - Nếu đang ở GPU => chuyển CPU.
-    - Gọi .numpy() đúng 1 lần, nén PIL -> JPEG, trả về base64.
+    - Nhận (key, np_img, image_encoder): [3,H,W] float trong [0, 1],
+      hoặc [H,W,3] uint8 (reader columnar, nén thẳng không đổi float).
+    - Trả về ảnh đã nén (bytes).
     """
-    key, tensor_img = args
-    if tensor_img.is_cuda:
-        tensor_img = tensor_img.cpu()
-
-    np_img = tensor_img.numpy()  # [3,H,W]
-    np_img = np.transpose(np_img, (1, 2, 0))  # [H,W,3]
-
-    pil_img = Image.fromarray((np_img * 255).astype(np.uint8), mode="RGB")
-    buffer = BytesIO()
-    pil_img.save(buffer, format="JPEG")
-    jpg_bytes = buffer.getvalue()
-
-    b64_str = base64.b64encode(jpg_bytes).decode("utf-8")
-    return key, b64_str
-
-
-def add_message_data(writer, key, data, ts, schema_id):
-    if data.is_cuda:
-        data = data.cpu()
-    joint_list = data.numpy().tolist()
-
-    data_channel_id = writer.register_channel(
-        topic=f"/data/{key}", message_encoding="json", schema_id=schema_id
-    )
-
-    message_data = json.dumps({
-        "timestamp": {
-            "sec": ts // 1000,
-            "nsec": (ts % 1000) * 1_000_000
-        },
-        "joint_state": joint_list,
-    }).encode("utf-8")
-
-    writer.add_message(
-        channel_id=data_channel_id,
-        log_time=ts * 1_000_000,
-        publish_time=ts * 1_000_000,
-        data=message_data
-    )
-
-
-def add_message_image(writer, key, base64_jpg, ts, schema_id):
-    data_channel_id = writer.register_channel(
-        topic=f"/data/{key}", message_encoding="json", schema_id=schema_id
-    )
-    message_data = json.dumps({
-        "timestamp": {
-            "sec": ts // 1000,
-            "nsec": (ts % 1000) * 1_000_000
-        },
-        "frame_id": key,
-        "data": base64_jpg,
-        "format": "jpeg"
-    }).encode("utf-8")
-
-    writer.add_message(
-        channel_id=data_channel_id,
-        log_time=ts * 1_000_000,
-        publish_time=ts * 1_000_000,
-        data=message_data
-    )
+    key, np_img, image_encoder = args
+    return key, bytes(image_encoder.encode(to_uint8_hwc(np_img)))
 
 
 def load_lerobot_aloha(path):
+    # lerobot pulls in torch: imported only when a dataset is actually opened
+    from lerobot.common.datasets.lerobot_dataset import LeRobotDataset
     dataset = LeRobotDataset(repo_id="aloha", root=path, local_files_only=True)
     return dataset
 
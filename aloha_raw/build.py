@@ -1,3 +1,205 @@
+import glob
+import os
+import re
+import time
+import tyro
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Optional, Tuple
+
+from aloha_raw.config import FPS, IMAGE_GROUP, IMAGE_TOPIC_PREFIX, JOINT_DATASETS, MAX_SLICE_BYTES
+from aloha_raw.reader import encoded_image, is_compressed_image, iter_rows
+from common.catalog import Catalog
+from common.encoding import Encoding, encode_compressed_image
+from common.image import ImageBackend, ImageEncoder, ImageFormat
+from common.manifest import MANIFEST_FILE, Manifest, fingerprint
+from common.metrics import Metrics, make_metrics, write_json_line, write_prometheus
+from common.sink import JointStateBlock, McapSink, frame_timestamp
+
+
+def mcap_builder(
+        dataset_path: Path,
+        output_path: Path,
+        episode_idx: int = -1,
+        episodes: Tuple[int, ...] = (),
+        encoding: Encoding = "json",
+        workers: int = 1,
+        fps: int = FPS,
+        max_slice_bytes: int = MAX_SLICE_BYTES,
+        image_format: ImageFormat = "jpeg",
+        image_quality: int = 75,
+        image_backend: ImageBackend = "auto",
+        async_writes: bool = False,
+        force: bool = False,
+        metrics_path: Optional[Path] = None,
+        prometheus_path: Optional[Path] = None,
+):
+    """
+    Transform raw ALOHA episodes (dataset_path/episode_*.hdf5) to MCAP, one episode per file,
+    without going through LeRobot.
+    - If episode_idx = -1 (by default), build all episode.
+    - If episode_idx >= 0 and exist, build only this episode.
+    - episodes: build only these episodes (shards of tools/batch.py), overrides episode_idx.
+    - encoding: message encoding of all channels (json, protobuf or cdr).
+    - workers > 1: build episodes in parallel, one process per worker.
+    - fps: frame rate of the episodes (the HDF5 files have no timestamps).
+    - max_slice_bytes: qpos / qvel / effort / action and every camera are streamed in
+      HDF5-chunk-aligned slices of at most this size, memory does not grow with the episode.
+    - Compressed camera datasets (JPEG/PNG rows) are written as-is, without decoding;
+      image_format / image_quality / image_backend only apply to raw [T,H,W,3] cameras.
+    - async_writes = True: MCAP chunk compression and file writes run in a background thread
+      (common/sink.py AsyncWriter), overlapping HDF5 reads and encoding; the file is the same.
+    - Episodes are recorded in `manifest.json` of output_path; a rerun skips the episodes
+      that are up to date, unless force = True.
+    - Episode channels are recorded in `catalog.sqlite` of output_path (common/catalog.py).
+    - metrics_path / prometheus_path: per-episode stage timers as JSON lines / run totals
+      as a Prometheus textfile (disabled if not set).
+    """
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    else:
+        assert not os.listdir(output_path) or os.path.exists(os.path.join(output_path, MANIFEST_FILE)), (
+            "Error: Output path is not empty. Please provide an empty directory."
+        )
+    manifest = Manifest(output_path)
+    manifest.create()
+    image_encoder = ImageEncoder(image_format, image_quality, image_backend)
+    options = {"encoding": encoding, "fps": fps, "image_format": image_format, "image_quality": image_quality}
+    metrics_enabled = bool(metrics_path or prometheus_path)
+    total_metrics = Metrics()
+
+    episode_files = list_episodes(dataset_path)
+    if not episode_files:
+        return "Empty Dataset"
+
+    tasks = []
+    input_fingerprints = {}
+    for ep_idx, hdf5_file in episode_files:
+        if episodes:
+            if ep_idx not in episodes:
+                continue
+        elif episode_idx != -1 and ep_idx != episode_idx:
+            continue
+        mcap_name = f"episode_{ep_idx}.mcap"
+        input_fingerprints[ep_idx] = fingerprint([hdf5_file], root=dataset_path)
+        if not force and manifest.is_up_to_date(mcap_name, input_fingerprints[ep_idx], options):
+            print(f"Skip Eps {ep_idx}: up to date")
+            continue
+        mcap_file = os.path.join(output_path, mcap_name)
+        tasks.append((
+            ep_idx, hdf5_file, mcap_file, encoding, fps, max_slice_bytes, image_encoder, metrics_enabled, async_writes,
+        ))
+
+    def finish_episode(ep_idx, episode_duration, metrics):
+        manifest.record(f"episode_{ep_idx}.mcap", input_fingerprints[ep_idx], options)
+        catalog.record(os.path.join(output_path, f"episode_{ep_idx}.mcap"), source=ep_idx, builder="aloha_raw")
+        if metrics is not None:
+            total_metrics.merge(metrics)
+            if metrics_path:
+                labels = {"builder": "aloha_raw", "episode": ep_idx, "output": os.path.join(output_path, f"episode_{ep_idx}.mcap")}
+                write_json_line(metrics_path, labels, metrics, seconds=episode_duration)
+        print(f"Finish Eps {ep_idx} in {episode_duration:.2f} seconds")
+
+    catalog = Catalog(output_path)
+    build_start_time = time.time()
+    if workers > 1 and len(tasks) > 1:
+        with get_context("spawn").Pool(processes=min(workers, len(tasks))) as pool:
+            for result in pool.imap(build_episode_worker, tasks):
+                if result is not None:
+                    finish_episode(*result)
+    else:
+        for task in tasks:
+            result = build_episode(*task)
+            if result is not None:
+                finish_episode(*result)
+    catalog.close()
+    print(f"Finish {len(tasks)} episodes in {time.time() - build_start_time:.2f} seconds")
+    if prometheus_path:
+        write_prometheus(prometheus_path, {"builder": "aloha_raw"}, total_metrics.snapshot())
+
+    return "MCAP file successfully built and stored in output path."
+
+
+def list_episodes(dataset_path):
+    """[(episode index, path)] of dataset_path/episode_<n>.hdf5, sorted by index."""
+    episodes = []
+    for hdf5_file in glob.glob(os.path.join(dataset_path, "episode_*.hdf5")):
+        match = re.fullmatch(r"episode_(\d+)\.hdf5", os.path.basename(hdf5_file))
+        if match:
+            episodes.append((int(match.group(1)), hdf5_file))
+    return sorted(episodes)
+
+
+def build_episode(
+        ep_idx, hdf5_file, mcap_file, encoding: Encoding = "json", fps=FPS,
+        max_slice_bytes=MAX_SLICE_BYTES, image_encoder=None, metrics_enabled=False, async_writes=False,
+):
+    """
+    Build one HDF5 episode into `mcap_file`, return (ep_idx, duration in seconds, metrics
+    snapshot or None when metrics are disabled), or None if the file has no dataset to convert.
+    """
+    import h5py
+
+    episode_start_time = time.time()
+    image_encoder = image_encoder or ImageEncoder()
+    metrics = make_metrics(metrics_enabled)
+    start_ts = int(datetime.now().timestamp() * 1000)  # ms
+
+    with h5py.File(hdf5_file, "r") as f:
+        length = episode_length(f)
+        if length is None:
+            # Layout khác (hoặc file rỗng): bỏ qua file này, không dừng cả pool
+            print(f"Skip Eps {ep_idx}: {hdf5_file} has none of {', '.join(JOINT_DATASETS)} and no {IMAGE_GROUP}")
+            return None
+        with McapSink(mcap_file, encoding, metrics=metrics, async_writes=async_writes) as sink:
+            joints = [
+                (sink.channel_id(f"/data/{key}", schema_name), iter_rows(f[name], max_slice_bytes, metrics))
+                for name, (key, schema_name) in JOINT_DATASETS.items() if name in f
+            ]
+            cameras = []
+            for camera, dataset in (f[IMAGE_GROUP].items() if IMAGE_GROUP in f else []):
+                key = f"{IMAGE_TOPIC_PREFIX}{camera}"
+                cameras.append((
+                    key, sink.channel_id(f"/data/{key}", "foxglove.CompressedImage"),
+                    is_compressed_image(dataset), iter_rows(dataset, max_slice_bytes, metrics),
+                ))
+            metrics.count("frames", length)
+
+            # Joint states serialized a block of frames at a time, written in frame order
+            block = JointStateBlock(sink)
+            for frame_idx in range(length):
+                ts = frame_timestamp(start_ts, frame_idx, fps)
+                for channel_id, rows in joints:
+                    block.add_joint_state(channel_id, ts, next(rows))
+                for key, channel_id, compressed, rows in cameras:
+                    row = next(rows)
+                    if compressed:
+                        # JPEG/PNG đã nén sẵn: ghi nguyên bytes, không decode
+                        image_data, image_format = encoded_image(row)
+                    else:
+                        with metrics.timer("image_encode"):
+                            image_data = image_encoder.encode(row)
+                        image_format = image_encoder.format
+                    with metrics.timer("serialize"):
+                        message_data = encode_compressed_image(encoding, ts, key, image_data, image_format)
+                    block.add(channel_id, ts, message_data)
+                block.end_frame()
+            block.flush()
+
+    return ep_idx, time.time() - episode_start_time, metrics.snapshot() if metrics_enabled else None
+
+
+def episode_length(f):
+    """Frames of an open episode file (its shortest joint / camera dataset), None if it has none."""
+    lengths = [f[name].shape[0] for name in JOINT_DATASETS if name in f]
+    lengths += [dataset.shape[0] for dataset in (f[IMAGE_GROUP].values() if IMAGE_GROUP in f else [])]
+    return min(lengths, default=None)
+
+
+def build_episode_worker(task):
+    return build_episode(*task)
+
 
 if __name__ == '__main__':
-    print("not ready")
+    tyro.cli(mcap_builder)
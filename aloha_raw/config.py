@@ -0,0 +1,23 @@
+"""
+Layout of a raw ALOHA episode (ACT / ALOHA recorder `episode_*.hdf5`) and its MCAP topics.
+Topics use the LeRobot feature names, so the same Foxglove layout opens both builders' files.
+"""
+
+FPS = 50  # ALOHA control frequency (DT = 0.02 s), the HDF5 files carry no timestamps
+
+# HDF5 dataset -> (topic key, schema name); missing datasets (effort, base_action) are skipped
+JOINT_DATASETS = {
+    "/observations/qpos": ("observation.state", "aloha_14dof"),
+    "/observations/qvel": ("observation.velocity", "aloha_14dof"),
+    "/observations/effort": ("observation.effort", "aloha_14dof"),
+    "/action": ("action", "aloha_14dof"),
+    "/base_action": ("base_action", "aloha_2dof"),
+}
+
+# /observations/images/<camera>: [T,H,W,3] uint8 RGB, or [T,L] uint8 JPEG zero-padded to L
+# (root attribute compress = True)
+IMAGE_GROUP = "/observations/images"
+IMAGE_TOPIC_PREFIX = "observation.images."
+
+# Upper bound of one read per dataset: whole HDF5 chunks along time, up to this many bytes
+MAX_SLICE_BYTES = 16 * 1024 * 1024
@@ -0,0 +1,52 @@
+import numpy as np
+
+from common.metrics import NULL_METRICS
+
+JPEG_MAGIC = b"\xff\xd8"
+PNG_MAGIC = b"\x89PNG"
+
+
+def slice_rows(dataset, max_slice_bytes):
+    """Rows per read of `dataset`: a whole number of HDF5 chunks along axis 0, within max_slice_bytes."""
+    row_bytes = dataset.dtype.itemsize * int(np.prod(dataset.shape[1:], dtype=np.int64))
+    chunk_rows = dataset.chunks[0] if dataset.chunks else 1
+    rows = max(1, max_slice_bytes // max(row_bytes, 1)) // chunk_rows * chunk_rows
+    return max(rows, chunk_rows)
+
+
+def iter_rows(dataset, max_slice_bytes, metrics=NULL_METRICS):
+    """
+    Yield the rows of an HDF5 dataset (axis 0 = time) in order, reading chunk-aligned slices
+    into one preallocated buffer: memory is bounded by the slice size, not by the episode.
+    A yielded row is a view, valid until the next slice is read.
+    """
+    n = dataset.shape[0]
+    if n == 0:
+        return
+    rows = min(slice_rows(dataset, max_slice_bytes), n)
+    buffer = np.empty((rows,) + dataset.shape[1:], dtype=dataset.dtype)
+    for start in range(0, n, rows):
+        count = min(rows, n - start)
+        with metrics.timer("hdf5_read"):
+            dataset.read_direct(buffer, source_sel=np.s_[start:start + count], dest_sel=np.s_[0:count])
+        yield from buffer[:count]
+
+
+def is_compressed_image(dataset):
+    """[T,L] uint8 rows of encoded bytes, vs [T,H,W,C] raw pixels."""
+    return dataset.ndim == 2 and dataset.dtype == np.uint8
+
+
+def encoded_image(row):
+    """
+    (bytes view, format) of one zero-padded encoded image row. JPEG ends with FFD9 and
+    PNG with the IEND CRC, so trimming the trailing zeros gives back the exact stream.
+    """
+    nonzero = np.flatnonzero(row)
+    data = row[:nonzero[-1] + 1] if len(nonzero) else row[:0]
+    head = data[:4].tobytes()
+    if head.startswith(PNG_MAGIC):
+        return data, "png"
+    if not head.startswith(JPEG_MAGIC):
+        raise ValueError("Compressed image row is neither JPEG nor PNG")
+    return data, "jpeg"
@@ -0,0 +1,196 @@
+"""
+Synthetic, deterministic fixtures for the benchmarks (no download needed).
+
+- make_lerobot_dataset: LeRobot v2.0 layout (meta/, data/chunk-000/*.parquet,
+  videos/chunk-000/<camera>/*.mp4) with the 4 aloha cameras and the 14/2 dof columns.
+- make_rh20t_scene: RH20T scene layout (cam_*/color.mp4, depth.mp4, timestamps.npy,
+  transformed/tcp_base.npy, joint.npy, gripper.npy and the 1 kHz force_torque.npy,
+  high_freq_data.npy), depth packed as low/high bytes stacked vertically.
+- make_aloha_raw_dataset: raw ALOHA episode_*.hdf5 (ACT recorder layout), cameras stored
+  as zero-padded JPEG rows (compress = True) or as raw [T,H,W,3] frames.
+"""
+import json
+import os
+
+import av
+import cv2
+import h5py
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+LEROBOT_CAMERAS = [
+    "observation.images.cam_high",
+    "observation.images.cam_left_wrist",
+    "observation.images.cam_right_wrist",
+    "observation.images.cam_low",
+]
+LEROBOT_14DOF = ["observation.state", "action", "observation.velocity", "observation.effort"]
+RH20T_CAMERAS = ["cam_f0461559", "cam_036422060909"]
+RH20T_START_TS = 1631270647658  # ms
+
+
+def synthetic_frame(index, height, width):
+    """Moving gradient with a bright square: compresses like a camera frame, not like noise."""
+    y, x = np.ogrid[0:height, 0:width]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[..., 0] = (x * 255 // width + 3 * index) % 256
+    frame[..., 1] = (y * 255 // height) % 256
+    frame[..., 2] = (x + y + 5 * index) % 256
+    size = max(height // 4, 1)
+    top, left = (2 * index) % (height - size), (3 * index) % (width - size)
+    frame[top:top + size, left:left + size] = 255
+    return frame
+
+
+def write_video(path, frames, fps, codec="libx264"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with av.open(str(path), "w") as container:
+        stream = None
+        for frame in frames:
+            if stream is None:
+                stream = container.add_stream(codec, rate=fps)
+                stream.height, stream.width = frame.shape[:2]
+                stream.pix_fmt = "yuv420p"
+                # No B-frames: packets are in presentation order, as Foxglove expects
+                stream.options = {"bf": "0"}
+            for packet in stream.encode(av.VideoFrame.from_ndarray(frame, format="rgb24")):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+
+def make_lerobot_dataset(root, episodes=2, length=100, fps=50, size=(640, 480), seed=0):
+    """Write a LeRobot v2.0 dataset with `episodes` episodes of `length` frames at `fps`."""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    features = {key: {"dtype": "float32", "shape": [14], "names": None} for key in LEROBOT_14DOF}
+    features["base_action"] = {"dtype": "float32", "shape": [2], "names": None}
+    for camera in LEROBOT_CAMERAS:
+        features[camera] = {
+            "dtype": "video", "shape": [height, width, 3], "names": ["height", "width", "channel"],
+            "info": {"video.fps": fps, "video.codec": "h264", "video.pix_fmt": "yuv420p"},
+        }
+    features["timestamp"] = {"dtype": "float32", "shape": [1], "names": None}
+    for key in ["frame_index", "episode_index", "index", "task_index"]:
+        features[key] = {"dtype": "int64", "shape": [1], "names": None}
+    info = {
+        "codebase_version": "v2.0", "robot_type": "aloha", "fps": fps,
+        "total_episodes": episodes, "total_frames": episodes * length, "total_tasks": 1,
+        "total_videos": episodes * len(LEROBOT_CAMERAS), "total_chunks": 1, "chunks_size": 1000,
+        "splits": {"train": f"0:{episodes}"},
+        "data_path": "data/chunk-{episode_chunk:03d}/episode_{episode_index:06d}.parquet",
+        "video_path": "videos/chunk-{episode_chunk:03d}/{video_key}/episode_{episode_index:06d}.mp4",
+        "features": features,
+    }
+    os.makedirs(os.path.join(root, "meta"), exist_ok=True)
+    with open(os.path.join(root, "meta", "info.json"), "w") as f:
+        json.dump(info, f, indent=4)
+    with open(os.path.join(root, "meta", "episodes.jsonl"), "w") as f:
+        for ep_idx in range(episodes):
+            f.write(json.dumps({"episode_index": ep_idx, "tasks": ["synthetic"], "length": length}) + "\n")
+    with open(os.path.join(root, "meta", "tasks.jsonl"), "w") as f:
+        f.write(json.dumps({"task_index": 0, "task": "synthetic"}) + "\n")
+
+    for ep_idx in range(episodes):
+        columns = {}
+        for key, dim in [(key, 14) for key in LEROBOT_14DOF] + [("base_action", 2)]:
+            values = rng.standard_normal((length, dim)).astype(np.float32)
+            columns[key] = pa.FixedSizeListArray.from_arrays(values.reshape(-1), dim)
+        columns["timestamp"] = pa.array(np.arange(length, dtype=np.float32) / fps)
+        columns["frame_index"] = pa.array(np.arange(length))
+        columns["episode_index"] = pa.array(np.full(length, ep_idx))
+        columns["index"] = pa.array(np.arange(length) + ep_idx * length)
+        columns["task_index"] = pa.array(np.zeros(length, dtype=np.int64))
+        data_file = os.path.join(root, info["data_path"].format(episode_chunk=0, episode_index=ep_idx))
+        os.makedirs(os.path.dirname(data_file), exist_ok=True)
+        pq.write_table(pa.table(columns), data_file)
+        for cam_idx, camera in enumerate(LEROBOT_CAMERAS):
+            video_file = os.path.join(root, info["video_path"].format(
+                episode_chunk=0, video_key=camera, episode_index=ep_idx
+            ))
+            frames = (synthetic_frame(i + 7 * cam_idx, height, width) for i in range(length))
+            write_video(video_file, frames, fps)
+    return root
+
+
+def make_rh20t_scene(root, frames=100, fps=10, tcp_hz=100, high_freq_hz=1000, size=(640, 360)):
+    """
+    Write a RH20T scene with 2 cameras (one L515 "cam_f*"), `frames` color/depth frames each,
+    TCP / joint / gripper samples at tcp_hz and force/torque samples at high_freq_hz.
+    """
+    width, height = size
+    os.makedirs(os.path.join(root, "transformed"), exist_ok=True)
+    rng = np.random.default_rng(0)
+    duration_ms = frames * 1000 // fps
+    tcp = {}
+    for camera in RH20T_CAMERAS:
+        serial = camera.replace("cam_", "")
+        tcp[serial] = [
+            {"timestamp": RH20T_START_TS + t, "tcp": rng.standard_normal(7)}
+            for t in range(0, duration_ms, 1000 // tcp_hz)
+        ]
+    np.save(os.path.join(root, "transformed", "tcp_base.npy"), tcp, allow_pickle=True)
+    serial = RH20T_CAMERAS[0].replace("cam_", "")
+    low_freq = range(0, duration_ms, 1000 // tcp_hz)
+    joint = {serial: {RH20T_START_TS + t: rng.standard_normal(7) for t in low_freq}}
+    np.save(os.path.join(root, "transformed", "joint.npy"), joint, allow_pickle=True)
+    gripper = {serial: {
+        RH20T_START_TS + t: {"gripper_info": rng.random(3), "gripper_command": rng.random(3)} for t in low_freq
+    }}
+    np.save(os.path.join(root, "transformed", "gripper.npy"), gripper, allow_pickle=True)
+    high_freq = [RH20T_START_TS + t * 1000 // high_freq_hz for t in range(duration_ms * high_freq_hz // 1000)]
+    force_torque = {serial: [
+        {"timestamp": t, "raw": rng.standard_normal(6), "zeroed": rng.standard_normal(6)} for t in high_freq
+    ]}
+    np.save(os.path.join(root, "transformed", "force_torque.npy"), force_torque, allow_pickle=True)
+    high_freq_data = {serial: [
+        {"timestamp": t, "joint": rng.standard_normal(7), "tcp": rng.standard_normal(7), "ft_raw": rng.standard_normal(6)}
+        for t in high_freq
+    ]}
+    np.save(os.path.join(root, "transformed", "high_freq_data.npy"), high_freq_data, allow_pickle=True)
+
+    y, x = np.ogrid[0:height, 0:width]
+    for cam_idx, camera in enumerate(RH20T_CAMERAS):
+        cam_dir = os.path.join(root, camera)
+        color = (synthetic_frame(i + 11 * cam_idx, height, width) for i in range(frames))
+        write_video(os.path.join(cam_dir, "color.mp4"), color, fps)
+
+        def depth_frames():
+            for i in range(frames):
+                depth = ((x * 7 + y * 3 + 20 * i) % 4096).astype(np.uint16) + 300
+                packed = np.concatenate([depth & 0xFF, depth >> 8]).astype(np.uint8)
+                yield np.repeat(packed[..., None], 3, axis=2)
+
+        write_video(os.path.join(cam_dir, "depth.mp4"), depth_frames(), fps)
+        ts = [RH20T_START_TS + i * 1000 // fps for i in range(frames)]
+        np.save(os.path.join(cam_dir, "timestamps.npy"), {"color": ts, "depth": [t + 5 for t in ts]}, allow_pickle=True)
+    return root
+
+
+def make_aloha_raw_dataset(root, episodes=2, length=100, size=(640, 480), compress=True, seed=0):
+    """Write `episodes` raw ALOHA episodes of `length` frames, one HDF5 chunk per frame and camera."""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    cameras = [camera.replace("observation.images.", "") for camera in LEROBOT_CAMERAS]
+    os.makedirs(root, exist_ok=True)
+    for ep_idx in range(episodes):
+        with h5py.File(os.path.join(root, f"episode_{ep_idx}.hdf5"), "w", rdcc_nbytes=1024 ** 2 * 2) as f:
+            f.attrs["sim"] = False
+            f.attrs["compress"] = compress
+            for name in ["/observations/qpos", "/observations/qvel", "/observations/effort", "/action"]:
+                f.create_dataset(name, data=rng.standard_normal((length, 14)))
+            f.create_dataset("/base_action", data=rng.standard_normal((length, 2)))
+            images = f.create_group("/observations/images")
+            for cam_idx, camera in enumerate(cameras):
+                frames = [synthetic_frame(i + 7 * cam_idx, height, width) for i in range(length)]
+                if not compress:
+                    images.create_dataset(camera, data=np.stack(frames), chunks=(1, height, width, 3))
+                    continue
+                # ACT recorder: cv2.imencode of the RGB frame, rows zero-padded to the longest one
+                encoded = [cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 50])[1].ravel() for frame in frames]
+                padded = np.zeros((length, max(len(data) for data in encoded)), dtype=np.uint8)
+                for i, data in enumerate(encoded):
+                    padded[i, :len(data)] = data
+                images.create_dataset(camera, data=padded, chunks=(1, padded.shape[1]))
+    return root
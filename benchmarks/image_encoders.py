@@ -0,0 +1,202 @@
+"""
+Compare the image encoder backends of common/image.py on this host.
+
+    python benchmarks/image_encoders.py --height 480 --width 640 --frames 200
+
+Frames are synthetic (smooth gradients + sensor-like noise), so numbers are comparable
+between hosts, not with a given dataset. Pick the fastest backend with --image-backend.
+Also reports the memory allocated per frame by the builder image paths (tracemalloc,
+which sees numpy and OpenCV buffers), with and without the BufferPool of common/image.py.
+"""
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Optional
+
+import numpy as np
+import tyro
+
+from common.image import BACKENDS, BufferPool, ImageEncoder, ImageFormat, available_backends, to_uint8_hwc
+
+
+def synthetic_frames(n, height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    frames = []
+    for i in range(n):
+        base = np.stack([x / width, y / height, (x + y + 4 * i) % width / width], axis=-1) * 200
+        noise = rng.normal(0, 6, size=base.shape)
+        frames.append(np.clip(base + noise, 0, 255).astype(np.uint8))
+    return frames
+
+
+def bench_backend(frames, image_format, quality, backend):
+    encoder = ImageEncoder(image_format, quality, backend)
+    encoder.encode(frames[0])  # warm up (backend resolution, library init)
+    total_bytes = 0
+    start = time.perf_counter()
+    for frame in frames:
+        total_bytes += len(encoder.encode(frame))
+    elapsed = time.perf_counter() - start
+    return {
+        "backend": backend,
+        "format": image_format,
+        "quality": quality,
+        "frames_per_s": len(frames) / elapsed,
+        "ms_per_frame": 1000 * elapsed / len(frames),
+        "bytes_per_frame": total_bytes / len(frames),
+    }
+
+
+def bench_float_conversion(frames):
+    """float [3,H,W] -> uint8 [H,W,3]: old transpose/astype chain vs to_uint8_hwc into a reused buffer."""
+    floats = [np.ascontiguousarray(frame.transpose(2, 0, 1), dtype=np.float32) / 255 for frame in frames]
+    start = time.perf_counter()
+    for image in floats:
+        # astype keeps the transposed (planar) layout, encoders then copy it to interleaved HWC
+        np.ascontiguousarray((np.transpose(image, (1, 2, 0)) * 255).astype(np.uint8))
+    old = time.perf_counter() - start
+    out = np.empty(frames[0].shape, dtype=np.uint8)
+    start = time.perf_counter()
+    for image in floats:
+        to_uint8_hwc(image, out=out)
+    new = time.perf_counter() - start
+    return {"astype_ms_per_frame": 1000 * old / len(frames), "to_uint8_hwc_ms_per_frame": 1000 * new / len(frames)}
+
+
+def allocated_per_frame(step, frames):
+    """
+    Mean bytes allocated by step(i) per call (peak above the memory in use before the call,
+    so freed temporaries count), and mean seconds, over `frames` calls.
+    """
+    tracemalloc.start()
+    try:
+        allocated = 0
+        start = time.perf_counter()
+        for i in range(frames):
+            in_use = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            step(i)
+            allocated += tracemalloc.get_traced_memory()[1] - in_use
+        elapsed = time.perf_counter() - start
+    finally:
+        tracemalloc.stop()
+    return allocated / frames, elapsed / frames
+
+
+def bench_frame_allocations(frames, image_format="jpeg", quality=75):
+    """
+    Per frame allocations of the image paths, each without / with buffer reuse:
+    - float_chw: LeRobot dataset[index] frame (float [3,H,W]) -> uint8 HWC -> encode.
+    - decode_bgr: RH20T color.mp4 frame decoded by cv2.VideoCapture -> encode (BGR).
+    - encode_rgb: RGB frame (video decode of the columnar reader, raw ALOHA rows) -> encode.
+    Encoding uses cv2 when installed, the backend whose RGB input needs a BGR copy.
+    """
+    backend = "cv2" if "cv2" in available_backends(image_format) else available_backends(image_format)[0]
+    encode = BACKENDS[backend][0]
+    floats = [np.ascontiguousarray(frame.transpose(2, 0, 1), dtype=np.float32) / 255 for frame in frames]
+    n = len(frames)
+    pooled_encoder = ImageEncoder(image_format, quality, backend)
+    pool = BufferPool()
+
+    import cv2
+    video_path = os.path.join(tempfile.mkdtemp(prefix="bench_alloc_"), "color.avi")
+    height, width = frames[0].shape[:2]
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (width, height))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+    def decode_loop(reuse):
+        cap, buffer = cv2.VideoCapture(video_path), [None]
+
+        def step(i):
+            if i % n == 0:
+                cap.open(video_path)
+            ok, buffer[0] = cap.read(buffer[0]) if reuse and buffer[0] is not None else cap.read()
+            encode(buffer[0], image_format, quality, True, pool if reuse else None)
+        return step
+
+    paths = {
+        "float_chw": (
+            lambda i: encode(to_uint8_hwc(floats[i % n]), image_format, quality, False),
+            lambda i: pooled_encoder.encode(to_uint8_hwc(floats[i % n], pool=pooled_encoder.pool())),
+        ),
+        "decode_bgr": (decode_loop(False), decode_loop(True)),
+        "encode_rgb": (
+            lambda i: encode(frames[i % n], image_format, quality, False),
+            lambda i: pooled_encoder.encode(frames[i % n]),
+        ),
+    }
+    results = {"backend": backend}
+    for name, (old_step, pooled_step) in paths.items():
+        # Warm up: backend resolution, pool buffers
+        old_step(0)
+        pooled_step(0)
+        allocations = pooled_encoder.pool().allocations + pool.allocations
+        old_bytes, old_seconds = allocated_per_frame(old_step, n)
+        pooled_bytes, pooled_seconds = allocated_per_frame(pooled_step, n)
+        results[name] = {
+            "kib_per_frame": old_bytes / 1024,
+            "pooled_kib_per_frame": pooled_bytes / 1024,
+            "ms_per_frame": 1000 * old_seconds,
+            "pooled_ms_per_frame": 1000 * pooled_seconds,
+            # Buffers the pool allocated after the warm up, per frame (0 once warm)
+            "pool_allocations_per_frame": (
+                pooled_encoder.pool().allocations + pool.allocations - allocations
+            ) / n,
+        }
+    os.remove(video_path)
+    os.rmdir(os.path.dirname(video_path))
+    return results
+
+
+def main(
+        height: int = 480,
+        width: int = 640,
+        frames: int = 100,
+        image_format: Optional[ImageFormat] = None,
+        quality: int = 75,
+        output_json: Optional[str] = None,
+):
+    """
+    Encode the same synthetic frames with every installed backend and format.
+    - image_format: only this format (default: jpeg, png and webp).
+    - output_json: also write the results to this file.
+    """
+    images = synthetic_frames(frames, height, width)
+    results = []
+    for fmt in [image_format] if image_format else ["jpeg", "png", "webp"]:
+        for backend in available_backends(fmt):
+            result = bench_backend(images, fmt, quality, backend)
+            results.append(result)
+            print(
+                f"{fmt:5s} {backend:10s} {result['ms_per_frame']:7.2f} ms/frame "
+                f"{result['frames_per_s']:8.1f} frames/s {result['bytes_per_frame'] / 1024:8.1f} KiB/frame"
+            )
+    conversion = bench_float_conversion(images)
+    print(
+        f"float CHW -> uint8 HWC: astype {conversion['astype_ms_per_frame']:.2f} ms/frame, "
+        f"to_uint8_hwc {conversion['to_uint8_hwc_ms_per_frame']:.2f} ms/frame"
+    )
+    allocations = bench_frame_allocations(images, image_format or "jpeg", quality)
+    for name, result in allocations.items():
+        if name == "backend":
+            continue
+        print(
+            f"{name:10s} allocated {result['kib_per_frame']:8.1f} KiB/frame -> pooled "
+            f"{result['pooled_kib_per_frame']:8.1f} KiB/frame ({result['ms_per_frame']:.2f} -> "
+            f"{result['pooled_ms_per_frame']:.2f} ms/frame, {allocations['backend']})"
+        )
+    if output_json:
+        with open(output_json, "w") as f:
+            json.dump({
+                "height": height, "width": width, "encoders": results, "conversion": conversion,
+                "allocations": allocations,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
@@ -0,0 +1,69 @@
+"""
+Compare per-message json serialization (a dict and json.dumps per message) with the
+whole-episode templates of common/encoding.py, on synthetic joint states and TCP poses.
+
+    python benchmarks/json_serialize.py --frames 5000 --dof 14
+
+Both paths produce the same bytes; the check is part of the run.
+"""
+import json
+import time
+from typing import Optional
+
+import numpy as np
+import tyro
+
+from common.encoding import encode_joint_state, encode_joint_states, encode_pose, encode_poses
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def bench(name, frames, per_message, whole):
+    old, old_time = timed(per_message)
+    new, new_time = timed(whole)
+    assert old == new, f"{name}: template output differs from the per-message encoder"
+    return {
+        "messages": name,
+        "per_message_us": 1e6 * old_time / frames,
+        "template_us": 1e6 * new_time / frames,
+        "speedup": old_time / new_time,
+    }
+
+
+def main(frames: int = 5000, dof: int = 14, output_json: Optional[str] = None):
+    """
+    Serialize `frames` joint states of `dof` float32 values and `frames` TCP poses both ways.
+    - output_json: also write the results to this file.
+    """
+    rng = np.random.default_rng(0)
+    timestamps = (1_700_000_000_000 + np.arange(frames) * 20).tolist()
+    values = rng.normal(size=(frames, dof)).astype(np.float32)
+    poses = list(rng.normal(size=(frames, 7)))
+    results = [
+        bench(
+            "joint_state", frames,
+            lambda: [encode_joint_state("json", ts, row) for ts, row in zip(timestamps, values)],
+            lambda: encode_joint_states("json", timestamps, values),
+        ),
+        bench(
+            "pose", frames,
+            lambda: [encode_pose("json", ts, pose) for ts, pose in zip(timestamps, poses)],
+            lambda: encode_poses("json", timestamps, poses),
+        ),
+    ]
+    for result in results:
+        print(
+            f"{result['messages']:12s} per message {result['per_message_us']:6.2f} us/msg, "
+            f"template {result['template_us']:6.2f} us/msg ({result['speedup']:.2f}x)"
+        )
+    if output_json:
+        with open(output_json, "w") as f:
+            json.dump({"frames": frames, "dof": dof, "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
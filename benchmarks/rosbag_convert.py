@@ -0,0 +1,99 @@
+"""
+MCAP -> ROS 2 bag conversion throughput against input file size (tools/rosbag.py).
+
+    $ export PYTHONPATH=/project/path
+    $ python benchmarks/rosbag_convert.py --rh20t-frames 50 200 800 --workers 1 4
+
+For every fixture size, the synthetic RH20T scene (benchmarks/fixtures.py) is built in each
+encoding, then converted with each worker count. Throughput should stay flat as files grow:
+the input is streamed chunk by chunk and memory is bounded by the chunks in flight.
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import tyro
+
+from benchmarks.fixtures import make_rh20t_scene
+from common.encoding import Encoding
+from tools.rosbag import mcap_to_rosbag
+
+
+def build_input(workdir, frames, encoding):
+    """RH20T fixture of `frames` frames built to MCAP in `encoding`, reused if already in workdir."""
+    mcap_file = workdir / f"rh20t_{frames}_{encoding}.mcap"
+    if not mcap_file.exists():
+        scene = workdir / f"rh20t_{frames}"
+        if not scene.exists():
+            print(f"Generating RH20T fixture in {scene}")
+            make_rh20t_scene(scene, frames=frames)
+        from rh20t.build import mcap_builder
+        mcap_builder(str(mcap_file), str(scene), encoding=encoding, image_format="jpeg")
+    return mcap_file
+
+
+def bench_convert(mcap_file, bag_path, workers):
+    shutil.rmtree(bag_path, ignore_errors=True)
+    start = time.perf_counter()
+    topics = mcap_to_rosbag(mcap_file, bag_path, workers=workers)
+    elapsed = time.perf_counter() - start
+    input_bytes = os.path.getsize(mcap_file)
+    output_bytes = sum(path.stat().st_size for path in Path(bag_path).iterdir())
+    messages = sum(count for _, count in topics.values())
+    shutil.rmtree(bag_path)
+    return {
+        "input": mcap_file.name,
+        "workers": workers,
+        "seconds": elapsed,
+        "input_mb": input_bytes / 1e6,
+        "output_mb": output_bytes / 1e6,
+        "input_mb_per_s": input_bytes / 1e6 / elapsed,
+        "messages": messages,
+        "messages_per_s": messages / elapsed,
+    }
+
+
+def main(
+        rh20t_frames: Tuple[int, ...] = (50, 200, 800),
+        encodings: Tuple[Encoding, ...] = ("json", "protobuf", "cdr"),
+        workers: Tuple[int, ...] = (1, 4),
+        workdir: Optional[Path] = None,
+        output_json: Optional[Path] = None,
+):
+    """
+    Convert RH20T fixtures of growing size to ROS 2 bags.
+    - rh20t_frames: fixture sizes (2 cameras, color + depth at 10 fps, kHz force/torque).
+    - workdir: keeps fixtures and their MCAP builds between runs (default: temporary).
+    - output_json: also write the results to this file.
+    """
+    temporary = workdir is None
+    workdir = Path(tempfile.mkdtemp(prefix="rosbag_bench_") if temporary else workdir).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    results = []
+    try:
+        for frames in rh20t_frames:
+            for encoding in encodings:
+                mcap_file = build_input(workdir, frames, encoding)
+                for n in workers:
+                    result = bench_convert(mcap_file, workdir / "bag", n)
+                    results.append(result)
+                    print(
+                        f"{result['input']:28s} {n:2d} workers {result['input_mb']:8.1f} MB -> "
+                        f"{result['output_mb']:8.1f} MB {result['seconds']:7.2f} s "
+                        f"{result['input_mb_per_s']:7.1f} MB/s {result['messages_per_s']:9.0f} msg/s"
+                    )
+    finally:
+        if temporary:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if output_json:
+        with open(output_json, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
@@ -0,0 +1,230 @@
+"""
+Benchmark suite: build synthetic fixtures offline, run every builder scenario, report
+frames/s, MB/s written, bytes per message per channel and peak RSS as JSON.
+
+    $ export PYTHONPATH=/project/path
+    $ python benchmarks/run.py --output-json bench.json
+    $ python benchmarks/run.py --suite rh20t --scenarios rh20t_json rh20t_cdr_raw_depth
+
+Each scenario runs in its own process, as from the command line, so peak RSS is
+the scenario's own (including its worker processes) and seconds include interpreter
+start and imports. Compare two JSON files of different versions to spot regressions.
+"""
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Literal, Optional, Tuple
+
+import tyro
+from mcap.reader import make_reader
+
+from benchmarks.fixtures import make_aloha_raw_dataset, make_lerobot_dataset, make_rh20t_scene
+from common.encoding import SCHEMAS
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Image schema names in every encoding (json / protobuf / ros2msg)
+IMAGE_SCHEMAS = {
+    schema_name
+    for name in ("foxglove.CompressedImage", "foxglove.CompressedVideo", "foxglove.RawImage")
+    for schema_name in (name, SCHEMAS[name][1], SCHEMAS[name][3])
+}
+
+# name -> (builder, options)
+SCENARIOS = {
+    "lerobot_dataset_json": ("lerobot", {"encoding": "json", "reader": "dataset"}),
+    "lerobot_columnar_json": ("lerobot", {"encoding": "json", "reader": "columnar"}),
+    "lerobot_columnar_protobuf": ("lerobot", {"encoding": "protobuf", "reader": "columnar"}),
+    "lerobot_columnar_workers": ("lerobot", {"encoding": "protobuf", "reader": "columnar", "workers": 4}),
+    "lerobot_passthrough_cdr": ("lerobot", {"encoding": "cdr", "video": "passthrough"}),
+    "rh20t_json": ("rh20t", {"encoding": "json"}),
+    "rh20t_json_async_writes": ("rh20t", {"encoding": "json", "async_writes": True}),
+    "rh20t_cdr_raw_depth": ("rh20t", {"encoding": "cdr", "depth_format": "raw"}),
+    "rh20t_cdr_jpeg_workers": ("rh20t", {"encoding": "cdr", "image_format": "jpeg", "workers": 4}),
+    "rh20t_passthrough_protobuf": ("rh20t", {"encoding": "protobuf", "video": "passthrough"}),
+    "aloha_raw_json": ("aloha_raw", {"encoding": "json"}),
+    "aloha_raw_cdr": ("aloha_raw", {"encoding": "cdr"}),
+}
+
+# builders run through their CLI script
+BUILDER_SCRIPTS = {"lerobot": "aloha_lerobot/build.py", "aloha_raw": "aloha_raw/build.py"}
+
+# Runs one builder in a fresh interpreter, from the repo root: aloha_lerobot / aloha_raw through
+# their CLI, rh20t through mcap_builder (no CLI). Peak RSS is measured inside: the rusage of a
+# forked child starts from the parent's high-water mark, VmHWM of the exec'd process does not.
+RUNNER = """
+import json, os, resource, runpy, sys
+script, argv, kwargs, report = json.loads(sys.argv[1])
+if script:
+    # same sys.path / argv as `python <script> <argv>`
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    sys.argv = [script] + argv
+    runpy.run_path(script, run_name="__main__")
+else:
+    from rh20t.build import mcap_builder
+    mcap_builder(**kwargs)
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+try:
+    with open("/proc/self/status") as f:
+        peak_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM"))
+except OSError:
+    pass
+peak_kb = max(peak_kb, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+with open(report, "w") as f:
+    json.dump({"peak_rss_kb": peak_kb}, f)
+"""
+
+
+def runner_args(builder, fixture, output, options):
+    if builder in BUILDER_SCRIPTS:
+        argv = ["--dataset-path", str(fixture), "--output-path", str(output)]
+        for key, value in options.items():
+            argv += [f"--{key.replace('_', '-')}", str(value)]
+        return BUILDER_SCRIPTS[builder], argv, None
+    kwargs = {"output_mcap": str(output / "scene.mcap"), "scene_path": str(fixture), **options}
+    return None, None, kwargs
+
+
+def run_builder(builder, fixture, output, options):
+    """Run one builder, return (seconds, peak RSS in MB of the builder and its worker processes)."""
+    report = output.parent / f"{output.name}.rss.json"
+    command = [
+        sys.executable, "-c", RUNNER,
+        json.dumps([*runner_args(builder, fixture, output, options), str(report)]),
+    ]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])))
+    start = time.perf_counter()
+    subprocess.run(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, check=True)
+    elapsed = time.perf_counter() - start
+    with open(report) as f:
+        peak_rss_kb = json.load(f)["peak_rss_kb"]
+    report.unlink()
+    return elapsed, peak_rss_kb / 1024
+
+
+def channel_stats(output):
+    """Per topic: message count, total and per-message bytes, over every MCAP file in `output`."""
+    stats = defaultdict(lambda: {"schema": None, "messages": 0, "bytes": 0})
+    for mcap_file in sorted(output.glob("*.mcap")):
+        with open(mcap_file, "rb") as f:
+            for schema, channel, message in make_reader(f).iter_messages():
+                entry = stats[channel.topic]
+                entry["schema"] = schema.name if schema else None
+                entry["messages"] += 1
+                entry["bytes"] += len(message.data)
+    for entry in stats.values():
+        entry["bytes_per_message"] = entry["bytes"] / entry["messages"]
+    return dict(sorted(stats.items()))
+
+
+def run_scenario(name, fixture, workdir):
+    builder, options = SCENARIOS[name]
+    output = workdir / "out" / name
+    shutil.rmtree(output, ignore_errors=True)
+    output.mkdir(parents=True)
+    seconds, peak_rss_mb = run_builder(builder, fixture, output, options)
+    output_bytes = sum(path.stat().st_size for path in output.glob("*.mcap"))
+    channels = channel_stats(output)
+    frames = sum(entry["messages"] for entry in channels.values() if entry["schema"] in IMAGE_SCHEMAS)
+    return {
+        "scenario": name,
+        "builder": builder,
+        "options": options,
+        "seconds": seconds,
+        "frames": frames,
+        "frames_per_s": frames / seconds,
+        "output_bytes": output_bytes,
+        "mb_per_s": output_bytes / 1e6 / seconds,
+        "peak_rss_mb": peak_rss_mb,
+        "channels": channels,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(
+        suite: Literal["all", "lerobot", "rh20t", "aloha_raw"] = "all",
+        scenarios: Optional[Tuple[str, ...]] = None,
+        workdir: Optional[Path] = None,
+        episodes: int = 2,
+        length: int = 100,
+        rh20t_frames: int = 100,
+        output_json: Optional[Path] = None,
+):
+    """
+    Run the benchmark scenarios on synthetic fixtures.
+    - suite: run the lerobot, rh20t or aloha_raw scenarios, or all.
+    - scenarios: only these scenario names (see SCENARIOS), overrides suite.
+    - workdir: where fixtures and outputs go (default: a temporary directory, removed after).
+      Fixtures already in workdir are reused.
+    - episodes / length: LeRobot and raw ALOHA (JPEG rows in HDF5) fixture size
+      (4 cameras, 640x480, 50 fps).
+    - rh20t_frames: RH20T fixture size (2 cameras, color + depth, 10 fps).
+    - output_json: write {"meta", "results"} to this file.
+    """
+    names = list(scenarios) if scenarios else [
+        name for name, (builder, _) in SCENARIOS.items() if suite in ("all", builder)
+    ]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios {sorted(unknown)}, choose from {list(SCENARIOS)}")
+
+    temporary = workdir is None
+    workdir = Path(tempfile.mkdtemp(prefix="mcap_bench_") if temporary else workdir).resolve()
+    fixtures = {
+        "lerobot": workdir / f"lerobot_{episodes}x{length}",
+        "rh20t": workdir / f"rh20t_{rh20t_frames}",
+        "aloha_raw": workdir / f"aloha_raw_{episodes}x{length}",
+    }
+    results = []
+    try:
+        for name in names:
+            builder = SCENARIOS[name][0]
+            if not fixtures[builder].exists():
+                print(f"Generating {builder} fixture in {fixtures[builder]}")
+                if builder == "lerobot":
+                    make_lerobot_dataset(fixtures[builder], episodes=episodes, length=length)
+                elif builder == "aloha_raw":
+                    make_aloha_raw_dataset(fixtures[builder], episodes=episodes, length=length)
+                else:
+                    make_rh20t_scene(fixtures[builder], frames=rh20t_frames)
+            result = run_scenario(name, fixtures[builder], workdir)
+            results.append(result)
+            print(
+                f"{name:28s} {result['seconds']:7.2f} s {result['frames_per_s']:8.1f} frames/s "
+                f"{result['mb_per_s']:7.2f} MB/s {result['peak_rss_mb']:8.1f} MB peak RSS"
+            )
+    finally:
+        if temporary:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if output_json:
+        meta = {
+            "git_revision": git_revision(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "fixtures": {"episodes": episodes, "length": length, "rh20t_frames": rh20t_frames},
+        }
+        with open(output_json, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
@@ -0,0 +1,161 @@
+"""
+Dataset catalog: find episodes without opening every MCAP file.
+
+`catalog.sqlite` in the output directory has one row per (file, channel):
+- path: MCAP file relative to the catalog directory, source: episode index / scene id,
+  builder: builder that wrote it ("" when backfilled by tools/catalog.py),
+- topic, schema_name, message_encoding, message_count,
+- start_time / end_time (ns): time range of the channel, from the chunks that hold it,
+  narrowed to the file statistics,
+- file_size, file_mtime_ns: of the MCAP file, a row set is refreshed when they change.
+Rows only come from the summary section (statistics, channels, chunk indexes), so
+cataloging a file reads a few KB at its end whatever its size.
+
+The `files` view has one row per file (time range, duration, messages, size).
+
+    $ sqlite3 output/catalog.sqlite "SELECT source FROM channels WHERE topic = '/camera/f0461559/color' AND message_count > 100"
+    $ sqlite3 output/catalog.sqlite "SELECT builder, SUM(duration) / 1e9 FROM files GROUP BY builder"
+"""
+import os
+import re
+import sqlite3
+import time
+
+CATALOG_FILE = "catalog.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    path TEXT NOT NULL,
+    source TEXT NOT NULL,
+    builder TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    schema_name TEXT NOT NULL,
+    message_encoding TEXT NOT NULL,
+    message_count INTEGER NOT NULL,
+    start_time INTEGER,
+    end_time INTEGER,
+    file_size INTEGER NOT NULL,
+    file_mtime_ns INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channels_path ON channels (path);
+CREATE INDEX IF NOT EXISTS channels_topic ON channels (topic);
+CREATE INDEX IF NOT EXISTS channels_source ON channels (source);
+CREATE VIEW IF NOT EXISTS files AS
+SELECT path, source, builder, MIN(start_time) AS start_time, MAX(end_time) AS end_time,
+       MAX(end_time) - MIN(start_time) AS duration, SUM(message_count) AS message_count,
+       COUNT(*) AS channel_count, file_size
+FROM channels GROUP BY path;
+"""
+
+COLUMNS = (
+    "path", "source", "builder", "topic", "schema_name", "message_encoding", "message_count",
+    "start_time", "end_time", "file_size", "file_mtime_ns", "indexed_at",
+)
+
+
+def source_id(path):
+    """Episode index of `episode_<n>.mcap`, else the file name without extension (scene id)."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = re.fullmatch(r"episode_(\d+)", stem)
+    return match.group(1) if match else stem
+
+
+def summary_rows(path, source=None, builder=""):
+    """
+    Catalog rows of one MCAP file from its summary section only, without the `path` and
+    `indexed_at` columns. Raise ValueError if the file has no summary (`mcap recover` it).
+    """
+    from mcap.reader import make_reader
+
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        summary = make_reader(f).get_summary()
+    if summary is None:
+        raise ValueError(f"{path} has no summary section")
+    statistics = summary.statistics
+    # Per channel time range: bounds of the chunks that have a message index for the channel
+    ranges = {}
+    for chunk_index in summary.chunk_indexes:
+        for channel_id in chunk_index.message_index_offsets:
+            start, end = ranges.get(channel_id, (chunk_index.message_start_time, chunk_index.message_end_time))
+            ranges[channel_id] = (
+                min(start, chunk_index.message_start_time), max(end, chunk_index.message_end_time)
+            )
+    rows = []
+    for channel_id, channel in sorted(summary.channels.items()):
+        schema = summary.schemas.get(channel.schema_id)
+        count = statistics.channel_message_counts.get(channel_id, 0) if statistics else None
+        start, end = ranges.get(channel_id, (None, None))
+        if statistics and statistics.message_count and start is not None:
+            start = max(start, statistics.message_start_time)
+            end = min(end, statistics.message_end_time)
+        rows.append({
+            "source": source_id(path) if source is None else str(source),
+            "builder": builder,
+            "topic": channel.topic,
+            "schema_name": schema.name if schema else "",
+            "message_encoding": channel.message_encoding,
+            "message_count": count if count is not None else 0,
+            "start_time": start,
+            "end_time": end,
+            "file_size": stat.st_size,
+            "file_mtime_ns": stat.st_mtime_ns,
+        })
+    return rows
+
+
+class Catalog:
+    def __init__(self, output_dir, path=None):
+        """
+        output_dir: directory of the MCAP files, paths are stored relative to it.
+        path: catalog file (default: output_dir/catalog.sqlite).
+        """
+        self.output_dir = str(output_dir)
+        self.path = str(path) if path else os.path.join(self.output_dir, CATALOG_FILE)
+        # Several builder processes / shards may record into the same catalog: wait on its lock
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def relative_path(self, mcap_path):
+        return os.path.relpath(os.path.abspath(mcap_path), os.path.abspath(self.output_dir))
+
+    def record(self, mcap_path, source=None, builder=""):
+        """(Re)catalog one MCAP file from its summary section."""
+        self.record_rows(mcap_path, summary_rows(mcap_path, source, builder))
+
+    def record_rows(self, mcap_path, rows):
+        """Replace the rows of `mcap_path` (rows of summary_rows) in one transaction."""
+        path = self.relative_path(mcap_path)
+        indexed_at = time.time()
+        with self.connection:
+            self.connection.execute("DELETE FROM channels WHERE path = ?", (path,))
+            self.connection.executemany(
+                f"INSERT INTO channels ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [tuple({**row, "path": path, "indexed_at": indexed_at}[column] for column in COLUMNS) for row in rows],
+            )
+
+    def file_states(self):
+        """{relative path: (file_size, file_mtime_ns, source, builder)} of the cataloged files."""
+        return {
+            row[0]: row[1:]
+            for row in self.connection.execute(
+                "SELECT path, file_size, file_mtime_ns, source, builder FROM channels GROUP BY path"
+            )
+        }
+
+    def remove(self, relative_paths):
+        with self.connection:
+            self.connection.executemany("DELETE FROM channels WHERE path = ?", [(path,) for path in relative_paths])
+
+    def query(self, sql, parameters=()):
+        return self.connection.execute(sql, parameters).fetchall()
@@ -0,0 +1,212 @@
+"""
+MCAP chunks built away from the writer.
+
+- `build_chunk` serializes and compresses a group of messages into a complete Chunk record
+  and its MessageIndex records. Nothing depends on the file position, so it runs in worker
+  processes or threads, in parallel.
+- `ChunkWriter` is the single writer: it appends built chunks to the file and writes the
+  summary (schemas, channels, statistics, chunk indexes, summary offsets) on finish.
+  Its cost per chunk is a few writes, whatever the number of messages in the chunk.
+
+Files are standard MCAP (same layout as mcap.writer.Writer with its default options),
+readable by mcap.reader, Foxglove and rosbag2.
+"""
+import struct
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict
+
+from mcap.data_stream import RecordBuilder
+from mcap.opcode import Opcode
+from mcap.records import Channel, ChunkIndex, DataEnd, Footer, Header, Schema, Statistics, SummaryOffset
+from mcap.writer import LIBRARY_IDENTIFIER, MCAP0_MAGIC, CompressionType
+
+MESSAGE_PREFIX = struct.Struct("<BQHIQQ")  # opcode, record length, channel_id, sequence, log_time, publish_time
+MESSAGE_HEADER_SIZE = 2 + 4 + 8 + 8
+
+
+@dataclass
+class BuiltChunk:
+    record: bytes  # Chunk record, opcode included
+    message_indexes: bytes  # MessageIndex records, one per channel
+    index_offsets: Dict[int, int]  # channel_id -> offset of its MessageIndex record in message_indexes
+    message_counts: Dict[int, int] = field(default_factory=dict)
+    message_start_time: int = 0
+    message_end_time: int = 0
+    uncompressed_size: int = 0
+    compressed_size: int = 0
+    compression: str = ""
+
+
+def compress(compression: CompressionType, data):
+    """(compression name of the Chunk record, compressed bytes), as mcap.writer.Writer does."""
+    if compression == CompressionType.ZSTD:
+        import zstandard
+        return "zstd", zstandard.compress(data)
+    if compression == CompressionType.LZ4:
+        import lz4.frame
+        return "lz4", lz4.frame.compress(data)
+    return "", data
+
+
+def build_chunk(messages, compression: CompressionType = CompressionType.ZSTD):
+    """
+    One chunk of `messages`: iterable of (channel_id, sequence, log_time, publish_time, data),
+    in the order they are written. Return a BuiltChunk, or None if there is no message.
+    """
+    parts = []
+    entries = defaultdict(list)
+    offset = 0
+    start_time = end_time = None
+    pack = MESSAGE_PREFIX.pack
+    for channel_id, sequence, log_time, publish_time, data in messages:
+        size = memoryview(data).nbytes
+        parts.append(pack(Opcode.MESSAGE, MESSAGE_HEADER_SIZE + size, channel_id, sequence, log_time, publish_time))
+        parts.append(data)
+        entries[channel_id].append((log_time, offset))
+        offset += MESSAGE_PREFIX.size + size
+        if start_time is None or log_time < start_time:
+            start_time = log_time
+        if end_time is None or log_time > end_time:
+            end_time = log_time
+    if start_time is None:
+        return None
+
+    data = b"".join(parts)
+    compression_name, compressed = compress(compression, data)
+    name = compression_name.encode("utf-8")
+    record = b"".join((
+        struct.pack(
+            "<BQQQQI", Opcode.CHUNK, 8 + 8 + 8 + 4 + 4 + len(name) + 8 + len(compressed),
+            start_time, end_time, len(data), zlib.crc32(data),
+        ),
+        struct.pack("<I", len(name)), name,
+        struct.pack("<Q", len(compressed)), compressed,
+    ))
+
+    indexes = []
+    index_offsets = {}
+    index_size = 0
+    for channel_id in sorted(entries):
+        channel_entries = sorted(entries[channel_id])
+        body = struct.pack(f"<{2 * len(channel_entries)}Q", *(value for entry in channel_entries for value in entry))
+        indexes.append(struct.pack("<BQHI", Opcode.MESSAGE_INDEX, 2 + 4 + len(body), channel_id, len(body)) + body)
+        index_offsets[channel_id] = index_size
+        index_size += len(indexes[-1])
+    return BuiltChunk(
+        record=record,
+        message_indexes=b"".join(indexes),
+        index_offsets=index_offsets,
+        message_counts={channel_id: len(channel_entries) for channel_id, channel_entries in entries.items()},
+        message_start_time=start_time,
+        message_end_time=end_time,
+        uncompressed_size=len(data),
+        compressed_size=len(compressed),
+        compression=compression_name,
+    )
+
+
+class ChunkWriter:
+    """Writes an MCAP file from BuiltChunk records (see build_chunk); schemas and channels go first."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.schemas = {}
+        self.channels = {}
+        self.chunk_indexes = []
+        self.statistics = Statistics(
+            attachment_count=0, channel_count=0, channel_message_counts=defaultdict(int), chunk_count=0,
+            message_count=0, message_end_time=0, message_start_time=0, metadata_count=0, schema_count=0,
+        )
+        self._offset = 0
+
+    def _write(self, data):
+        self.stream.write(data)
+        self._offset += len(data)
+
+    def _write_record(self, record):
+        builder = RecordBuilder()
+        record.write(builder)
+        self._write(builder.end())
+
+    def start(self, profile="", library=LIBRARY_IDENTIFIER):
+        self._write(MCAP0_MAGIC)
+        self._write_record(Header(profile=profile, library=library))
+
+    def register_schema(self, name, encoding, data):
+        schema = Schema(id=len(self.schemas) + 1, name=name, encoding=encoding, data=data)
+        self.schemas[schema.id] = schema
+        self.statistics.schema_count += 1
+        self._write_record(schema)
+        return schema.id
+
+    def register_channel(self, topic, message_encoding, schema_id, metadata=None):
+        channel = Channel(
+            id=len(self.channels) + 1, topic=topic, message_encoding=message_encoding,
+            schema_id=schema_id, metadata=metadata or {},
+        )
+        self.channels[channel.id] = channel
+        self.statistics.channel_count += 1
+        self._write_record(channel)
+        return channel.id
+
+    def add_chunk(self, chunk: BuiltChunk):
+        if chunk is None:
+            return
+        chunk_start = self._offset
+        self._write(chunk.record)
+        index_start = self._offset
+        self._write(chunk.message_indexes)
+        self.chunk_indexes.append(ChunkIndex(
+            message_start_time=chunk.message_start_time,
+            message_end_time=chunk.message_end_time,
+            chunk_start_offset=chunk_start,
+            chunk_length=len(chunk.record),
+            message_index_offsets={
+                channel_id: index_start + offset for channel_id, offset in chunk.index_offsets.items()
+            },
+            message_index_length=len(chunk.message_indexes),
+            compression=chunk.compression,
+            compressed_size=chunk.compressed_size,
+            uncompressed_size=chunk.uncompressed_size,
+        ))
+        statistics = self.statistics
+        if not statistics.message_count or chunk.message_start_time < statistics.message_start_time:
+            statistics.message_start_time = chunk.message_start_time
+        statistics.message_end_time = max(statistics.message_end_time, chunk.message_end_time)
+        for channel_id, count in chunk.message_counts.items():
+            statistics.channel_message_counts[channel_id] += count
+            statistics.message_count += count
+        statistics.chunk_count += 1
+
+    def finish(self):
+        """Write DataEnd, the summary section and the footer (same groups as mcap.writer.Writer)."""
+        self._write_record(DataEnd(data_section_crc=0))
+        summary_start = self._offset
+        builder = RecordBuilder()
+        offsets = []
+        groups = [
+            (Opcode.SCHEMA, self.schemas.values()),
+            (Opcode.CHANNEL, self.channels.values()),
+            (Opcode.STATISTICS, [self.statistics]),
+            (Opcode.CHUNK_INDEX, self.chunk_indexes),
+        ]
+        for opcode, records in groups:
+            group_start = builder.count
+            for record in records:
+                record.write(builder)
+            offsets.append(SummaryOffset(
+                group_opcode=opcode, group_start=summary_start + group_start, group_length=builder.count - group_start,
+            ))
+        summary_offset_start = summary_start + builder.count
+        for offset in offsets:
+            offset.write(builder)
+        summary = builder.end()
+        crc = zlib.crc32(summary)
+        crc = zlib.crc32(struct.pack("<BQQQ", Opcode.FOOTER, 8 + 8 + 4, summary_start, summary_offset_start), crc)
+        self._write(summary)
+        footer = RecordBuilder()
+        Footer(summary_start=summary_start, summary_offset_start=summary_offset_start, summary_crc=crc).write(footer)
+        self._write(footer.end())
+        self._write(MCAP0_MAGIC)
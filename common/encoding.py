@@ -0,0 +1,468 @@
+"""
+Message encodings shared by all builders.
+
+- json     : jsonschema + json, the original format (schema/*.json).
+- protobuf : FileDescriptorSet schemas, messages are hand-serialized so numeric
+             fields are copied straight from the numpy buffer.
+- cdr      : ROS 2 ros2msg schemas (schema/*.msg), XCDR1 little-endian.
+
+Every encoding is readable by Foxglove.
+"""
+import base64
+import json
+import struct
+from functools import lru_cache
+from importlib import resources
+from typing import Literal
+
+import numpy as np
+
+Encoding = Literal["json", "protobuf", "cdr"]
+
+
+# schema name -> (json schema file, protobuf message, ros2msg file, ros2 type)
+SCHEMAS = {
+    "aloha_14dof": ("14dof.json", "mcap_builder.Aloha14Dof", "14dof.msg", "mcap_builder/msg/Aloha14Dof"),
+    "aloha_2dof": ("2dof.json", "mcap_builder.Aloha2Dof", "2dof.msg", "mcap_builder/msg/Aloha2Dof"),
+    "GripperPose": ("xyz_quat.json", "mcap_builder.GripperPose", "xyz_quat.msg", "mcap_builder/msg/GripperPose"),
+    "Vector": ("vector.json", "mcap_builder.Vector", "vector.msg", "mcap_builder/msg/Vector"),
+    "VectorBatch": ("vector_batch.json", "mcap_builder.VectorBatch", "vector_batch.msg", "mcap_builder/msg/VectorBatch"),
+    "foxglove.CompressedImage": (
+        "compressed_image.json", "foxglove.CompressedImage", "compressed_image.msg", "sensor_msgs/msg/CompressedImage"
+    ),
+    "foxglove.RawImage": (
+        "raw_image.json", "foxglove.RawImage", "raw_image.msg", "sensor_msgs/msg/Image"
+    ),
+    "foxglove.CompressedVideo": (
+        "compressed_video.json", "foxglove.CompressedVideo", "compressed_video.msg", "foxglove_msgs/msg/CompressedVideo"
+    ),
+}
+
+MESSAGE_ENCODING = {
+    "json": "json",
+    "protobuf": "protobuf",
+    "cdr": "cdr",
+}
+
+# CDR encapsulation header: plain CDR, little endian
+CDR_HEADER = b"\x00\x01\x00\x00"
+
+
+@lru_cache(maxsize=None)
+def schema_file(file_name):
+    """Bytes of schema/<file_name>, read from the `schema` package resources once per process, from any cwd."""
+    return resources.files("schema").joinpath(file_name).read_bytes()
+
+
+def load_json_schema(file_name):
+    return json.loads(schema_file(file_name))
+
+
+def schema_for(name, encoding: Encoding):
+    """
+    Return the `Writer.register_schema` kwargs (name, encoding, data)
+    of schema `name` in the given message encoding.
+    """
+    json_file, proto_name, msg_file, ros2_name = SCHEMAS[name]
+    if encoding == "json":
+        data = json.dumps(load_json_schema(json_file)).encode("utf-8")
+        return dict(name=name, encoding="jsonschema", data=data)
+    if encoding == "protobuf":
+        return dict(name=proto_name, encoding="protobuf", data=protobuf_descriptor_set())
+    if encoding == "cdr":
+        data = schema_file(msg_file)
+        return dict(name=ros2_name, encoding="ros2msg", data=data)
+    raise ValueError(f"Unknown encoding: {encoding}")
+
+
+@lru_cache(maxsize=None)
+def protobuf_descriptor_set():
+    """
+    Serialized FileDescriptorSet holding every protobuf message of this repo.
+    Built once per process, `protobuf` is only needed for this encoding.
+    """
+    from google.protobuf import descriptor_pb2, timestamp_pb2
+
+    field = descriptor_pb2.FieldDescriptorProto
+    fds = descriptor_pb2.FileDescriptorSet()
+    timestamp_pb2.DESCRIPTOR.CopyToProto(fds.file.add())
+
+    def add_file(name, package):
+        proto = fds.file.add()
+        proto.name = name
+        proto.package = package
+        proto.syntax = "proto3"
+        proto.dependency.append("google/protobuf/timestamp.proto")
+        return proto
+
+    def add_message(proto, name, fields, numbers=None):
+        message = proto.message_type.add()
+        message.name = name
+        for number, (field_name, field_type, label, type_name) in zip(numbers or range(1, len(fields) + 1), fields):
+            f = message.field.add()
+            f.name = field_name
+            f.number = number
+            f.type = field_type
+            f.label = label
+            if type_name:
+                f.type_name = type_name
+
+    timestamp = ("timestamp", field.TYPE_MESSAGE, field.LABEL_OPTIONAL, ".google.protobuf.Timestamp")
+    joint_state = ("joint_state", field.TYPE_DOUBLE, field.LABEL_REPEATED, None)
+    proto = add_file("mcap_builder.proto", "mcap_builder")
+    add_message(proto, "Aloha14Dof", [timestamp, joint_state])
+    add_message(proto, "Aloha2Dof", [timestamp, joint_state])
+    add_message(proto, "Vector3", [(axis, field.TYPE_DOUBLE, field.LABEL_OPTIONAL, None) for axis in "xyz"])
+    add_message(proto, "Quaternion", [(axis, field.TYPE_DOUBLE, field.LABEL_OPTIONAL, None) for axis in "xyzw"])
+    add_message(proto, "GripperPose", [
+        timestamp,
+        ("position", field.TYPE_MESSAGE, field.LABEL_OPTIONAL, ".mcap_builder.Vector3"),
+        ("orientation", field.TYPE_MESSAGE, field.LABEL_OPTIONAL, ".mcap_builder.Quaternion"),
+    ])
+    add_message(proto, "Vector", [timestamp, ("values", field.TYPE_DOUBLE, field.LABEL_REPEATED, None)])
+    add_message(proto, "VectorBatch", [
+        timestamp,
+        ("sample_time_ns", field.TYPE_FIXED64, field.LABEL_REPEATED, None),
+        ("dim", field.TYPE_UINT32, field.LABEL_OPTIONAL, None),
+        ("values", field.TYPE_DOUBLE, field.LABEL_REPEATED, None),
+    ])
+
+    # Same field numbers as https://github.com/foxglove/schemas
+    proto = add_file("foxglove/CompressedImage.proto", "foxglove")
+    add_message(proto, "CompressedImage", [
+        timestamp,
+        ("frame_id", field.TYPE_STRING, field.LABEL_OPTIONAL, None),
+        ("data", field.TYPE_BYTES, field.LABEL_OPTIONAL, None),
+        ("format", field.TYPE_STRING, field.LABEL_OPTIONAL, None),
+    ], numbers=[1, 4, 2, 3])
+
+    proto = add_file("foxglove/RawImage.proto", "foxglove")
+    add_message(proto, "RawImage", [
+        timestamp,
+        ("frame_id", field.TYPE_STRING, field.LABEL_OPTIONAL, None),
+        ("width", field.TYPE_FIXED32, field.LABEL_OPTIONAL, None),
+        ("height", field.TYPE_FIXED32, field.LABEL_OPTIONAL, None),
+        ("encoding", field.TYPE_STRING, field.LABEL_OPTIONAL, None),
+        ("step", field.TYPE_FIXED32, field.LABEL_OPTIONAL, None),
+        ("data", field.TYPE_BYTES, field.LABEL_OPTIONAL, None),
+    ], numbers=[1, 7, 2, 3, 4, 5, 6])
+
+    proto = add_file("foxglove/CompressedVideo.proto", "foxglove")
+    add_message(proto, "CompressedVideo", [
+        timestamp,
+        ("frame_id", field.TYPE_STRING, field.LABEL_OPTIONAL, None),
+        ("data", field.TYPE_BYTES, field.LABEL_OPTIONAL, None),
+        ("format", field.TYPE_STRING, field.LABEL_OPTIONAL, None),
+    ])
+    return fds.SerializeToString()
+
+
+def varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def pb_timestamp(sec, nsec, field_number=1):
+    """google.protobuf.Timestamp as a length-delimited field."""
+    body = b"\x08" + varint(sec)
+    if nsec:
+        body += b"\x10" + varint(nsec)
+    return varint(field_number << 3 | 2) + varint(len(body)) + body
+
+
+def pb_string(field_number, value):
+    value = value.encode("utf-8")
+    return varint(field_number << 3 | 2) + varint(len(value)) + value
+
+
+def cdr_string(value, offset):
+    """CDR string at `offset` (bytes after the encapsulation header), 4-aligned."""
+    value = value.encode("utf-8") + b"\x00"
+    return b"\x00" * (-offset % 4) + struct.pack("<I", len(value)) + value
+
+
+def json_rows(values):
+    """
+    json.dumps text of every row of a [N, D] array, as bytes. One json.dumps call for the
+    whole array (float repr done in C, NaN / Infinity as json.dumps writes them), cut at the
+    row separators which no number contains.
+    """
+    if len(values) == 0:
+        return []
+    return json.dumps(np.asarray(values).tolist())[2:-2].encode("utf-8").split(b"], [")
+
+
+def encode_joint_state(encoding: Encoding, ts, values):
+    """
+    Joint state message (aloha_14dof / aloha_2dof).
+    `ts` in milliseconds, `values` a 1-D numpy array.
+    """
+    sec, nsec = ts // 1000, (ts % 1000) * 1_000_000
+    if encoding == "json":
+        return json.dumps({
+            "timestamp": {
+                "sec": sec,
+                "nsec": nsec
+            },
+            "joint_state": values.tolist(),
+        }).encode("utf-8")
+
+    values = np.ascontiguousarray(values, dtype="<f8")
+    if encoding == "protobuf":
+        return b"".join((
+            pb_timestamp(sec, nsec),
+            b"\x12", varint(values.nbytes),  # packed repeated double, field 2
+            values.tobytes(),
+        ))
+    # float64[N] fixed array, 8-aligned right after the Time struct
+    return b"".join((CDR_HEADER, struct.pack("<iI", sec, nsec), values.tobytes()))
+
+
+def encode_joint_states(encoding: Encoding, timestamps, values):
+    """
+    Joint state messages of a whole episode: `timestamps` [T] in milliseconds, `values` [T, D].
+    json fills one byte template per message from json_rows, instead of T dicts and json.dumps
+    calls; the bytes are those of encode_joint_state.
+    """
+    if encoding != "json":
+        return [encode_joint_state(encoding, int(ts), row) for ts, row in zip(timestamps, values)]
+    template = b'{"timestamp": {"sec": %d, "nsec": %d}, "joint_state": [%b]}'
+    return [
+        template % (ts // 1000, ts % 1000 * 1_000_000, row)
+        for ts, row in zip(np.asarray(timestamps, dtype=np.int64).tolist(), json_rows(values))
+    ]
+
+
+def encode_pose(encoding: Encoding, ts, pose):
+    """
+    GripperPose message, `pose` = [x, y, z, qx, qy, qz, qw], `ts` in milliseconds.
+    """
+    if encoding == "json":
+        return json.dumps({
+            "timestamp": ts,
+            "position": {
+                "x": pose[0],
+                "y": pose[1],
+                "z": pose[2]
+            },
+            "orientation": {
+                "x": pose[3],
+                "y": pose[4],
+                "z": pose[5],
+                "w": pose[6]
+            }
+        }).encode("utf-8")
+
+    ts = int(ts)
+    sec, nsec = ts // 1000, (ts % 1000) * 1_000_000
+    x, y, z, qx, qy, qz, qw = (float(v) for v in pose)
+    if encoding == "protobuf":
+        return b"".join((
+            pb_timestamp(sec, nsec),
+            struct.pack("<BBBdBdBd", 0x12, 27, 0x09, x, 0x11, y, 0x19, z),
+            struct.pack("<BBBdBdBdBd", 0x1A, 36, 0x09, qx, 0x11, qy, 0x19, qz, 0x21, qw),
+        ))
+    return CDR_HEADER + struct.pack("<iI7d", sec, nsec, x, y, z, qx, qy, qz, qw)
+
+
+def encode_poses(encoding: Encoding, timestamps, poses):
+    """
+    GripperPose messages of a whole stream: `timestamps` [N] in milliseconds, `poses` [N, 7].
+    json fills one text template per message (float repr is what json.dumps writes for
+    finite values), the bytes are those of encode_pose; timestamps keep their int or float type.
+    """
+    poses = np.asarray(poses, dtype=np.float64)
+    if encoding != "json" or not np.isfinite(poses).all():
+        return [encode_pose(encoding, ts, pose) for ts, pose in zip(timestamps, poses)]
+    if not len(timestamps):
+        return []
+    template = (
+        '{"timestamp": %s, "position": {"x": %r, "y": %r, "z": %r}, '
+        '"orientation": {"x": %r, "y": %r, "z": %r, "w": %r}}'
+    )
+    ts_text = json.dumps(list(timestamps))[1:-1].split(", ")
+    return [(template % (ts, *pose)).encode("utf-8") for ts, pose in zip(ts_text, poses.tolist())]
+
+
+def encode_vector(encoding: Encoding, ts, values):
+    """Vector message: one sample, `values` a 1-D numpy array, `ts` in milliseconds."""
+    ts = int(ts)
+    sec, nsec = ts // 1000, (ts % 1000) * 1_000_000
+    if encoding == "json":
+        return json.dumps({"timestamp": {"sec": sec, "nsec": nsec}, "values": values.tolist()}).encode("utf-8")
+
+    values = np.ascontiguousarray(values, dtype="<f8")
+    if encoding == "protobuf":
+        return b"".join((pb_timestamp(sec, nsec), b"\x12", varint(values.nbytes), values.tobytes()))
+    # float64[] sequence: length at offset 8, elements 8-aligned at offset 16
+    return b"".join((CDR_HEADER, struct.pack("<iII4x", sec, nsec, len(values)), values.tobytes()))
+
+
+def encode_vectors(encoding: Encoding, timestamps, values):
+    """
+    One Vector message per sample: `timestamps` [N] in milliseconds, `values` [N, D].
+    cdr messages all have the same size, they are laid out in one numpy record array
+    and cut out of its buffer, without a per-sample struct.pack; json fills one byte
+    template per message from json_rows.
+    """
+    if encoding == "protobuf":
+        return [encode_vector(encoding, ts, row) for ts, row in zip(timestamps, values)]
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if encoding == "json":
+        template = b'{"timestamp": {"sec": %d, "nsec": %d}, "values": [%b]}'
+        return [
+            template % (ts // 1000, ts % 1000 * 1_000_000, row)
+            for ts, row in zip(timestamps.tolist(), json_rows(values))
+        ]
+    n, dim = values.shape
+    records = np.zeros(n, dtype=np.dtype([
+        ("header", "V4"), ("sec", "<i4"), ("nsec", "<u4"), ("length", "<u4"), ("pad", "V4"), ("values", "<f8", (dim,)),
+    ]))
+    records["header"] = np.frombuffer(CDR_HEADER, dtype="V4")[0]
+    records["sec"] = timestamps // 1000
+    records["nsec"] = timestamps % 1000 * 1_000_000
+    records["length"] = dim
+    records["values"] = values
+    buffer = records.tobytes()
+    size = records.dtype.itemsize
+    return [buffer[i:i + size] for i in range(0, len(buffer), size)]
+
+
+def encode_vector_batch(encoding: Encoding, timestamps, values):
+    """
+    VectorBatch message: N samples of one stream in one message, `timestamps` [N] in
+    milliseconds, `values` [N, D]. Binary encodings copy both arrays as packed buffers.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    ts = int(timestamps[0])
+    sec, nsec = ts // 1000, (ts % 1000) * 1_000_000
+    sample_time_ns = (timestamps * 1_000_000).astype("<u8")
+    dim = values.shape[1]
+    if encoding == "json":
+        return json.dumps({
+            "timestamp": {"sec": sec, "nsec": nsec},
+            "sample_time_ns": sample_time_ns.tolist(),
+            "dim": dim,
+            "values": values.ravel().tolist(),
+        }).encode("utf-8")
+
+    values = np.ascontiguousarray(values, dtype="<f8")
+    if encoding == "protobuf":
+        return b"".join((
+            pb_timestamp(sec, nsec),
+            b"\x12", varint(sample_time_ns.nbytes), sample_time_ns.tobytes(),  # packed fixed64, field 2
+            b"\x18", varint(dim),
+            b"\x22", varint(values.nbytes), values.tobytes(),  # packed double, field 4
+        ))
+    # Time | uint32 N, pad to 8 | uint64[N] | uint32 dim | uint32 N*dim | float64[N*dim] (already 8-aligned)
+    return b"".join((
+        CDR_HEADER, struct.pack("<iII4x", sec, nsec, len(sample_time_ns)), sample_time_ns.tobytes(),
+        struct.pack("<II", dim, values.size), values.tobytes(),
+    ))
+
+
+def encode_compressed_image(encoding: Encoding, ts, frame_id, data, image_format):
+    """
+    foxglove.CompressedImage (sensor_msgs/CompressedImage for cdr) message.
+    `data` is the encoder output buffer (bytes or a uint8 numpy array), `ts` in milliseconds.
+    Binary encodings write it as raw bytes, only json goes through base64.
+    """
+    ts = int(ts)
+    sec, nsec = ts // 1000, (ts % 1000) * 1_000_000
+    if encoding == "json":
+        return json.dumps({
+            "timestamp": {"sec": sec, "nsec": nsec},
+            "frame_id": frame_id,
+            "data": base64.b64encode(data).decode("utf-8"),
+            "format": image_format
+        }).encode("utf-8")
+
+    size = memoryview(data).nbytes
+    if encoding == "protobuf":
+        # data field last, so the frame buffer is copied once, into the message itself
+        return b"".join((
+            pb_timestamp(sec, nsec),
+            pb_string(4, frame_id),
+            pb_string(3, image_format),
+            b"\x12", varint(size),
+            data,
+        ))
+    head = struct.pack("<iI", sec, nsec)
+    head += cdr_string(frame_id, len(head))
+    head += cdr_string(image_format, len(head))
+    head += b"\x00" * (-len(head) % 4) + struct.pack("<I", size)
+    return b"".join((CDR_HEADER, head, data))
+
+
+def encode_compressed_video(encoding: Encoding, ts, frame_id, data, video_format):
+    """
+    foxglove.CompressedVideo message: one video frame (packet) as raw bytes, `ts` in milliseconds.
+    """
+    ts = int(ts)
+    sec, nsec = ts // 1000, (ts % 1000) * 1_000_000
+    if encoding == "json":
+        return json.dumps({
+            "timestamp": {"sec": sec, "nsec": nsec},
+            "frame_id": frame_id,
+            "data": base64.b64encode(data).decode("utf-8"),
+            "format": video_format
+        }).encode("utf-8")
+
+    size = memoryview(data).nbytes
+    if encoding == "protobuf":
+        return b"".join((
+            pb_timestamp(sec, nsec),
+            pb_string(2, frame_id),
+            pb_string(4, video_format),
+            b"\x1a", varint(size),
+            data,
+        ))
+    head = struct.pack("<iI", sec, nsec)
+    head += cdr_string(frame_id, len(head))
+    head += b"\x00" * (-len(head) % 4) + struct.pack("<I", size)
+    tail_offset = len(head) + size
+    return b"".join((CDR_HEADER, head, data, cdr_string(video_format, tail_offset)))
+
+
+def encode_raw_image(encoding: Encoding, ts, frame_id, image, image_encoding):
+    """
+    foxglove.RawImage (sensor_msgs/Image for cdr) message, `ts` in milliseconds.
+    `image` is a C-contiguous [H,W] or [H,W,C] numpy array, e.g. uint16 depth with "16UC1".
+    """
+    ts = int(ts)
+    sec, nsec = ts // 1000, (ts % 1000) * 1_000_000
+    height, width = image.shape[:2]
+    step = image.strides[0]
+    if encoding == "json":
+        return json.dumps({
+            "timestamp": {"sec": sec, "nsec": nsec},
+            "frame_id": frame_id,
+            "width": width,
+            "height": height,
+            "encoding": image_encoding,
+            "step": step,
+            "data": base64.b64encode(image).decode("utf-8")
+        }).encode("utf-8")
+
+    if encoding == "protobuf":
+        return b"".join((
+            pb_timestamp(sec, nsec),
+            pb_string(7, frame_id),
+            struct.pack("<BIBI", 0x15, width, 0x1D, height),
+            pb_string(4, image_encoding),
+            struct.pack("<BI", 0x2D, step),
+            b"\x32", varint(image.nbytes),
+            image,
+        ))
+    head = struct.pack("<iI", sec, nsec)
+    head += cdr_string(frame_id, len(head))
+    head += b"\x00" * (-len(head) % 4) + struct.pack("<II", height, width)
+    head += cdr_string(image_encoding, len(head))
+    is_bigendian = 0
+    head += struct.pack("<B", is_bigendian)
+    head += b"\x00" * (-len(head) % 4) + struct.pack("<II", step, image.nbytes)
+    return b"".join((CDR_HEADER, head, image))
@@ -0,0 +1,190 @@
+"""
+Image compression for foxglove.CompressedImage, with interchangeable backends.
+
+- pil: PIL.Image.save into a BytesIO (jpeg, png, webp).
+- cv2: cv2.imencode (jpeg, png, webp), needs a BGR copy of RGB input.
+- turbojpeg: libjpeg-turbo through PyTurboJPEG, if installed (jpeg only), encodes RGB directly.
+- auto: the fastest installed backend that supports the format (turbojpeg > cv2 > pil).
+
+Every backend takes uint8 [H,W,3] frames as they are: `to_uint8_hwc` is the only
+conversion, for float [3,H,W] tensors in [0, 1], and it writes into one uint8 buffer.
+Frame-sized temporaries (conversion planes, RGB -> BGR copy for cv2, decode targets,
+thumbnails) come from a `BufferPool`, allocated once per stream instead of per frame.
+Backends are imported on first use, importing this module only costs numpy.
+"""
+import threading
+from functools import lru_cache
+from io import BytesIO
+from typing import Literal
+
+import numpy as np
+
+ImageFormat = Literal["jpeg", "png", "webp"]
+ImageBackend = Literal["auto", "pil", "cv2", "turbojpeg"]
+
+_PIL_FORMATS = {"jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}
+_CV2_EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+_turbojpeg = None
+
+
+@lru_cache(maxsize=None)
+def turbojpeg_module():
+    """PyTurboJPEG module, None if not installed (PyTurboJPEG and libjpeg-turbo are optional)."""
+    try:
+        import turbojpeg
+    except ImportError:
+        return None
+    return turbojpeg
+
+
+class BufferPool:
+    """
+    Reusable numpy buffers of a frame loop: get(name, shape, dtype) returns the same array for
+    the same name, shape and dtype, so a stream allocates its frame buffers once (cameras of
+    different sizes each get theirs). A buffer is overwritten by the next frame: encode (or
+    copy) it before. Not thread-safe, one pool per thread. `allocations` and
+    `allocated_bytes` count the real allocations (see benchmarks/image_encoders.py).
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0
+        self.allocated_bytes = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        key = (name, tuple(shape), np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = np.empty(shape, dtype=dtype)
+            self.allocations += 1
+            self.allocated_bytes += buffer.nbytes
+        return buffer
+
+
+def to_uint8_hwc(image, out=None, pool=None):
+    """
+    float [3,H,W] in [0, 1] (numpy or CPU torch tensor) -> contiguous uint8 [H,W,3],
+    `image * 255` truncated like `.astype(np.uint8)`, without float temporaries:
+    scale straight into uint8 planes, then interleave them (cv2.merge) into `out`.
+    pool: BufferPool of the planes and, without `out`, of the result.
+    uint8 [H,W,3] input is returned as is.
+    """
+    if hasattr(image, "numpy"):
+        image = image.numpy()
+    if image.dtype == np.uint8:
+        return image
+    import cv2
+    if pool is None:
+        planes = np.empty(image.shape, dtype=np.uint8)
+    else:
+        planes = pool.get("uint8_planes", image.shape)
+        if out is None:
+            out = pool.get("uint8_hwc", image.shape[1:] + image.shape[:1])
+    np.multiply(image, 255, out=planes, casting="unsafe")
+    return cv2.merge(list(planes), out)
+
+
+def encode_pil(image, image_format="jpeg", quality=75, bgr=False, pool=None):
+    from PIL import Image
+    if bgr:
+        image = image[..., ::-1]
+    buffer = BytesIO()
+    options = {"quality": quality} if image_format != "png" else {}
+    Image.fromarray(image).save(buffer, format=_PIL_FORMATS[image_format], **options)
+    return buffer.getbuffer()
+
+
+def encode_cv2(image, image_format="jpeg", quality=75, bgr=False, pool=None):
+    import cv2
+    if not bgr:
+        dst = pool.get("bgr", image.shape) if pool is not None else None
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=dst)
+    if image_format == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif image_format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        params = []
+    success, buffer = cv2.imencode(_CV2_EXTENSIONS[image_format], image, params)
+    if not success:
+        raise ValueError(f"cv2.imencode failed to encode {image_format}")
+    return buffer
+
+
+def encode_turbojpeg(image, image_format="jpeg", quality=75, bgr=False, pool=None):
+    global _turbojpeg
+    if image_format != "jpeg":
+        raise ValueError(f"turbojpeg only encodes jpeg, not {image_format}")
+    turbojpeg = turbojpeg_module()
+    if _turbojpeg is None:
+        _turbojpeg = turbojpeg.TurboJPEG()
+    return _turbojpeg.encode(image, quality=quality, pixel_format=turbojpeg.TJPF_BGR if bgr else turbojpeg.TJPF_RGB)
+
+
+# backend -> (encode function, supported formats)
+BACKENDS = {
+    "turbojpeg": (encode_turbojpeg, ("jpeg",)),
+    "cv2": (encode_cv2, ("jpeg", "png", "webp")),
+    "pil": (encode_pil, ("jpeg", "png", "webp")),
+}
+
+
+def available_backends(image_format: ImageFormat = "jpeg"):
+    """Installed backends that can encode `image_format`, fastest first."""
+    backends = []
+    for name, (_, formats) in BACKENDS.items():
+        if image_format not in formats:
+            continue
+        if name == "turbojpeg":
+            if turbojpeg_module() is None:
+                continue
+            try:
+                turbojpeg_module().TurboJPEG()
+            except (OSError, RuntimeError):  # python package without the libturbojpeg library
+                continue
+        backends.append(name)
+    return backends
+
+
+class ImageEncoder:
+    """
+    Picklable image compressor: only names are stored, the backend is resolved on first use
+    (so it can be passed to worker processes).
+    encode(image) -> JPEG/PNG/WebP bytes-like, of uint8 [H,W,3] RGB (or BGR if bgr=True).
+    Temporaries of the backend come from a BufferPool per thread (streams may share the encoder).
+    """
+
+    def __init__(self, image_format: ImageFormat = "jpeg", quality: int = 75, backend: ImageBackend = "auto"):
+        self.format = image_format
+        self.quality = quality
+        self.backend = backend
+        self._encode = None
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {"format": self.format, "quality": self.quality, "backend": self.backend}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _encode=None, _local=threading.local())
+
+    def pool(self):
+        """BufferPool of the calling thread."""
+        pool = getattr(self._local, "pool", None)
+        if pool is None:
+            pool = self._local.pool = BufferPool()
+        return pool
+
+    def _resolve(self):
+        backend = self.backend
+        if backend == "auto":
+            backend = available_backends(self.format)[0]
+        elif self.format not in BACKENDS[backend][1]:
+            raise ValueError(f"Image backend {backend} does not support {self.format}")
+        elif backend == "turbojpeg" and turbojpeg_module() is None:
+            raise ImportError("Image backend turbojpeg needs PyTurboJPEG: pip install PyTurboJPEG")
+        return BACKENDS[backend][0]
+
+    def encode(self, image, bgr=False):
+        if self._encode is None:
+            self._encode = self._resolve()
+        return self._encode(image, self.format, self.quality, bgr, self.pool())
@@ -0,0 +1,89 @@
+"""
+Build manifest: lets a builder skip outputs that are already up to date.
+
+`manifest.json` in the output directory records, for every output file:
+- input: fingerprint of the input files (relative path, size, mtime),
+- options: the builder options the file was built with,
+- size / mtime: of the output file, checked before an output is trusted (no content read,
+  like the input fingerprint).
+Several processes (batch shards, see tools/batch.py) may record into the same manifest:
+`record` merges its entry into the file on disk under an exclusive lock.
+"""
+import fcntl
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+MANIFEST_FILE = "manifest.json"
+
+
+def fingerprint(paths, root=None):
+    """Fingerprint of input files from their path, size and mtime (no content read)."""
+    entries = []
+    for path in sorted(str(p) for p in paths):
+        if not os.path.exists(path):
+            continue
+        stat = os.stat(path)
+        name = os.path.relpath(path, root) if root else path
+        entries.append([name, stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps(entries).encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    def __init__(self, output_dir):
+        self.output_dir = str(output_dir)
+        self.path = os.path.join(self.output_dir, MANIFEST_FILE)
+        self.entries = self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f).get("entries", {})
+
+    @contextmanager
+    def lock(self):
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def create(self):
+        """
+        Save an empty manifest if there is none yet, before the first output: the directory
+        is then accepted on a rerun, even if this run fails and leaves only partial files.
+        """
+        with self.lock():
+            if not self.exists():
+                self.save()
+
+    def is_up_to_date(self, name, input_fingerprint, options):
+        """True if `name` exists, unchanged since, and was built from the same inputs with the same options."""
+        entry = self.entries.get(name)
+        output = os.path.join(self.output_dir, name)
+        if entry is None or not os.path.exists(output):
+            return False
+        if entry["input"] != input_fingerprint or entry["options"] != options:
+            return False
+        stat = os.stat(output)
+        return stat.st_size == entry["size"] and stat.st_mtime_ns == entry.get("mtime")
+
+    def record(self, name, input_fingerprint, options):
+        """Record a freshly built output and save the manifest, with the entries other processes saved."""
+        stat = os.stat(os.path.join(self.output_dir, name))
+        entry = {"input": input_fingerprint, "options": options, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+        with self.lock():
+            self.entries = {**self.entries, **self.load(), name: entry}
+            self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.part"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": 1, "entries": self.entries}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
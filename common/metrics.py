@@ -0,0 +1,139 @@
+"""
+Per-stage timers and counters of the builders.
+
+- `Metrics.timer(stage)`: context manager adding the elapsed time (and one call) to `stage`.
+- `Metrics.count(name, n)`: cumulative counter (messages, bytes, frames, ...).
+- `NULL_METRICS`: disabled instance, every call is a no-op returning a shared object,
+  so instrumented hot paths cost one method call when metrics are off.
+
+A builder emits one `snapshot()` per episode / scene as a JSON line (`write_json_line`),
+and the run totals as a Prometheus textfile for node exporter (`write_prometheus`).
+Timers are cumulative: with threaded stages their sum can exceed the wall time.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+_NULL_TIMER = nullcontext()
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.add_time(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    enabled = True
+
+    def __init__(self):
+        self.timers = {}  # stage -> [seconds, calls]
+        self.counters = {}
+        self._lock = threading.Lock()  # stages may run in decoder threads
+
+    def timer(self, stage):
+        return _Timer(self, stage)
+
+    def add_time(self, stage, seconds, calls=1):
+        with self._lock:
+            entry = self.timers.get(stage)
+            if entry is None:
+                self.timers[stage] = [seconds, calls]
+            else:
+                entry[0] += seconds
+                entry[1] += calls
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        """Plain dict (picklable, JSON-able): {"timers": {stage: {"seconds", "calls"}}, "counters"}."""
+        with self._lock:
+            return {
+                "timers": {stage: {"seconds": s, "calls": c} for stage, (s, c) in sorted(self.timers.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def merge(self, snapshot):
+        """Add a snapshot (e.g. returned by a worker process) to these metrics."""
+        for stage, timer in snapshot["timers"].items():
+            self.add_time(stage, timer["seconds"], timer["calls"])
+        for name, n in snapshot["counters"].items():
+            self.count(name, n)
+
+
+class NullMetrics(Metrics):
+    enabled = False
+
+    def timer(self, stage):
+        return _NULL_TIMER
+
+    def add_time(self, stage, seconds, calls=1):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def make_metrics(enabled):
+    return Metrics() if enabled else NULL_METRICS
+
+
+def write_json_line(path, labels, snapshot, **fields):
+    """Append one record {"time", **labels, **fields, "timers", "counters"} to the JSON lines file."""
+    record = {"time": time.time(), **labels, **fields, **snapshot}
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def _prometheus_label_value(value):
+    """Label value escaped as the text exposition format requires: backslash, double quote, newline."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prometheus_labels(labels):
+    return ",".join(f'{key}="{_prometheus_label_value(value)}"' for key, value in labels.items())
+
+
+def write_prometheus(path, labels, snapshot, prefix="mcap_builder"):
+    """
+    Write the snapshot as a Prometheus textfile (node exporter textfile collector):
+    <prefix>_stage_seconds_total / <prefix>_stage_calls_total{stage=...} and
+    <prefix>_<counter>_total. Written to a temp file then renamed, as the collector expects.
+    """
+    lines = [
+        f"# HELP {prefix}_stage_seconds_total Cumulative time spent in a builder stage.",
+        f"# TYPE {prefix}_stage_seconds_total counter",
+    ]
+    for stage, timer in snapshot["timers"].items():
+        lines.append(f"{prefix}_stage_seconds_total{{{_prometheus_labels({**labels, 'stage': stage})}}} {timer['seconds']:.6f}")
+    lines += [
+        f"# HELP {prefix}_stage_calls_total Number of timed calls of a builder stage.",
+        f"# TYPE {prefix}_stage_calls_total counter",
+    ]
+    for stage, timer in snapshot["timers"].items():
+        lines.append(f"{prefix}_stage_calls_total{{{_prometheus_labels({**labels, 'stage': stage})}}} {timer['calls']}")
+    for name, value in snapshot["counters"].items():
+        metric = f"{prefix}_{name}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric}{{{_prometheus_labels(labels)}}} {value}"]
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
@@ -0,0 +1,121 @@
+"""
+Helpers to run message producers concurrently in front of a single writer.
+"""
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from threading import BoundedSemaphore, Event, Thread
+
+_DONE = object()
+
+
+def threaded_iter(iterators, workers, maxsize=64):
+    """
+    Consume `iterators` concurrently in a pool of `workers` threads and yield
+    their items as they are produced (order across iterators is not kept).
+    Meant for cv2 / PyAV / zstd work, which releases the GIL.
+    At most `maxsize` items wait in memory for the consumer.
+    An exception raised by an iterator is re-raised in the consumer.
+    """
+    iterators = list(iterators)
+    if not iterators:
+        return
+    queue = Queue(maxsize=maxsize)
+    stop = Event()
+
+    def drain(iterator):
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    break
+                queue.put(item)
+        except BaseException as e:
+            queue.put(e)
+        finally:
+            queue.put(_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = [executor.submit(drain, iterator) for iterator in iterators]
+    try:
+        remaining = len(iterators)
+        while remaining:
+            item = queue.get()
+            if item is _DONE:
+                remaining -= 1
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                yield item
+    finally:
+        # Consumer stopped early (error or close): unblock producers stuck on a full queue
+        stop.set()
+        for future in futures:
+            future.cancel()
+        while not all(future.done() for future in futures):
+            try:
+                queue.get(timeout=0.1)
+            except Empty:
+                pass
+        executor.shutdown()
+
+
+def merge_by_time(iterators, key):
+    """
+    k-way merge of iterators that are each sorted by `key` (e.g. log_time).
+    Lazy: the heap holds only the head item of each iterator.
+    """
+    return heapq.merge(*iterators, key=key)
+
+
+def prefetch(iterators, workers, maxsize=8):
+    """
+    Run every iterator ahead of the consumer in its own thread, into its own bounded
+    queue, and return one iterator per input, in the same order. Unlike threaded_iter
+    the streams stay separate, so they can be merged (see merge_by_time).
+    At most `workers` threads produce an item at the same time.
+    """
+    slots = BoundedSemaphore(workers)
+    stop = Event()
+
+    def put(queue, item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def drain(iterator, queue):
+        try:
+            iterator = iter(iterator)
+            while not stop.is_set():
+                # The slot only covers producing the item, never a wait on a full queue
+                with slots:
+                    item = next(iterator, _DONE)
+                if item is _DONE:
+                    break
+                put(queue, item)
+        except BaseException as e:
+            put(queue, e)
+        finally:
+            put(queue, _DONE)
+
+    def consume(queue):
+        try:
+            while True:
+                item = queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        except GeneratorExit:
+            stop.set()
+            raise
+
+    queues = []
+    for iterator in iterators:
+        queue = Queue(maxsize=maxsize)
+        Thread(target=drain, args=(iterator, queue), daemon=True).start()
+        queues.append(queue)
+    return [consume(queue) for queue in queues]
@@ -0,0 +1,117 @@
+"""
+Preview MCAP: a light copy of an output, `<name>.preview.mcap`, written in the same pass.
+
+- Camera frames already decoded for the full output are kept at `fps`, downscaled to
+  `width` pixels and compressed as low quality JPEG: nothing is decoded twice.
+- Other channels (joint states, TCP poses, vectors) are small and copied as-is.
+- Image channels without a thumbnail (video passthrough, depth, compressed rows written
+  without decoding) are left out.
+
+McapSink(..., preview=PreviewSink(...)) opens, closes and aborts the preview with the
+full output and mirrors every message to it (see McapSink.add).
+"""
+from common.encoding import Encoding, encode_compressed_image
+from common.image import ImageBackend, ImageEncoder
+from common.metrics import NULL_METRICS
+from common.sink import McapSink
+
+PREVIEW_SUFFIX = ".preview.mcap"
+IMAGE_SCHEMAS = ("foxglove.CompressedImage", "foxglove.CompressedVideo", "foxglove.RawImage")
+
+
+def preview_path(output_mcap):
+    """episode_0.mcap -> episode_0.preview.mcap"""
+    output_mcap = str(output_mcap)
+    base = output_mcap[:-len(".mcap")] if output_mcap.endswith(".mcap") else output_mcap
+    return base + PREVIEW_SUFFIX
+
+
+class FrameSampler:
+    """Keep the frames of one stream at most every 1/fps seconds, by timestamp (ms)."""
+
+    def __init__(self, fps):
+        self.period = 1000 / fps
+        self.next_ts = None
+
+    def keep(self, ts):
+        if self.next_ts is not None and ts < self.next_ts:
+            return False
+        # Next slot from the previous one, not from ts: no drift when fps does not divide the source rate
+        self.next_ts = ts if self.next_ts is None else self.next_ts + self.period
+        if self.next_ts <= ts:  # first frame, or after a gap in the stream
+            self.next_ts = ts + self.period
+        return True
+
+
+class Preview:
+    """
+    Picklable preview options (passed to worker processes with the image encoder).
+    message(...) -> thumbnail CompressedImage message of one decoded frame.
+    """
+
+    def __init__(self, fps: float = 5.0, width: int = 320, quality: int = 50, backend: ImageBackend = "auto"):
+        self.fps = fps
+        self.width = width
+        self.image_encoder = ImageEncoder("jpeg", quality, backend)
+
+    def options(self):
+        """Manifest options: a preview with other settings is rebuilt."""
+        return {"fps": self.fps, "width": self.width, "quality": self.image_encoder.quality}
+
+    def sampler(self):
+        return FrameSampler(self.fps)
+
+    def thumbnail(self, frame):
+        """
+        uint8 [H,W,C] frame downscaled to `width` (aspect ratio kept), never upscaled,
+        into a buffer of the encoder pool (valid until the next thumbnail of this thread).
+        """
+        height, width = frame.shape[:2]
+        if width <= self.width:
+            return frame
+        import cv2
+        size = (self.width, max(1, round(height * self.width / width)))
+        dst = self.image_encoder.pool().get("thumbnail", (size[1], size[0]) + frame.shape[2:])
+        return cv2.resize(frame, size, dst=dst, interpolation=cv2.INTER_AREA)
+
+    def message(self, encoding, ts, frame_id, frame, bgr=False):
+        image_data = self.image_encoder.encode(self.thumbnail(frame), bgr=bgr)
+        return encode_compressed_image(encoding, ts, frame_id, image_data, self.image_encoder.format)
+
+
+class PreviewSink(McapSink):
+    """Preview file of a McapSink: copies its non image messages, takes thumbnails of its image channels."""
+
+    def __init__(
+            self, output_mcap, options: Preview, encoding: Encoding = "json", metrics=NULL_METRICS, **sink_options
+    ):
+        """
+        metrics: those of the full output, thumbnails are timed there as "preview_encode".
+        sink_options: McapSink options (async_writes, ...).
+        """
+        super().__init__(preview_path(output_mcap), encoding, **sink_options)
+        self.options = options
+        self.source_metrics = metrics
+        self._samplers = {}
+
+    def sampler(self, topic):
+        """Frame sampler of `topic`, for builders that decode in the writer thread."""
+        sampler = self._samplers.get(topic)
+        if sampler is None:
+            sampler = self._samplers[topic] = self.options.sampler()
+        return sampler
+
+    def frame_message(self, topic, ts, frame_id, frame, bgr=False):
+        """Thumbnail message of a frame of `topic`, None if the preview fps drops it."""
+        if not self.sampler(topic).keep(ts):
+            return None
+        with self.source_metrics.timer("preview_encode"):
+            return self.options.message(self.encoding, ts, frame_id, frame, bgr)
+
+    def mirror(self, topic, schema_name, ts, data, preview_data=None):
+        """Copy one message of the full output; image channels only get their thumbnails."""
+        if schema_name in IMAGE_SCHEMAS:
+            if preview_data is None:
+                return
+            data = preview_data
+        self.add(self.channel_id(topic, schema_name), ts, data)
@@ -0,0 +1,21 @@
+"""
+Builder registry: name -> builder function, imported only when it is looked up.
+
+Builder modules keep their heavy dependencies (lerobot / torch, PyAV, OpenCV, h5py) out of
+module level, so `load_builder` (and a CLI `--help`) only costs the builder signature.
+"""
+from importlib import import_module
+
+# name -> (module, function, description)
+BUILDERS = {
+    "aloha_lerobot": ("aloha_lerobot.build", "mcap_builder", "LeRobotDataset to MCAP, one file per episode"),
+    "aloha_raw": ("aloha_raw.build", "mcap_builder", "raw ALOHA HDF5 episodes to MCAP, one file per episode"),
+    "rh20t": ("rh20t.build", "mcap_builder", "one RH20T scene to one MCAP file"),
+}
+
+
+def load_builder(name):
+    if name not in BUILDERS:
+        raise ValueError(f"Unknown builder {name}, expected one of {', '.join(BUILDERS)}")
+    module, function, _ = BUILDERS[name]
+    return getattr(import_module(module), function)
@@ -0,0 +1,220 @@
+"""
+Shard queue on a shared directory: lease files claimed by local processes or several machines.
+
+work_dir layout:
+- plan.json: the work units (JSON values) split in shards, written once by the first worker.
+- leases/<shard>.lease: claim of a running shard (owner, claim time), created with O_EXCL.
+  Its owner touches it every `heartbeat` seconds; a lease not touched for `lease_timeout`
+  seconds is stale (worker killed, node lost) and the shard is claimed again.
+- done/<shard>.json: result of a finished shard. failed/<shard>.json: errors of every attempt,
+  the shard is retried until `max_attempts`.
+
+Only file creation, rename and mtime are used, which are atomic on local filesystems and
+NFS. Outputs must be idempotent: a shard may run twice if its worker stalls past the lease
+timeout. lease_timeout should be several heartbeats, plus the clock skew between machines.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PLAN_FILE = "plan.json"
+
+
+def owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def write_json_atomic(path, value):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+    with open(tmp_path, "w") as f:
+        json.dump(value, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_json(path, default=None):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def make_plan(work_dir, units, shard_size):
+    """
+    Split `units` in shards of shard_size and write work_dir/plan.json, unless a plan is already
+    there (another worker or a previous run, which is then resumed). Return the plan in use.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    path = os.path.join(work_dir, PLAN_FILE)
+    plan = {
+        "shards": {
+            f"shard_{i // shard_size:06d}": units[i:i + shard_size] for i in range(0, len(units), shard_size)
+        },
+        "created_at": time.time(),
+    }
+    tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+    with open(tmp_path, "w") as f:
+        json.dump(plan, f, indent=2)
+    try:
+        # link fails if the plan exists: the first worker wins, even across machines
+        os.link(tmp_path, path)
+    except FileExistsError:
+        plan = read_json(path)
+    finally:
+        os.remove(tmp_path)
+    return plan
+
+
+class ShardQueue:
+    def __init__(self, work_dir, lease_timeout=600.0, heartbeat=30.0, max_attempts=3, owner=None):
+        self.work_dir = str(work_dir)
+        self.lease_timeout = lease_timeout
+        self.heartbeat_interval = heartbeat
+        self.max_attempts = max_attempts
+        self.owner = owner or owner_id()
+        plan = read_json(os.path.join(self.work_dir, PLAN_FILE))
+        if plan is None:
+            raise FileNotFoundError(f"No {PLAN_FILE} in {self.work_dir}, see make_plan")
+        self.shards = plan["shards"]
+        for name in ("leases", "done", "failed"):
+            os.makedirs(os.path.join(self.work_dir, name), exist_ok=True)
+
+    def _path(self, kind, shard):
+        suffix = ".lease" if kind == "leases" else ".json"
+        return os.path.join(self.work_dir, kind, f"{shard}{suffix}")
+
+    def is_done(self, shard):
+        return os.path.exists(self._path("done", shard))
+
+    def attempts(self, shard):
+        return len(read_json(self._path("failed", shard), []))
+
+    def is_stale(self, shard):
+        try:
+            return time.time() - os.stat(self._path("leases", shard)).st_mtime > self.lease_timeout
+        except FileNotFoundError:
+            return False
+
+    def _try_lease(self, shard):
+        path = self._path("leases", shard)
+        if self.is_stale(shard):
+            # Only one worker renames the stale lease away, the others get FileNotFoundError
+            stale_path = f"{path}.stale.{uuid.uuid4().hex}"
+            try:
+                os.rename(path, stale_path)
+            except FileNotFoundError:
+                return False
+            # Another worker reclaimed it between is_stale and rename: put its fresh lease back
+            fresh = time.time() - os.stat(stale_path).st_mtime <= self.lease_timeout
+            if fresh:
+                try:
+                    os.link(stale_path, path)
+                except FileExistsError:
+                    pass
+            os.remove(stale_path)
+            if fresh:
+                return False
+            logger.warning("Reclaim stale lease of %s", shard)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            json.dump({"owner": self.owner, "claimed_at": time.time()}, f)
+        return True
+
+    def lease_owner(self, shard):
+        lease = read_json(self._path("leases", shard))
+        return lease and lease.get("owner")
+
+    def pending(self):
+        """Shards neither done nor failed max_attempts times."""
+        return [
+            shard for shard in self.shards
+            if not self.is_done(shard) and self.attempts(shard) < self.max_attempts
+        ]
+
+    def claim(self, wait=True):
+        """
+        Lease a pending shard and return its name, or None once every shard is done / failed.
+        wait: while the remaining shards are leased by other workers, poll them (a stale lease is
+        claimed) instead of returning None.
+        """
+        while True:
+            pending = self.pending()
+            if not pending:
+                return None
+            for shard in pending:
+                if self._try_lease(shard):
+                    # done between pending() and the lease: release it
+                    if self.is_done(shard):
+                        self.release(shard)
+                        continue
+                    return shard
+            if not wait:
+                return None
+            time.sleep(min(self.heartbeat_interval, self.lease_timeout / 2))
+
+    @contextmanager
+    def heartbeat(self, shard):
+        """Touch the lease of `shard` every heartbeat seconds while the block runs."""
+        stop = threading.Event()
+        path = self._path("leases", shard)
+
+        def beat():
+            while not stop.wait(self.heartbeat_interval):
+                if self.lease_owner(shard) != self.owner:
+                    logger.warning("Lost lease of %s", shard)
+                    return
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def release(self, shard):
+        if self.lease_owner(shard) == self.owner:
+            try:
+                os.remove(self._path("leases", shard))
+            except FileNotFoundError:
+                pass
+
+    def complete(self, shard, result=None):
+        write_json_atomic(
+            self._path("done", shard), {"owner": self.owner, "finished_at": time.time(), "result": result}
+        )
+        self.release(shard)
+
+    def fail(self, shard, error):
+        errors = read_json(self._path("failed", shard), [])
+        errors.append({"owner": self.owner, "failed_at": time.time(), "error": str(error)})
+        write_json_atomic(self._path("failed", shard), errors)
+        self.release(shard)
+
+    def status(self):
+        """Shard counts: done, failed (max_attempts reached), leased (running or stale), waiting."""
+        counts = {"total": len(self.shards), "done": 0, "failed": 0, "leased": 0, "stale": 0, "waiting": 0}
+        for shard in self.shards:
+            if self.is_done(shard):
+                counts["done"] += 1
+            elif self.attempts(shard) >= self.max_attempts:
+                counts["failed"] += 1
+            elif os.path.exists(self._path("leases", shard)):
+                counts["stale" if self.is_stale(shard) else "leased"] += 1
+            else:
+                counts["waiting"] += 1
+        return counts
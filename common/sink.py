@@ -0,0 +1,340 @@
+"""
+McapSink: the single write path of every builder.
+
+- Each schema and each topic is registered once per file, ids are cached.
+- Messages are pre-serialized bytes (see common.encoding), timestamps in milliseconds.
+- `add_batch` writes a whole list of messages of one channel in one call.
+- `JointStateBlock` serializes the joint states of frame-by-frame loops a block of frames
+  at a time (encode_joint_states), messages are still written in their original order.
+- `copy_channel` / `add_record` copy channels and messages read from another MCAP file
+  (schema bytes, nanosecond times and sequence kept), for the tools that cut files.
+- The file is written as `<output_path>.part` and renamed on close, so a crashed
+  build never leaves a file that looks complete. Writes go through a `write_buffer`
+  (8 MiB) buffer: few large sequential writes, which network filesystems handle best.
+- async_writes=True: `AsyncWriter` runs the mcap writer (chunk compression, file writes,
+  the summary) in a background thread fed by a bounded queue, so disk I/O overlaps the
+  decoding / encoding of the next frames. Same file, byte for byte.
+- `preview` (common.preview.PreviewSink) gets a copy of every message, thumbnails instead
+  of the images, and is finished or dropped with the full file.
+- `metrics` (common.metrics) times the writes ("mcap_write", which includes chunk
+  compression; with async_writes only the enqueueing, the thread time is "mcap_write_thread")
+  and the summary ("mcap_finish"), and counts messages and bytes.
+"""
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from common.encoding import Encoding, MESSAGE_ENCODING, encode_joint_states, schema_for
+from common.metrics import NULL_METRICS
+
+
+WRITE_BUFFER = 8 << 20
+
+
+def frame_timestamp(start_ts, index, fps):
+    """Timestamp (ms) of frame `index` of a `fps` stream starting at `start_ts` (ms), without drift."""
+    return start_ts + round(index * 1000 / fps)
+
+
+def add_messages(writer, channel_id, log_times, messages):
+    """Messages of one channel, times in nanoseconds, to a mcap writer."""
+    add_message = writer.add_message
+    for log_time, data in zip(log_times, messages):
+        add_message(channel_id=channel_id, log_time=log_time, publish_time=log_time, data=data)
+
+
+class AsyncWriter:
+    """
+    mcap.writer.Writer driven by a background thread: calls are queued (at most queue_size,
+    the producer waits when the writer falls behind) and run in order by the thread, which
+    does the chunk compression and the file writes. Schema / channel ids are numbered here
+    the way Writer numbers them (1, 2, ...), so register_* return at once.
+    An error of the thread is raised by the next call, or by finish.
+    Queued message data must not change afterwards (bytes, as common.encoding returns).
+    """
+
+    def __init__(self, writer, queue_size=256, metrics=NULL_METRICS):
+        self.writer = writer
+        self.metrics = metrics
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._aborted = False
+        self._schema_count = 0
+        self._channel_count = 0
+        self._thread = threading.Thread(target=self._run, name="mcap-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while (item := self._queue.get()) is not None:
+            if self._error is not None or self._aborted:
+                continue  # keep draining: a producer never waits on a dead writer
+            function, args = item
+            start = time.perf_counter()
+            try:
+                function(*args)
+            except BaseException as e:
+                self._error = e
+            self.metrics.add_time("mcap_write_thread", time.perf_counter() - start)
+
+    def _submit(self, function, *args):
+        if self._error is not None:
+            raise self._error
+        self._queue.put((function, args))
+
+    @staticmethod
+    def _register(register, expected_id, *args):
+        registered_id = register(*args)
+        if registered_id != expected_id:
+            raise RuntimeError(f"mcap writer registered id {registered_id}, expected {expected_id}")
+
+    def register_schema(self, name, encoding, data):
+        self._schema_count += 1
+        self._submit(self._register, self.writer.register_schema, self._schema_count, name, encoding, data)
+        return self._schema_count
+
+    def register_channel(self, topic, message_encoding, schema_id, metadata=None):
+        self._channel_count += 1
+        self._submit(
+            self._register, self.writer.register_channel, self._channel_count,
+            topic, message_encoding, schema_id, metadata or {},
+        )
+        return self._channel_count
+
+    def add_message(self, channel_id, log_time, data, publish_time, sequence=0):
+        self._submit(self.writer.add_message, channel_id, log_time, data, publish_time, sequence)
+
+    def add_messages(self, channel_id, log_times, messages):
+        """A whole batch as one queue item."""
+        self._submit(add_messages, self.writer, channel_id, log_times, messages)
+
+    def finish(self):
+        """Queue the summary, wait until the thread has written everything."""
+        self._submit(self.writer.finish)
+        self._stop()
+        if self._error is not None:
+            raise self._error
+
+    def abort(self):
+        """End the thread, dropping what is still queued."""
+        self._aborted = True
+        self._stop()
+
+    def _stop(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+class McapSink:
+    def __init__(
+            self, output_path, encoding: Encoding = "json", metrics=NULL_METRICS, preview=None,
+            async_writes=False, queue_size=256, write_buffer=WRITE_BUFFER, **writer_options
+    ):
+        """
+        output_path: MCAP file to create (atomically, see `close`).
+        encoding: message encoding of every channel of this file.
+        metrics: common.metrics.Metrics shared with the builder stages (disabled by default).
+        preview: common.preview.PreviewSink written along (None: no preview).
+        async_writes: write from a background thread (AsyncWriter), queue_size messages in flight.
+        write_buffer: size of the file buffer, in bytes.
+        writer_options: forwarded to `mcap.writer.Writer` (chunk_size, compression, ...).
+        """
+        self.output_path = output_path
+        self.encoding = encoding
+        self.message_encoding = MESSAGE_ENCODING[encoding]
+        self.metrics = metrics
+        self.preview = preview
+        self.async_writes = async_writes
+        self.queue_size = queue_size
+        self.write_buffer = write_buffer
+        self.writer_options = writer_options
+        self.writer = None
+        self.part_path = f"{output_path}.part"
+        self._file = None
+        self._schemas = {}
+        self._channels = {}
+        self._channel_keys = {}  # channel id -> (topic, schema name), for the preview
+
+    def open(self):
+        from mcap.writer import Writer
+
+        self._file = open(self.part_path, "wb", buffering=self.write_buffer)
+        self.writer = Writer(self._file, **self.writer_options)
+        self.writer.start()
+        if self.async_writes:
+            self.writer = AsyncWriter(self.writer, self.queue_size, self.metrics)
+        if self.preview is not None:
+            self.preview.open()
+        return self
+
+    def close(self):
+        """
+        Write the summary (after the queued messages with async_writes), then rename the
+        .part file to `output_path`.
+        """
+        try:
+            with self.metrics.timer("mcap_finish"):
+                self.writer.finish()
+                self._file.flush()
+                os.fsync(self._file.fileno())
+        except BaseException:
+            self.abort()
+            raise
+        self._file.close()
+        os.replace(self.part_path, self.output_path)
+        if self.preview is not None:
+            self.preview.close()
+
+    def abort(self):
+        """Drop the unfinished .part file (and the preview one)."""
+        if isinstance(self.writer, AsyncWriter):
+            self.writer.abort()
+        self._file.close()
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+        if self.preview is not None and self.preview.writer is not None:
+            self.preview.abort()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def schema_id(self, schema_name):
+        schema_id = self._schemas.get(schema_name)
+        if schema_id is None:
+            schema_id = self.writer.register_schema(**schema_for(schema_name, self.encoding))
+            self._schemas[schema_name] = schema_id
+        return schema_id
+
+    def channel_id(self, topic, schema_name):
+        channel_id = self._channels.get(topic)
+        if channel_id is None:
+            channel_id = self.writer.register_channel(
+                topic=topic,
+                message_encoding=self.message_encoding,
+                schema_id=self.schema_id(schema_name)
+            )
+            self._channels[topic] = channel_id
+            self._channel_keys[channel_id] = (topic, schema_name)
+        return channel_id
+
+    def add(self, channel_id, ts, data, preview_data=None):
+        """
+        Write one serialized message, `ts` in milliseconds.
+        preview_data: thumbnail message written to the preview instead of an image `data`.
+        """
+        timestamp = int(ts) * 1_000_000
+        with self.metrics.timer("mcap_write"):
+            self.writer.add_message(
+                channel_id=channel_id,
+                log_time=timestamp,
+                publish_time=timestamp,
+                data=data
+            )
+        self.metrics.count("messages")
+        self.metrics.count("message_bytes", len(data))
+        if self.preview is not None:
+            self.preview.mirror(*self._channel_keys[channel_id], ts, data, preview_data)
+
+    def add_batch(self, channel_id, timestamps, messages):
+        """Write serialized `messages` of one channel, `timestamps` in milliseconds."""
+        start = time.perf_counter()
+        log_times = [int(ts) * 1_000_000 for ts in timestamps]
+        messages = list(messages)
+        if isinstance(self.writer, AsyncWriter):
+            self.writer.add_messages(channel_id, log_times, messages)
+        else:
+            add_messages(self.writer, channel_id, log_times, messages)
+        n = min(len(log_times), len(messages))
+        size = sum(len(data) for data in messages[:n])
+        self.metrics.add_time("mcap_write", time.perf_counter() - start, n)
+        self.metrics.count("messages", n)
+        self.metrics.count("message_bytes", size)
+        if self.preview is not None:
+            topic, schema_name = self._channel_keys[channel_id]
+            self.preview.add_batch(self.preview.channel_id(topic, schema_name), timestamps, messages)
+
+    def copy_channel(self, schema, channel):
+        """Register `channel` and its `schema` (mcap records of another file) as-is, return the channel id."""
+        channel_id = self._channels.get(channel.topic)
+        if channel_id is None:
+            schema_id = 0
+            if schema is not None:
+                key = (schema.name, schema.encoding, schema.data)
+                schema_id = self._schemas.get(key)
+                if schema_id is None:
+                    schema_id = self.writer.register_schema(schema.name, schema.encoding, schema.data)
+                    self._schemas[key] = schema_id
+            channel_id = self.writer.register_channel(
+                topic=channel.topic,
+                message_encoding=channel.message_encoding,
+                schema_id=schema_id,
+                metadata=channel.metadata,
+            )
+            self._channels[channel.topic] = channel_id
+        return channel_id
+
+    def add_record(self, channel_id, message):
+        """Write `message` (mcap.records.Message of another file), times in nanoseconds kept."""
+        with self.metrics.timer("mcap_write"):
+            self.writer.add_message(
+                channel_id=channel_id,
+                log_time=message.log_time,
+                publish_time=message.publish_time,
+                data=message.data,
+                sequence=message.sequence,
+            )
+        self.metrics.count("messages")
+        self.metrics.count("message_bytes", len(message.data))
+
+
+class JointStateBlock:
+    """
+    Messages of a frame-by-frame loop, held for `frames` frames then written to `sink` in
+    the order they were added. Joint states of the block are serialized per channel by one
+    encode_joint_states call (one json template pass instead of a dict and json.dumps per
+    message); other messages are added already serialized.
+    """
+
+    def __init__(self, sink, frames=64):
+        self.sink = sink
+        self.frames = frames
+        self._messages = []  # (channel_id, ts, data or row of the channel joint states, preview_data)
+        self._joint_states = {}  # channel_id -> ([ts], [values])
+        self._frame_count = 0
+
+    def add(self, channel_id, ts, data, preview_data=None):
+        self._messages.append((channel_id, ts, data, preview_data))
+
+    def add_joint_state(self, channel_id, ts, values):
+        """`values` is copied: rows read into a reused buffer stay valid until the flush."""
+        timestamps, rows = self._joint_states.setdefault(channel_id, ([], []))
+        self._messages.append((channel_id, ts, len(rows), None))
+        timestamps.append(ts)
+        rows.append(np.array(values))
+
+    def end_frame(self):
+        self._frame_count += 1
+        if self._frame_count >= self.frames:
+            self.flush()
+
+    def flush(self):
+        with self.sink.metrics.timer("serialize"):
+            encoded = {
+                channel_id: encode_joint_states(self.sink.encoding, timestamps, np.stack(rows))
+                for channel_id, (timestamps, rows) in self._joint_states.items()
+            }
+        for channel_id, ts, data, preview_data in self._messages:
+            if isinstance(data, int):
+                data = encoded[channel_id][data]
+            self.sink.add(channel_id, ts, data, preview_data)
+        self._messages, self._joint_states, self._frame_count = [], {}, 0
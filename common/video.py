@@ -0,0 +1,84 @@
+"""
+Video passthrough: demux MP4 packets as foxglove.CompressedVideo frames, without re-encoding.
+PyAV is imported on first use.
+
+Packets are written in decode order with the timestamp of the frame they carry, which is
+monotonic only without B-frames (decode order = presentation order). Streams with B-frames
+are rejected: their timestamps would go backwards (the log-time merge needs sorted streams)
+and Foxglove, which replays by log time, could not decode them.
+"""
+
+# codec -> (foxglove.CompressedVideo format, bitstream filter to Annex B)
+VIDEO_FORMATS = {
+    "h264": ("h264", "h264_mp4toannexb"),
+    "hevc": ("h265", "hevc_mp4toannexb"),
+    "av1": ("av1", None),
+    "vp9": ("vp9", None),
+}
+
+AV1_OBU_SEQUENCE_HEADER = 1
+
+
+def iter_video_packets(video_path):
+    """
+    Yield (frame_index, data, format) for every packet of the first video stream, in decode order.
+    - frame_index: presentation index computed from pts, to look up per-frame timestamps.
+    - data: Annex B for h264/h265, OBUs with the sequence header on keyframes for av1.
+    Raise ValueError on a stream with B-frames (packets out of presentation order).
+    """
+    import av
+    from av.bitstream import BitStreamFilterContext
+
+    with av.open(str(video_path)) as container:
+        stream = container.streams.video[0]
+        codec = stream.codec_context.codec.canonical_name
+        if codec not in VIDEO_FORMATS:
+            raise ValueError(f"Video passthrough does not support codec {codec}: {video_path}")
+        video_format, bsf_name = VIDEO_FORMATS[codec]
+        if stream.codec_context.has_b_frames:
+            raise ValueError(b_frames_error(video_path))
+
+        bsf = BitStreamFilterContext(bsf_name, stream) if bsf_name else None
+        extradata = stream.codec_context.extradata or b""
+        # av1C record: 4 bytes header, then the config OBUs (sequence header)
+        av1_config_obus = extradata[4:] if codec == "av1" else b""
+
+        start_pts = stream.start_time or 0
+        frame_duration = 1 / (stream.average_rate * stream.time_base) if stream.average_rate else None
+        counter = 0
+        last_index = -1
+
+        def packets():
+            for packet in container.demux(stream):
+                if packet.size == 0:
+                    continue
+                yield from bsf.filter(packet) if bsf else (packet,)
+            if bsf:
+                yield from bsf.filter(None)
+
+        for packet in packets():
+            if packet.pts is not None and frame_duration:
+                frame_index = round((packet.pts - start_pts) / frame_duration)
+            else:
+                frame_index = counter
+            counter += 1
+            # has_b_frames is not always set by the container: check the order itself
+            if frame_index < last_index:
+                raise ValueError(b_frames_error(video_path))
+            last_index = frame_index
+
+            data = bytes(packet)
+            if (
+                av1_config_obus
+                and packet.is_keyframe
+                and (data[0] >> 3) & 0x0F != AV1_OBU_SEQUENCE_HEADER
+            ):
+                data = av1_config_obus + data
+            yield frame_index, data, video_format
+
+
+def b_frames_error(video_path):
+    return (
+        f"{video_path} has B-frames: its packets are not in presentation order, "
+        "video passthrough cannot timestamp them, use video = 'reencode'"
+    )
@@ -1,7 +1,37 @@
-from rh20t import mcap_builder
+"""
+Single entry point of every builder (see common/registry.py).
+
+    $ export PYTHONPATH=/project/path
+    $ python main.py --help
+    $ python main.py rh20t --output-mcap output.mcap --scene-path raw_data/task_0001_user_0016_scene_0001_cfg_0003
+    $ python main.py aloha_lerobot --dataset-path path/to/aloha_mobile_cabinet --output-path output_aloha
+
+Only the selected builder is imported, and its heavy dependencies only once it runs.
+"""
+import sys
+
+from common.registry import BUILDERS, load_builder
+
+
+def usage():
+    lines = ["usage: main.py BUILDER [--help | builder options]", "", "builders:"]
+    lines += [f"  {name:16s} {description}" for name, (_, _, description) in BUILDERS.items()]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in BUILDERS:
+        print(usage())
+        return 0 if argv and argv[0] in ("-h", "--help") else 2
+    import tyro
+
+    builder = load_builder(argv[0])
+    result = tyro.cli(builder, args=argv[1:], prog=f"main.py {argv[0]}")
+    if isinstance(result, str):
+        print(result)
+    return 0
+
 
 if __name__ == '__main__':
-    output_mcap = "output3.mcap"
-    # scene_path = "raw_data/task_0004_user_0016_scene_0003_cfg_0003"
-    scene_path = "raw_data/task_0001_user_0016_scene_0001_cfg_0003"
-    mcap_builder(output_mcap, scene_path)
+    sys.exit(main())
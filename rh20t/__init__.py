@@ -1 +1,6 @@
-from .build import mcap_builder
+def __getattr__(name):
+    # mcap_builder is imported on first access: importing the package stays cheap
+    if name == "mcap_builder":
+        from .build import mcap_builder
+        return mcap_builder
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,76 +1,231 @@
 import os
-import json
 import glob
-import cv2
-import base64
+import time
 import numpy as np
-from mcap.writer import Writer
-from rh20t.config import COLOR, DEPTH, compressed_image_schema_data, xyz_quat_schema_data, schema_mapping
+from itertools import chain
+from typing import Literal, Optional
+from rh20t.config import BATCH_SCHEMA, COLOR, DEPTH, HIGH_FREQ_MODALITIES, schema_mapping
+from common.catalog import Catalog
+from common.image import ImageBackend, ImageEncoder, ImageFormat
+from common.manifest import Manifest, fingerprint
+from common.metrics import NULL_METRICS, make_metrics, write_json_line, write_prometheus
+from common.encoding import (
+    Encoding,
+    encode_compressed_image,
+    encode_compressed_video,
+    encode_poses,
+    encode_raw_image,
+    encode_vector_batch,
+    encode_vectors,
+)
+from common.preview import Preview, PreviewSink, preview_path
+from common.sink import McapSink
+from common.pipeline import merge_by_time, prefetch, threaded_iter
+from common.video import iter_video_packets
+from rh20t.depth import iter_depth_batches
+from rh20t.samples import load_samples
 
 
-def mcap_builder(output_mcap, scene_path):
-    with open(output_mcap, "wb") as f:
-        writer = Writer(f)
-        writer.start()
-        schema = {}
-
-        xyz_quat_schema_id = writer.register_schema(
-            name="GripperPose",
-            encoding="jsonschema",
-            data=json.dumps(xyz_quat_schema_data).encode("utf-8")
-        )
+def mcap_builder(
+        output_mcap: str,
+        scene_path: str,
+        encoding: Encoding = "json",
+        video: Literal["reencode", "passthrough"] = "reencode",
+        depth_format: Literal["png", "raw"] = "png",
+        workers: int = 1,
+        time_order: bool = True,
+        image_format: ImageFormat = "png",
+        image_quality: int = 75,
+        image_backend: ImageBackend = "auto",
+        preview: bool = False,
+        preview_fps: float = 5.0,
+        preview_width: int = 320,
+        preview_quality: int = 50,
+        sample_batch: int = 100,
+        decimate: int = 1,
+        async_writes: bool = False,
+        force: bool = False,
+        metrics_path: Optional[str] = None,
+        prometheus_path: Optional[str] = None,
+):
+    """
+    Transform one RH20T scene to a MCAP file.
+    - encoding: message encoding of all channels (json, protobuf or cdr).
+      Binary encodings store images as raw bytes instead of base64.
+    - video: "reencode" decodes color.mp4 and writes PNG frames, "passthrough" writes
+      the MP4 packets as foxglove.CompressedVideo without decoding.
+      Videos with B-frames are rejected (their packets are out of presentation order).
+      Depth is always decoded (16-bit depth is packed into two 8-bit halves).
+    - depth_format: "png" (16-bit PNG CompressedImage) or "raw" (16UC1 RawImage,
+      compressed losslessly by the MCAP zstd chunks instead of PNG).
+    - workers > 1: decode/encode every camera stream (color, depth) in a thread pool,
+      a single writer writes messages as they are ready.
+    - time_order: merge all streams (TCP, color, depth) by log time before writing, so MCAP
+      chunks cover disjoint time ranges and readers can seek by time. If False, streams
+      are written one after another (or as produced, with workers > 1).
+    - image_format / image_quality / image_backend: compression of reencoded color frames
+      (default lossless PNG, "jpeg" is several times smaller and faster).
+    - preview: also write <output>.preview.mcap in the same pass (common/preview.py): color
+      frames at preview_fps, preview_width pixels wide, JPEG preview_quality, and the
+      transformed/*.npy channels as-is. Thumbnails come from the frames decoded for the
+      full file (no color with video = "passthrough", no depth).
+    - transformed/*.npy: tcp / tcp_base as GripperPose, joint / gripper as Vector (one message
+      per sample), high_freq_data / force_torque / force_torque_base (kHz) as VectorBatch of
+      sample_batch samples per message (sample_batch <= 1: one Vector per sample).
+    - decimate: keep one kHz sample out of `decimate` (preview builds).
+    - async_writes = True: MCAP chunk compression and file writes run in a background thread
+      (common/sink.py AsyncWriter), overlapping decoding and encoding; the file is the same.
+    - The output is recorded in `manifest.json` next to it (scene fingerprint, options,
+      output size and mtime); a rerun skips the scene if it is up to date, unless force = True.
+    - Its channels are recorded in `catalog.sqlite` next to it (source: scene name),
+      see common/catalog.py.
+    - metrics_path: append the scene stage timers and counters (transformed load, video decode,
+      depth decode, image encode, serialize, MCAP write/finish) as one JSON line.
+    - prometheus_path: write them as a Prometheus textfile (node exporter), one per scene:
+      <name>.<scene>.prom next to prometheus_path, so concurrent scenes (tools/batch.py) do not
+      overwrite each other and the collector exports them all.
+      Without metrics_path / prometheus_path, instrumentation is disabled.
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_mcap))
+    mcap_name = os.path.basename(output_mcap)
+    manifest = Manifest(output_dir)
+    image_encoder = ImageEncoder(image_format, image_quality, image_backend)
+    options = {
+        "encoding": encoding, "video": video, "depth_format": depth_format, "time_order": time_order,
+        "image_format": image_format, "image_quality": image_quality,
+        "sample_batch": sample_batch, "decimate": decimate,
+    }
+    preview_options = Preview(preview_fps, preview_width, preview_quality, image_backend) if preview else None
+    if preview_options is not None:
+        options["preview"] = preview_options.options()
+    input_fingerprint = fingerprint(scene_inputs(scene_path), root=scene_path)
+    if (
+            not force and manifest.is_up_to_date(mcap_name, input_fingerprint, options)
+            and (not preview or os.path.exists(preview_path(output_mcap)))
+    ):
+        print(f"Skip {output_mcap}: up to date")
+        return
 
+    metrics = make_metrics(bool(metrics_path or prometheus_path))
+    scene_start_time = time.time()
+    preview_sink = None
+    if preview:
+        preview_sink = PreviewSink(output_mcap, preview_options, encoding, metrics, async_writes=async_writes)
+    with McapSink(output_mcap, encoding, metrics=metrics, preview=preview_sink, async_writes=async_writes) as sink:
         transformed_files = glob.glob(f"{os.path.join(scene_path, 'transformed')}/*.npy")
-        for transformed_file in transformed_files:
-            transform_data(writer, transformed_file, xyz_quat_schema_id)
-        image_schema_id = writer.register_schema(
-            name="foxglove.CompressedImage",
-            encoding="jsonschema",
-            data=json.dumps(compressed_image_schema_data).encode("utf-8")
+        if not time_order:
+            for transformed_file in transformed_files:
+                transform_data(sink, transformed_file, sample_batch, decimate)
+            streams = camera_streams(scene_path, encoding, video, depth_format, image_encoder, metrics, preview_options)
+        else:
+            streams = [
+                iter_transform_data(f, encoding, sample_batch, decimate, metrics) for f in transformed_files
+            ]
+            streams += camera_streams(
+                scene_path, encoding, video, depth_format, image_encoder, metrics, preview_options
+            )
+
+        if time_order:
+            if workers > 1:
+                streams = prefetch(streams, workers)
+            messages = merge_by_time(streams, key=message_time)
+        elif workers > 1:
+            messages = threaded_iter(streams, workers)
+        else:
+            messages = chain.from_iterable(streams)
+        write_messages(sink, messages)
+    manifest.record(mcap_name, input_fingerprint, options)
+    scene_name = os.path.basename(os.path.normpath(scene_path))
+    with Catalog(output_dir) as catalog:
+        catalog.record(output_mcap, source=scene_name, builder="rh20t")
+
+    if metrics.enabled:
+        labels = {"builder": "rh20t", "scene": scene_name}
+        if metrics_path:
+            write_json_line(metrics_path, {**labels, "output": output_mcap}, metrics.snapshot(),
+                            seconds=time.time() - scene_start_time)
+        if prometheus_path:
+            write_prometheus(scene_prometheus_path(prometheus_path, scene_name), labels, metrics.snapshot())
+
+
+def scene_inputs(scene_path):
+    """Files a scene MCAP is built from: transformed/*.npy and every cam_* file."""
+    paths = glob.glob(os.path.join(scene_path, "transformed", "*.npy"))
+    paths += glob.glob(os.path.join(scene_path, "cam_*", "*"))
+    return paths
+
+
+def scene_prometheus_path(prometheus_path, scene_name):
+    """<name>.<scene>.prom: the Prometheus textfile of one scene, next to prometheus_path."""
+    root, ext = os.path.splitext(prometheus_path)
+    return f"{root}.{scene_name}{ext or '.prom'}"
+
+
+def transform_data(sink, file_path, sample_batch=100, decimate=1):
+    for topic, schema_name, timestamps, messages in transform_streams(
+            file_path, sink.encoding, sample_batch, decimate, sink.metrics
+    ):
+        sink.add_batch(sink.channel_id(topic, schema_name), timestamps, messages)
+
+
+def iter_transform_data(file_path, encoding: Encoding = "json", sample_batch=100, decimate=1, metrics=NULL_METRICS):
+    """Same messages as transform_data, one (topic, schema_name, ts, message_data) stream sorted by ts."""
+    messages = [
+        (topic, schema_name, ts, message_data)
+        for topic, schema_name, timestamps, stream in transform_streams(
+            file_path, encoding, sample_batch, decimate, metrics
         )
-        camera_dirs = glob.glob(os.path.join(scene_path, "cam_*"))
-
-        for cam_dir in camera_dirs:
-            ts_dict = load_camera_timestamps(cam_dir)
-            add_color_frames_from_cam(writer=writer, cam_folder=cam_dir, timestamps=ts_dict, image_schema_id=image_schema_id)
-            add_depth_frames_from_cam(writer=writer, cam_folder=cam_dir, timestamps=ts_dict, image_schema_id=image_schema_id)
-        writer.finish()
-
-def transform_data(writer, file_path, schema_id):
-    if "tcp_base" in file_path:
-        if not file_path.endswith(".npy"):
-            return
-        file_name = os.path.basename(file_path).replace(".npy", "")
-        data = np.load(file_path, allow_pickle=True).item()
+        for ts, message_data in zip(timestamps, stream)
+    ]
+    messages.sort(key=message_time)
+    yield from messages
+
+
+def transform_streams(file_path, encoding: Encoding = "json", sample_batch=100, decimate=1, metrics=NULL_METRICS):
+    """
+    Serialized messages of one transformed/<modality>.npy, as
+    [(topic, schema_name, timestamps, messages)], one entry per serial (and field).
+    Modalities missing from rh20t.config.schema_mapping are skipped.
+    """
+    if not file_path.endswith(".npy"):
+        return []
+    modality = os.path.basename(file_path)[:-len(".npy")]
+    if modality not in schema_mapping:
+        return []
+
+    streams = []
+    if schema_mapping[modality] == "GripperPose":
+        with metrics.timer("transformed_load"):
+            data = np.load(file_path, allow_pickle=True).item()
         for cam_serial_number, entries in data.items():
-            data_channel_id = writer.register_channel(
-                topic=f"/data/{cam_serial_number}/{file_name}",
-                message_encoding="json",
-                schema_id=schema_id
-            )
-            for entry in entries:
-                timestamp = entry["timestamp"]
-                tcp_pose = entry["tcp"]
-                data = {
-                    "timestamp": timestamp,
-                    "position": {
-                        "x": tcp_pose[0],
-                        "y": tcp_pose[1],
-                        "z": tcp_pose[2]
-                    },
-                    "orientation": {
-                        "x": tcp_pose[3],
-                        "y": tcp_pose[4],
-                        "z": tcp_pose[5],
-                        "w": tcp_pose[6]
-                    }
-                }
-                writer.add_message(
-                    channel_id=data_channel_id,
-                    log_time=timestamp* 1_000_000,
-                    publish_time=timestamp* 1_000_000,
-                    data=json.dumps(data).encode("utf-8")
-                )
+            timestamps = [entry["timestamp"] for entry in entries]
+            with metrics.timer("serialize"):
+                messages = encode_poses(encoding, timestamps, [entry["tcp"] for entry in entries])
+            streams.append((f"/data/{cam_serial_number}/{modality}", "GripperPose", timestamps, messages))
+        return streams
+
+    with metrics.timer("transformed_load"):
+        samples = load_samples(file_path)
+    high_freq = modality in HIGH_FREQ_MODALITIES
+    for serial, field, timestamps, values in samples:
+        topic = f"/data/{serial}/{modality}" + (f"/{field}" if field else "")
+        if high_freq and decimate > 1:
+            timestamps, values = timestamps[::decimate], values[::decimate]
+        with metrics.timer("serialize"):
+            if high_freq and sample_batch > 1:
+                # N samples per message: message count and index size divided by sample_batch
+                messages = [
+                    encode_vector_batch(encoding, timestamps[i:i + sample_batch], values[i:i + sample_batch])
+                    for i in range(0, len(timestamps), sample_batch)
+                ]
+                streams.append((topic, BATCH_SCHEMA, timestamps[::sample_batch], messages))
+            else:
+                streams.append((topic, "Vector", timestamps, encode_vectors(encoding, timestamps, values)))
+    return streams
+
+
+def message_time(message):
+    return message[2]
 
 
 def load_camera_timestamps(cam_folder):
@@ -79,130 +234,145 @@ def load_camera_timestamps(cam_folder):
     return timestamps.item()
 
 
-def add_color_frames_from_cam(writer, cam_folder, timestamps, image_schema_id):
+def camera_streams(
+        scene_path, encoding: Encoding = "json", video="reencode", depth_format="png", image_encoder=None,
+        metrics=NULL_METRICS, preview=None
+):
+    """
+    One message iterator per camera and modality, each yields (topic, schema_name, ts, message_data).
+    Iterators are lazy: nothing is decoded before they are consumed.
+    preview: common.preview.Preview options, color frames then also yield the thumbnail
+    message (or None) as a fifth item.
+    """
+    streams = []
+    camera_dirs = glob.glob(os.path.join(scene_path, "cam_*"))
+    for cam_dir in camera_dirs:
+        ts_dict = load_camera_timestamps(cam_dir)
+        if video == "passthrough":
+            streams.append(iter_color_packets(cam_dir, ts_dict, encoding, metrics))
+        else:
+            streams.append(iter_color_frames(cam_dir, ts_dict, encoding, image_encoder, metrics, preview))
+        streams.append(iter_depth_frames(cam_dir, ts_dict, encoding, depth_format=depth_format, metrics=metrics))
+    return streams
+
+
+def write_messages(sink, messages):
+    # Optional fifth item: thumbnail message for the preview file
+    for topic, schema_name, ts, message_data, *preview_data in messages:
+        sink.add(sink.channel_id(topic, schema_name), ts, message_data, *preview_data)
+
+
+def add_color_frames_from_cam(sink, cam_folder, timestamps, image_encoder=None):
+    write_messages(sink, iter_color_frames(cam_folder, timestamps, sink.encoding, image_encoder))
+
+
+def add_color_packets_from_cam(sink, cam_folder, timestamps):
+    write_messages(sink, iter_color_packets(cam_folder, timestamps, sink.encoding))
+
+
+def add_depth_frames_from_cam(sink, cam_folder, timestamps, size=(640, 360), depth_format="png"):
+    write_messages(sink, iter_depth_frames(cam_folder, timestamps, sink.encoding, size, depth_format))
+
+
+def iter_color_frames(
+        cam_folder, timestamps, encoding: Encoding = "json", image_encoder=None, metrics=NULL_METRICS, preview=None
+):
+    image_encoder = image_encoder or ImageEncoder("png")
+    # Sampled here: the stream may run in a worker thread (workers > 1)
+    preview_sampler = preview.sampler() if preview is not None else None
     cam_path = os.path.join(cam_folder, f"{COLOR}.mp4")
     if not os.path.exists(cam_path):
         return
     cam_name = os.path.basename(cam_folder)  # Get only "cam_*"
     cam_number = cam_name.replace("cam_", "")
-    color_channel_id = writer.register_channel(
-        topic=f"/camera/{cam_number}/{COLOR}",
-        message_encoding="json",
-        schema_id=image_schema_id
-    )
+    topic = f"/camera/{cam_number}/{COLOR}"
     ts_lst = timestamps[COLOR]
+    import cv2
     cap = cv2.VideoCapture(cam_path)
-    # fps = cap.get(cv2.CAP_PROP_FPS)
     idx = 0
-    # frame_count = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break  # Stop if video ends
-        if not ret or idx >= len(ts_lst):
-            break
-        ts = ts_lst[idx]
-        # Encode frame as PNG
-        success, buffer = cv2.imencode(".png", frame)
-        if not success:
+    frame = None  # decoded into the same buffer, after the first frame
+    try:
+        while True:
+            with metrics.timer("video_decode"):
+                ret, frame = cap.read(frame) if frame is not None else cap.read()
+            if not ret or idx >= len(ts_lst):
+                break  # Stop if video ends
+            ts = int(ts_lst[idx])
+            idx += 1
+            # Encode BGR frame as PNG (or image_encoder.format)
+            with metrics.timer("image_encode"):
+                buffer = image_encoder.encode(frame, bgr=True)
+
+            # Raw image bytes, base64 only for json encoding
+            with metrics.timer("serialize"):
+                message_data = encode_compressed_image(encoding, ts, "camera_1", buffer, image_encoder.format)
+            if preview is None:
+                yield topic, "foxglove.CompressedImage", ts, message_data
+                continue
+            # Thumbnail of the same decoded frame, None when dropped by the preview fps
+            preview_data = None
+            if preview_sampler.keep(ts):
+                with metrics.timer("preview_encode"):
+                    preview_data = preview.message(encoding, ts, "camera_1", frame, bgr=True)
+            yield topic, "foxglove.CompressedImage", ts, message_data, preview_data
+    finally:
+        cap.release()
+
+
+def iter_color_packets(cam_folder, timestamps, encoding: Encoding = "json", metrics=NULL_METRICS):
+    cam_path = os.path.join(cam_folder, f"{COLOR}.mp4")
+    if not os.path.exists(cam_path):
+        return
+    cam_name = os.path.basename(cam_folder)  # Get only "cam_*"
+    cam_number = cam_name.replace("cam_", "")
+    topic = f"/camera/{cam_number}/{COLOR}"
+    ts_lst = timestamps[COLOR]
+    for frame_index, data, video_format in iter_video_packets(cam_path):
+        if frame_index >= len(ts_lst):
             continue
+        ts = int(ts_lst[frame_index])
+        with metrics.timer("serialize"):
+            message_data = encode_compressed_video(encoding, ts, f"cam_{cam_number}", data, video_format)
+        yield topic, "foxglove.CompressedVideo", ts, message_data
 
-        # Convert image to base64
-        base64_data = base64.b64encode(buffer).decode("utf-8")
-
-        ts = int(ts)
-
-        sec = ts // 1000
-        nsec = (ts % 1000) * 1_000_000
-
-        # Prepare the JSON message
-        message_data = json.dumps({
-            "timestamp": {"sec": sec, "nsec": nsec},
-            "frame_id": "camera_1",
-            "data": base64_data,
-            "format": "png"
-        }).encode("utf-8")
-
-        # Write message to MCAP
-        # timestamp = int((start_time + frame_count / fps) * 1e9)
-        # timestamp = int((ts_lst[0] + frame_count / fps) * 1_000_000)  # Convert to nanoseconds
-        timestamp = ts * 1_000_000  # tranforms to nano
-        # timestamp = 1739259420627109632   # tranforms to nano
-        writer.add_message(
-            channel_id=color_channel_id,
-            log_time=timestamp,
-            publish_time=timestamp,
-            data=message_data
-        )
-        idx += 1
-        # frame_count += 1
-    cap.release()
 
-def add_depth_frames_from_cam(writer, cam_folder, timestamps, image_schema_id, size=(640, 360)):
+def iter_depth_frames(
+        cam_folder, timestamps, encoding: Encoding = "json", size=(640, 360), depth_format="png",
+        metrics=NULL_METRICS
+):
+    """
+    depth_format: "png" writes 16-bit PNG CompressedImage, "raw" writes 16UC1 RawImage
+    and leaves compression to the (lossless, much faster) MCAP zstd chunk compression.
+    """
     cam_path = os.path.join(cam_folder, f"{DEPTH}.mp4")
     if not os.path.exists(cam_path):
         return
     cam_name = os.path.basename(cam_folder)  # Get only "cam_*"
     cam_number = cam_name.replace("cam_", "")
-    color_channel_id = writer.register_channel(
-        topic=f"/camera/{cam_number}/{DEPTH}",
-        message_encoding="json",
-        schema_id=image_schema_id
-    )
+    topic = f"/camera/{cam_number}/{DEPTH}"
+    schema_name = "foxglove.RawImage" if depth_format == "raw" else "foxglove.CompressedImage"
     ts_lst = timestamps[DEPTH]
-    width, height = size
-    cap = cv2.VideoCapture(cam_path)
-    # fps = cap.get(cv2.CAP_PROP_FPS)
     is_l515 = ("cam_f" in cam_path)
+    import cv2
     idx = 0
-    # frame_count = 0
-    while True:
-
-        ret, frame = cap.read()
-        if not ret or idx >= len(ts_lst):
-            break
-        ts = ts_lst[idx]
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray1 = np.array(gray[:height, :]).astype(np.int32)
-        gray2 = np.array(gray[height:, :]).astype(np.int32)
-        gray = np.array(gray2 * 256 + gray1).astype(np.uint16)
-        if is_l515:
-            gray = gray * 4
-        # cv2.imwrite(os.path.join("/home/nhattx/Workspace/VR/Data_platform/source/mcap_builder_git/mcap_example", '{}.png'.format(ts)), gray)
-        success, buffer = cv2.imencode(".png", gray)
-        if not success:
-            continue
-
-        # Convert image to base64
-        base64_data = base64.b64encode(buffer).decode("utf-8")
-
-        ts = int(ts)
-
-        sec = ts // 1000
-        nsec = (ts % 1000) * 1_000_000
-
-        # Prepare the JSON message
-        message_data = json.dumps({
-            "timestamp": {"sec": sec, "nsec": nsec},
-            "frame_id": f"cam_{cam_number}",
-            "data": base64_data,
-            "format": "png"
-        }).encode("utf-8")
-
-        # Write message to MCAP
-        # timestamp = int((start_time + frame_count / fps) * 1e9)
-        # timestamp = int((ts_lst[0] + frame_count / fps) * 1_000_000)  # Convert to nanoseconds
-        timestamp = ts * 1_000_000  # tranforms to nano
-        # timestamp = 1739259420627109632   # tranforms to nano
-        writer.add_message(
-            channel_id=color_channel_id,
-            log_time=timestamp,
-            publish_time=timestamp,
-            data=message_data
-        )
-        idx += 1
-        # frame_count += 1
-    cap.release()
+    for batch in iter_depth_batches(cam_path, size=size, is_l515=is_l515, metrics=metrics):
+        for depth in batch:
+            if idx >= len(ts_lst):
+                return
+            ts = int(ts_lst[idx])
+            idx += 1
+            if depth_format == "raw":
+                with metrics.timer("serialize"):
+                    message_data = encode_raw_image(encoding, ts, f"cam_{cam_number}", depth, "16UC1")
+            else:
+                with metrics.timer("depth_encode"):
+                    success, buffer = cv2.imencode(".png", depth)
+                if not success:
+                    continue
+                # Raw PNG bytes, base64 only for json encoding
+                with metrics.timer("serialize"):
+                    message_data = encode_compressed_image(encoding, ts, f"cam_{cam_number}", buffer, "png")
+            yield topic, schema_name, ts, message_data
 
 
 if __name__ == '__main__':
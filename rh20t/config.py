@@ -1,21 +1,31 @@
-import json
+from common.encoding import load_json_schema
 
 COLOR = "color"
 DEPTH = "depth"
 
-with open("schema/xyz_quat.json", "r") as f:
-    xyz_quat_schema_data = json.load(f)
+# module attribute -> schema/<file>, loaded on first access (package resources, any cwd)
+SCHEMA_DATA = {
+    "xyz_quat_schema_data": "xyz_quat.json",
+    "compressed_image_schema_data": "compressed_image.json",
+}
 
-with open("schema/compressed_image.json", "r") as f:
-    compressed_image_schema_data = json.load(f)
+# transformed/<modality>.npy -> schema name (common.encoding.SCHEMAS) of one sample
+schema_mapping = {
+    "tcp": "GripperPose",
+    "tcp_base": "GripperPose",
+    "joint": "Vector",
+    "gripper": "Vector",
+    "high_freq_data": "Vector",
+    "force_torque": "Vector",
+    "force_torque_base": "Vector",
+}
 
+# kHz-rate modalities: packed N samples per VectorBatch message, decimated for previews
+HIGH_FREQ_MODALITIES = ("high_freq_data", "force_torque", "force_torque_base")
+BATCH_SCHEMA = "VectorBatch"
 
-schema_mapping = {
-    "tcp": xyz_quat_schema_data,
-    "tcp_base": xyz_quat_schema_data,
-    # "joint" : ,
-    # "gripper": ,
-    # "high_freq_data": ,
-    # "force_torque": ,
-    # "force_torque_base": ,
-}
\ No newline at end of file
+
+def __getattr__(name):
+    if name in SCHEMA_DATA:
+        return load_json_schema(SCHEMA_DATA[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,49 @@
+import numpy as np
+
+from common.metrics import NULL_METRICS
+
+
+def iter_depth_batches(cam_path, size=(640, 360), is_l515=False, batch_size=16, metrics=NULL_METRICS):
+    """
+    Decode a RH20T depth.mp4 in batches of `batch_size` frames.
+
+    A depth frame is stored as a (2 * height, width) gray image: low byte on top,
+    high byte at the bottom. Yields uint16 [n, height, width] views over one
+    preallocated buffer, valid until the next iteration.
+    metrics: times "video_decode" (cap.read) and "depth_unpack" (gray + byte packing).
+    """
+    import cv2
+
+    width, height = size
+    cap = cv2.VideoCapture(cam_path)
+    bgr = np.empty((2 * height, width, 3), dtype=np.uint8)
+    gray = depth = None
+    try:
+        while True:
+            n = 0
+            while n < batch_size:
+                with metrics.timer("video_decode"):
+                    ret, bgr = cap.read(bgr)
+                if not ret:
+                    break
+                if gray is None:
+                    # Buffers sized on the real frame, allocated once per video
+                    gray = np.empty((batch_size,) + bgr.shape[:2], dtype=np.uint8)
+                    depth = np.empty((batch_size, height, bgr.shape[1]), dtype=np.uint16)
+                with metrics.timer("depth_unpack"):
+                    cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY, dst=gray[n])
+                n += 1
+            if n == 0:
+                return
+            # depth = (high << 8 | low) [<< 2 for L515], one pass over the batch, in uint16
+            out = depth[:n]
+            with metrics.timer("depth_unpack"):
+                np.left_shift(gray[:n, height:2 * height], 8, out=out, dtype=np.uint16)
+                np.bitwise_or(out, gray[:n, :height], out=out)
+                if is_l515:
+                    np.left_shift(out, 2, out=out)
+            yield out
+            if n < batch_size:
+                return
+    finally:
+        cap.release()
@@ -0,0 +1,45 @@
+import numpy as np
+
+
+def load_samples(file_path):
+    """
+    Load a RH20T transformed/<modality>.npy as [(serial, field, timestamps, values)]:
+    timestamps int64 [N] in milliseconds (sorted), values float64 [N, D], one entry per
+    numeric field. Handles both layouts of the RH20T files:
+    - {serial: [{"timestamp": t, <field>: array, ...}, ...]}  (force_torque, high_freq_data)
+    - {serial: {t: array}} (joint), {serial: {t: {<field>: array, ...}}} (gripper)
+    `field` is None when a sample is a plain array. Non-numeric or ragged fields are skipped.
+    """
+    data = np.load(file_path, allow_pickle=True).item()
+    streams = []
+    for serial, samples in data.items():
+        if not len(samples):
+            continue
+        if isinstance(samples, dict):
+            timestamps = np.fromiter(samples.keys(), dtype=np.int64, count=len(samples))
+            records = list(samples.values())
+            if isinstance(records[0], dict):
+                fields = [(name, [record[name] for record in records]) for name in records[0]]
+            else:
+                fields = [(None, records)]
+        else:
+            timestamps = np.fromiter((sample["timestamp"] for sample in samples), dtype=np.int64, count=len(samples))
+            fields = [
+                (name, [sample[name] for sample in samples])
+                for name in samples[0] if name != "timestamp"
+            ]
+        order = np.argsort(timestamps, kind="stable")
+        for field, rows in fields:
+            values = stack_rows(rows)
+            if values is not None:
+                streams.append((str(serial), field, timestamps[order], values[order]))
+    return streams
+
+
+def stack_rows(rows):
+    """[N] scalars or equal-length arrays -> float64 [N, D], None if not numeric."""
+    try:
+        values = np.asarray(rows, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    return values.reshape(len(values), -1)
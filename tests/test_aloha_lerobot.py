@@ -0,0 +1,34 @@
+import json
+import os
+from collections import Counter
+from types import SimpleNamespace
+
+from mcap.reader import make_reader
+
+from aloha_lerobot.build import write_episode_columnar
+from aloha_lerobot.reader import EpisodeReader
+from benchmarks.fixtures import LEROBOT_CAMERAS, make_lerobot_dataset, synthetic_frame, write_video
+from common.image import ImageEncoder
+from common.metrics import Metrics
+from common.sink import McapSink
+
+
+def test_short_video_reports_missing_frames(tmp_path, capsys):
+    root = make_lerobot_dataset(str(tmp_path / "lerobot"), episodes=1, length=4, size=(64, 48))
+    with open(os.path.join(root, "meta", "info.json")) as f:
+        dataset = SimpleNamespace(root=root, meta=SimpleNamespace(info=json.load(f)))
+    short_camera = LEROBOT_CAMERAS[0]
+    video_file = EpisodeReader(dataset, 0).video_file(short_camera)
+    write_video(str(video_file), (synthetic_frame(i, 48, 64) for i in range(3)), 50)
+
+    metrics = Metrics()
+    output = tmp_path / "episode_0.mcap"
+    with McapSink(str(output), "json", metrics=metrics) as sink:
+        write_episode_columnar(sink, dataset, 0, 4, 0, 50, image_encoder=ImageEncoder("jpeg"))
+
+    assert metrics.snapshot()["counters"]["video_frames_missing"] == 1
+    assert f"Eps 0 {short_camera}: video has 3 of 4 frames" in capsys.readouterr().out
+    with open(output, "rb") as f:
+        counts = Counter(channel.topic for _, channel, _ in make_reader(f).iter_messages())
+    assert counts[f"/data/{short_camera}"] == 3
+    assert all(counts[f"/data/{camera}"] == 4 for camera in LEROBOT_CAMERAS[1:])
@@ -0,0 +1,108 @@
+import os
+import shutil
+
+import cv2
+import h5py
+import numpy as np
+import pytest
+from mcap.reader import make_reader
+
+from aloha_raw.build import mcap_builder
+from aloha_raw.reader import encoded_image, iter_rows, slice_rows
+from benchmarks.fixtures import make_aloha_raw_dataset
+from tools.query import MessageDecoder
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    return make_aloha_raw_dataset(tmp_path / "aloha_raw", episodes=2, length=4, size=(64, 48))
+
+
+def test_rerun_after_failed_first_episode(tmp_path, dataset):
+    output = tmp_path / "output"
+    episode = dataset / "episode_0.hdf5"
+    shutil.move(episode, tmp_path / "episode_0.hdf5")
+    with open(episode, "wb") as f:
+        f.write(b"not an hdf5 file")
+    with pytest.raises(OSError):
+        mcap_builder(dataset, output, encoding="cdr")
+    assert "episode_0.mcap" not in os.listdir(output)
+
+    shutil.move(tmp_path / "episode_0.hdf5", episode)
+    mcap_builder(dataset, output, encoding="cdr")
+    assert {"episode_0.mcap", "episode_1.mcap"} <= set(os.listdir(output))
+    assert not [name for name in os.listdir(output) if name.endswith(".part")]
+
+
+def padded(data, length):
+    row = np.zeros(length, dtype=np.uint8)
+    row[:len(data)] = np.frombuffer(data, np.uint8)
+    return row
+
+
+@pytest.mark.parametrize("extension, image_format", [(".jpg", "jpeg"), (".png", "png")])
+def test_encoded_image_trims_padding(extension, image_format):
+    frame = np.zeros((16, 16, 3), dtype=np.uint8)  # black: the streams end in zero-heavy data
+    data = cv2.imencode(extension, frame)[1].tobytes()
+    image, detected = encoded_image(padded(data, len(data) + 37))
+    assert image.tobytes() == data and detected == image_format
+    assert encoded_image(padded(data, len(data)))[0].tobytes() == data
+
+
+@pytest.mark.parametrize("row", [np.zeros(8, dtype=np.uint8), padded(b"GIF89a", 10)])
+def test_encoded_image_rejects_other_rows(row):
+    with pytest.raises(ValueError):
+        encoded_image(row)
+
+
+@pytest.mark.parametrize("shape, chunks, max_slice_bytes, rows", [
+    ((50, 100), (1, 100), 350, 3),
+    ((50, 100), (4, 100), 350, 4),  # at least one chunk
+    ((50, 100), (4, 100), 1000, 8),  # whole chunks only
+    ((50, 100), None, 1000, 10),  # contiguous
+    ((50, 100), (1, 100), 10, 1),
+])
+def test_slice_rows(tmp_path, shape, chunks, max_slice_bytes, rows):
+    with h5py.File(tmp_path / "slice.hdf5", "w") as f:
+        dataset = f.create_dataset("rows", shape=shape, dtype=np.uint8, chunks=chunks)
+        assert slice_rows(dataset, max_slice_bytes) == rows
+
+
+@pytest.mark.parametrize("max_slice_bytes", [1, 8 * 14 * 3, 1 << 20])
+def test_iter_rows(tmp_path, max_slice_bytes):
+    values = np.random.default_rng(0).normal(size=(10, 14))
+    with h5py.File(tmp_path / "rows.hdf5", "w") as f:
+        dataset = f.create_dataset("qpos", data=values, chunks=(2, 14))
+        rows = [row.copy() for row in iter_rows(dataset, max_slice_bytes)]
+    np.testing.assert_array_equal(rows, values)
+
+
+def test_build_copies_episode(tmp_path, dataset):
+    output = tmp_path / "output"
+    mcap_builder(dataset, output, encoding="protobuf", episode_idx=1, max_slice_bytes=1000)
+    assert not os.path.exists(output / "episode_0.mcap")
+
+    decoder = MessageDecoder()
+    messages = {}
+    with open(output / "episode_1.mcap", "rb") as f:
+        for schema, channel, message in make_reader(f).iter_messages():
+            messages.setdefault(channel.topic, []).append(decoder.decode(schema, channel, message))
+    with h5py.File(dataset / "episode_1.hdf5", "r") as f:
+        np.testing.assert_array_equal(
+            [message["joint_state"] for message in messages["/data/observation.state"]], f["/observations/qpos"][:]
+        )
+        np.testing.assert_array_equal(
+            [message["joint_state"] for message in messages["/data/base_action"]], f["/base_action"][:]
+        )
+        for camera, rows in f["/observations/images"].items():
+            images = messages[f"/data/observation.images.{camera}"]
+            assert [bytes(image["data"]) for image in images] == [encoded_image(row)[0].tobytes() for row in rows]
+            assert {image["format"] for image in images} == {"jpeg"}
+
+
+def test_build_skips_episode_without_datasets(tmp_path, dataset):
+    with h5py.File(dataset / "episode_2.hdf5", "w") as f:
+        f.create_dataset("/observations/other", data=np.zeros(3))
+    output = tmp_path / "output"
+    mcap_builder(dataset, output, encoding="cdr", workers=2)
+    assert sorted(name for name in os.listdir(output) if name.endswith(".mcap")) == ["episode_0.mcap", "episode_1.mcap"]
@@ -0,0 +1,74 @@
+import sqlite3
+
+import numpy as np
+import pytest
+from mcap.writer import IndexType
+
+from common.catalog import Catalog, source_id, summary_rows
+from common.encoding import encode_joint_state
+from common.sink import McapSink
+
+
+def write_episode(path, chunk_size=1):
+    """/action at 0..90 ms, /state at 50..140 ms, /empty registered without messages."""
+    with McapSink(str(path), "cdr", chunk_size=chunk_size) as sink:
+        action = sink.channel_id("/action", "aloha_14dof")
+        state = sink.channel_id("/state", "aloha_14dof")
+        sink.channel_id("/empty", "Vector")
+        for ts in range(0, 100, 10):
+            sink.add(action, ts, encode_joint_state("cdr", ts, np.zeros(14)))
+            sink.add(state, ts + 50, encode_joint_state("cdr", ts + 50, np.zeros(14)))
+    return path
+
+
+def test_summary_rows(tmp_path):
+    path = write_episode(tmp_path / "episode_3.mcap")
+    rows = {row["topic"]: row for row in summary_rows(path, builder="aloha_raw")}
+    assert rows["/action"]["message_count"] == rows["/state"]["message_count"] == 10
+    # one message per chunk: exact time ranges
+    assert (rows["/action"]["start_time"], rows["/action"]["end_time"]) == (0, 90_000_000)
+    assert (rows["/state"]["start_time"], rows["/state"]["end_time"]) == (50_000_000, 140_000_000)
+    assert rows["/empty"]["message_count"] == 0 and rows["/empty"]["start_time"] is None
+    assert {row["source"] for row in rows.values()} == {"3"}
+    assert rows["/action"]["schema_name"] == "mcap_builder/msg/Aloha14Dof"
+    assert rows["/action"]["message_encoding"] == "cdr"
+    assert rows["/action"]["file_size"] == path.stat().st_size
+
+
+def test_summary_rows_shared_chunks(tmp_path):
+    """Channels sharing chunks get the bounds of those chunks, within the file time range."""
+    path = write_episode(tmp_path / "scene_0001.mcap", chunk_size=1 << 20)
+    rows = {row["topic"]: row for row in summary_rows(path, source=7)}
+    assert (rows["/action"]["start_time"], rows["/action"]["end_time"]) == (0, 140_000_000)
+    assert {row["source"] for row in rows.values()} == {"7"}
+
+
+def test_summary_rows_without_summary(tmp_path):
+    path = tmp_path / "episode_0.mcap"
+    options = dict(
+        use_chunking=False, use_statistics=False, use_summary_offsets=False,
+        repeat_channels=False, repeat_schemas=False, index_types=IndexType.NONE,
+    )
+    with McapSink(str(path), "cdr", **options) as sink:
+        sink.add(sink.channel_id("/action", "aloha_14dof"), 0, encode_joint_state("cdr", 0, np.zeros(14)))
+    with pytest.raises(ValueError, match="no summary section"):
+        summary_rows(path)
+
+
+def test_source_id():
+    assert source_id("out/episode_12.mcap") == "12"
+    assert source_id("out/task_0001_scene_0002.mcap") == "task_0001_scene_0002"
+
+
+def test_catalog_record(tmp_path):
+    write_episode(tmp_path / "episode_0.mcap")
+    write_episode(tmp_path / "episode_1.mcap")
+    with Catalog(tmp_path) as catalog:
+        catalog.record(tmp_path / "episode_0.mcap", source=0, builder="aloha_raw")
+        catalog.record(tmp_path / "episode_1.mcap", source=1, builder="aloha_raw")
+        catalog.record(tmp_path / "episode_1.mcap", source=1, builder="aloha_raw")  # replaced, not duplicated
+    with sqlite3.connect(tmp_path / "catalog.sqlite") as connection:
+        files = connection.execute(
+            "SELECT path, source, message_count, channel_count, duration FROM files ORDER BY path"
+        ).fetchall()
+    assert files == [("episode_0.mcap", "0", 20, 3, 140_000_000), ("episode_1.mcap", "1", 20, 3, 140_000_000)]
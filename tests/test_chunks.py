@@ -0,0 +1,72 @@
+import io
+
+import pytest
+from mcap.reader import make_reader
+from mcap.writer import CompressionType
+
+from common.chunks import ChunkWriter, build_chunk
+
+
+def write_file(compression, chunks):
+    """MCAP bytes with two channels; `chunks` lists of (channel_id, sequence, log_time, data)."""
+    stream = io.BytesIO()
+    writer = ChunkWriter(stream)
+    writer.start(profile="ros2")
+    schema_id = writer.register_schema("Vector", "jsonschema", b"{}")
+    writer.register_channel("/a", "json", schema_id)
+    writer.register_channel("/b", "json", schema_id, {"frame": "base"})
+    for messages in chunks:
+        writer.add_chunk(build_chunk(
+            ((channel_id, sequence, log_time, log_time + 1, data) for channel_id, sequence, log_time, data in messages),
+            compression,
+        ))
+    writer.finish()
+    return stream.getvalue()
+
+
+CHUNKS = [
+    [(1, 0, 100, b'{"v": 0}'), (2, 0, 150, b'{"v": 1}'), (1, 1, 120, b'{"v": 2}')],
+    [(2, 1, 300, b""), (1, 2, 200, b'{"v": 4}' * 100)],
+]
+
+
+@pytest.mark.parametrize("compression", [CompressionType.ZSTD, CompressionType.LZ4, CompressionType.NONE])
+def test_chunk_writer_readback(compression):
+    data = write_file(compression, CHUNKS)
+    reader = make_reader(io.BytesIO(data))
+
+    messages = [
+        (channel.topic, message.sequence, message.log_time, message.publish_time, message.data)
+        for _, channel, message in reader.iter_messages(log_time_order=False)
+    ]
+    topics = {1: "/a", 2: "/b"}
+    assert messages == [
+        (topics[channel_id], sequence, log_time, log_time + 1, data)
+        for chunk in CHUNKS for channel_id, sequence, log_time, data in chunk
+    ]
+    assert [message.log_time for _, _, message in reader.iter_messages()] == [100, 120, 150, 200, 300]
+
+    summary = reader.get_summary()
+    assert summary.statistics.message_count == 5
+    assert dict(summary.statistics.channel_message_counts) == {1: 3, 2: 2}
+    assert (summary.statistics.message_start_time, summary.statistics.message_end_time) == (100, 300)
+    assert summary.statistics.chunk_count == len(summary.chunk_indexes) == 2
+    assert summary.channels[2].metadata == {"frame": "base"}
+    assert summary.schemas[1].name == "Vector"
+    assert reader.get_header().profile == "ros2"
+    # time-range reads go through the chunk and message indexes
+    assert [m.data for _, _, m in reader.iter_messages(topics=["/a"], start_time=110, end_time=201)] == [
+        b'{"v": 2}', b'{"v": 4}' * 100,
+    ]
+
+
+def test_build_chunk_empty():
+    assert build_chunk([]) is None
+
+
+def test_build_chunk_times_and_counts():
+    chunk = build_chunk([(3, 0, 50, 50, b"x"), (1, 0, 10, 10, memoryview(b"yz")), (3, 1, 30, 30, b"")])
+    assert (chunk.message_start_time, chunk.message_end_time) == (10, 50)
+    assert chunk.message_counts == {3: 2, 1: 1}
+    assert sorted(chunk.index_offsets) == [1, 3]
+    assert chunk.compression == "zstd"
@@ -0,0 +1,184 @@
+import json
+
+import numpy as np
+import pytest
+from mcap.reader import make_reader
+from mcap_protobuf.decoder import DecoderFactory as ProtobufDecoderFactory
+from mcap_ros2.decoder import DecoderFactory as Ros2DecoderFactory
+
+from common.encoding import (
+    encode_compressed_image, encode_compressed_video, encode_joint_state, encode_joint_states, encode_pose,
+    encode_poses, encode_raw_image, encode_vector, encode_vector_batch, encode_vectors,
+)
+from common.sink import McapSink
+
+ENCODINGS = ["json", "protobuf", "cdr"]
+
+rng = np.random.default_rng(0)
+TIMESTAMPS = np.array([1_700_000_000_000, 1_700_000_000_020, 1_700_000_001_999], dtype=np.int64)
+JOINTS = rng.normal(size=(3, 14))
+POSES = rng.normal(size=(3, 7))
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_joint_states_match_per_message(encoding):
+    expected = [encode_joint_state(encoding, int(ts), row) for ts, row in zip(TIMESTAMPS, JOINTS)]
+    assert encode_joint_states(encoding, TIMESTAMPS, JOINTS) == expected
+    assert encode_joint_states(encoding, TIMESTAMPS[:0], JOINTS[:0]) == []
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_poses_match_per_message(encoding):
+    expected = [encode_pose(encoding, ts, pose) for ts, pose in zip(TIMESTAMPS.tolist(), POSES)]
+    assert encode_poses(encoding, TIMESTAMPS.tolist(), POSES) == expected
+    # float timestamps (RH20T) keep their type in json
+    float_timestamps = (TIMESTAMPS + 0.5).tolist()
+    assert encode_poses(encoding, float_timestamps, POSES) == [
+        encode_pose(encoding, ts, pose) for ts, pose in zip(float_timestamps, POSES)
+    ]
+
+
+def test_poses_non_finite_json():
+    poses = POSES.copy()
+    poses[1, 2] = np.nan
+    poses[2, 0] = np.inf
+    expected = [encode_pose("json", ts, pose) for ts, pose in zip(TIMESTAMPS.tolist(), poses)]
+    assert encode_poses("json", TIMESTAMPS.tolist(), poses) == expected
+
+
+def write_and_decode(tmp_path, encoding, messages):
+    """Write (topic, schema name, ts, data) through McapSink, decode them back as plain dicts."""
+    from tools.query import to_plain
+
+    path = tmp_path / f"{encoding}.mcap"
+    with McapSink(str(path), encoding) as sink:
+        for topic, schema_name, ts, data in messages:
+            sink.add(sink.channel_id(topic, schema_name), ts, data)
+    decoded = []
+    with open(path, "rb") as f:
+        reader = make_reader(f, decoder_factories=[ProtobufDecoderFactory(), Ros2DecoderFactory()])
+        for schema, channel, message, value in reader.iter_decoded_messages():
+            decoded.append((channel.topic, message.log_time, to_plain(value)))
+    return decoded
+
+
+def stamp(value):
+    """(sec, nsec) of a decoded protobuf Timestamp or ros2 Time."""
+    if "seconds" in value:
+        return value["seconds"], value["nanos"]
+    return value["sec"], value["nanosec"]
+
+
+@pytest.mark.parametrize("encoding", ["protobuf", "cdr"])
+def test_joint_state_round_trip(tmp_path, encoding):
+    messages = [
+        ("/data/action", "aloha_14dof", int(ts), encode_joint_state(encoding, int(ts), row))
+        for ts, row in zip(TIMESTAMPS, JOINTS)
+    ]
+    messages.append(("/data/base_action", "aloha_2dof", int(TIMESTAMPS[0]), encode_joint_state(
+        encoding, int(TIMESTAMPS[0]), JOINTS[0, :2]
+    )))
+    decoded = write_and_decode(tmp_path, encoding, messages)
+    joints = [(log_time, value) for topic, log_time, value in decoded if topic == "/data/action"]
+    assert [log_time for log_time, _ in joints] == [int(ts) * 1_000_000 for ts in TIMESTAMPS]
+    for (_, value), ts, row in zip(joints, TIMESTAMPS, JOINTS):
+        assert stamp(value["timestamp"]) == (ts // 1000, ts % 1000 * 1_000_000)
+        np.testing.assert_array_equal(value["joint_state"], row)
+    (base,) = [value for topic, _, value in decoded if topic == "/data/base_action"]
+    np.testing.assert_array_equal(base["joint_state"], JOINTS[0, :2])
+
+
+@pytest.mark.parametrize("encoding", ["protobuf", "cdr"])
+def test_pose_round_trip(tmp_path, encoding):
+    messages = [
+        ("/pose", "GripperPose", ts, encode_pose(encoding, ts, pose))
+        for ts, pose in zip(TIMESTAMPS.tolist(), POSES)
+    ]
+    decoded = write_and_decode(tmp_path, encoding, messages)
+    for (_, _, value), ts, pose in zip(decoded, TIMESTAMPS.tolist(), POSES):
+        assert stamp(value["timestamp"]) == (ts // 1000, ts % 1000 * 1_000_000)
+        position, orientation = value["position"], value["orientation"]
+        assert [position["x"], position["y"], position["z"]] == pose[:3].tolist()
+        assert [orientation["x"], orientation["y"], orientation["z"], orientation["w"]] == pose[3:].tolist()
+
+
+@pytest.mark.parametrize("encoding", ["protobuf", "cdr"])
+def test_compressed_image_round_trip(tmp_path, encoding):
+    jpeg = bytes(range(256)) * 3
+    ts = int(TIMESTAMPS[1])
+    messages = [
+        ("/camera", "foxglove.CompressedImage", ts, encode_compressed_image(encoding, ts, "cam_high", jpeg, "jpeg")),
+        # numpy encoder output buffers are written as-is too
+        ("/camera", "foxglove.CompressedImage", ts + 20, encode_compressed_image(
+            encoding, ts + 20, "cam_high", np.frombuffer(jpeg[:5], np.uint8), "png"
+        )),
+    ]
+    (_, _, image), (_, _, small) = write_and_decode(tmp_path, encoding, messages)
+    assert bytes(image["data"]) == jpeg and image["format"] == "jpeg"
+    assert bytes(small["data"]) == jpeg[:5] and small["format"] == "png"
+    if encoding == "protobuf":
+        assert image["frame_id"] == "cam_high" and stamp(image["timestamp"]) == (ts // 1000, 20_000_000)
+    else:
+        assert image["header"]["frame_id"] == "cam_high" and stamp(image["header"]["stamp"]) == (ts // 1000, 20_000_000)
+
+
+@pytest.mark.parametrize("encoding", ["protobuf", "cdr"])
+def test_compressed_video_round_trip(tmp_path, encoding):
+    packets = [b"\x00\x00\x00\x01\x67" + bytes(37), b"\x00\x00\x00\x01\x41" + bytes(range(9))]
+    messages = [
+        ("/video", "foxglove.CompressedVideo", ts, encode_compressed_video(encoding, ts, "cam_low", packet, "h264"))
+        for ts, packet in zip(TIMESTAMPS.tolist(), packets)
+    ]
+    decoded = write_and_decode(tmp_path, encoding, messages)
+    for (_, _, value), ts, packet in zip(decoded, TIMESTAMPS.tolist(), packets):
+        assert bytes(value["data"]) == packet
+        assert (value["frame_id"], value["format"]) == ("cam_low", "h264")
+        assert stamp(value["timestamp"]) == (ts // 1000, ts % 1000 * 1_000_000)
+
+
+@pytest.mark.parametrize("encoding", ["protobuf", "cdr"])
+def test_raw_image_round_trip(tmp_path, encoding):
+    depth = np.arange(15, dtype=np.uint16).reshape(3, 5) * 1000
+    ts = int(TIMESTAMPS[2])
+    messages = [("/depth", "foxglove.RawImage", ts, encode_raw_image(encoding, ts, "cam_f", depth, "16UC1"))]
+    ((_, _, raw),) = write_and_decode(tmp_path, encoding, messages)
+    assert (raw["width"], raw["height"], raw["encoding"], raw["step"]) == (5, 3, "16UC1", 10)
+    np.testing.assert_array_equal(np.frombuffer(bytes(raw["data"]), "<u2").reshape(3, 5), depth)
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_vectors_match_per_message(encoding):
+    values = rng.normal(size=(3, 5))
+    expected = [encode_vector(encoding, ts, row) for ts, row in zip(TIMESTAMPS, values)]
+    assert encode_vectors(encoding, TIMESTAMPS, values) == expected
+
+
+@pytest.mark.parametrize("encoding", ["protobuf", "cdr"])
+def test_vector_round_trip(tmp_path, encoding):
+    values = rng.normal(size=(3, 4))
+    messages = [
+        ("/vector", "Vector", ts, data)
+        for ts, data in zip(TIMESTAMPS.tolist(), encode_vectors(encoding, TIMESTAMPS, values))
+    ]
+    messages.append(("/batch", "VectorBatch", int(TIMESTAMPS[0]), encode_vector_batch(encoding, TIMESTAMPS, values)))
+    decoded = write_and_decode(tmp_path, encoding, messages)
+
+    vectors = [value for topic, _, value in decoded if topic == "/vector"]
+    np.testing.assert_array_equal([value["values"] for value in vectors], values)
+    assert [stamp(value["timestamp"]) for value in vectors] == [(ts // 1000, ts % 1000 * 1_000_000) for ts in TIMESTAMPS]
+    (batch,) = [value for topic, _, value in decoded if topic == "/batch"]
+    assert list(batch["sample_time_ns"]) == (TIMESTAMPS * 1_000_000).tolist()
+    assert batch["dim"] == 4
+    np.testing.assert_array_equal(np.reshape(batch["values"], (-1, 4)), values)
+
+
+def test_json_messages_parse():
+    ts = int(TIMESTAMPS[1])
+    joint_state = json.loads(encode_joint_state("json", ts, JOINTS[0]))
+    assert joint_state == {"timestamp": {"sec": ts // 1000, "nsec": 20_000_000}, "joint_state": JOINTS[0].tolist()}
+    pose = json.loads(encode_pose("json", ts, POSES[0].tolist()))
+    assert pose["timestamp"] == ts and pose["orientation"]["w"] == POSES[0, 6]
+    image = json.loads(encode_compressed_image("json", ts, "cam_high", b"\xff\xd8", "jpeg"))
+    assert image["data"] == "/9g=" and image["frame_id"] == "cam_high"
+    batch = json.loads(encode_vector_batch("json", TIMESTAMPS, JOINTS))
+    assert batch["dim"] == 14 and batch["values"] == JOINTS.ravel().tolist()
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from common.manifest import Manifest, fingerprint
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_manifest_up_to_date(tmp_path):
+    write(tmp_path / "input.hdf5", b"input")
+    inputs = fingerprint([tmp_path / "input.hdf5"], root=tmp_path)
+    write(tmp_path / "episode_0.mcap", b"output")
+    options = {"encoding": "cdr"}
+
+    manifest = Manifest(tmp_path)
+    assert not manifest.is_up_to_date("episode_0.mcap", inputs, options)
+    manifest.record("episode_0.mcap", inputs, options)
+    manifest = Manifest(tmp_path)  # reloaded from manifest.json
+    assert manifest.is_up_to_date("episode_0.mcap", inputs, options)
+    assert not manifest.is_up_to_date("episode_0.mcap", inputs, {"encoding": "json"})
+    assert not manifest.is_up_to_date("episode_1.mcap", inputs, options)
+
+    # input changed: new fingerprint
+    os.utime(tmp_path / "input.hdf5", ns=(1, 1))
+    assert fingerprint([tmp_path / "input.hdf5"], root=tmp_path) != inputs
+
+
+@pytest.mark.parametrize("change", ["rewrite", "touch", "remove"])
+def test_manifest_output_changed(tmp_path, change):
+    write(tmp_path / "episode_0.mcap", b"output")
+    manifest = Manifest(tmp_path)
+    manifest.record("episode_0.mcap", "inputs", {})
+    output = tmp_path / "episode_0.mcap"
+    if change == "rewrite":
+        write(output, b"truncated")
+    elif change == "touch":
+        stat = os.stat(output)
+        os.utime(output, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    else:
+        os.remove(output)
+    assert not manifest.is_up_to_date("episode_0.mcap", "inputs", {})
+
+
+def test_manifest_merges_records(tmp_path):
+    for name in ("a.mcap", "b.mcap"):
+        write(tmp_path / name, name.encode())
+    first, second = Manifest(tmp_path), Manifest(tmp_path)
+    first.record("a.mcap", "a", {})
+    second.record("b.mcap", "b", {})
+    manifest = Manifest(tmp_path)
+    assert manifest.is_up_to_date("a.mcap", "a", {}) and manifest.is_up_to_date("b.mcap", "b", {})
@@ -0,0 +1,16 @@
+from common.metrics import Metrics, write_prometheus
+
+
+def test_prometheus_label_values_escaped(tmp_path):
+    metrics = Metrics()
+    metrics.add_time("mcap_write", 0.5, calls=2)
+    metrics.count("messages", 3)
+    path = tmp_path / "mcap_builder.prom"
+    write_prometheus(path, {"builder": "rh20t", "scene": 'a\\b "c"\nd'}, metrics.snapshot())
+
+    lines = path.read_text().splitlines()
+    labels = 'builder="rh20t",scene="a\\\\b \\"c\\"\\nd"'
+    assert f'mcap_builder_stage_seconds_total{{{labels},stage="mcap_write"}} 0.500000' in lines
+    assert f'mcap_builder_stage_calls_total{{{labels},stage="mcap_write"}} 2' in lines
+    assert f"mcap_builder_messages_total{{{labels}}} 3" in lines
+    assert not list(tmp_path.glob("*.tmp"))
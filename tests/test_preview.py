@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from mcap.reader import make_reader
+
+from common.encoding import encode_compressed_image, encode_joint_state
+from common.preview import FrameSampler, Preview, PreviewSink, preview_path
+from common.sink import McapSink, frame_timestamp
+
+
+def kept(sampler, timestamps):
+    return [ts for ts in timestamps if sampler.keep(ts)]
+
+
+def test_sampler_divides_source_rate():
+    timestamps = [frame_timestamp(0, i, 30) for i in range(60)]
+    assert kept(FrameSampler(5), timestamps) == [frame_timestamp(0, i, 30) for i in range(0, 60, 6)]
+
+
+@pytest.mark.parametrize("source_fps, fps", [(50, 3), (30, 7), (10, 4)])
+def test_sampler_no_drift(source_fps, fps):
+    timestamps = [frame_timestamp(1_700_000_000_000, i, source_fps) for i in range(source_fps * 60)]
+    frames = kept(FrameSampler(fps), timestamps)
+    assert len(frames) == 60 * fps
+    assert all(b - a >= 1000 / source_fps for a, b in zip(frames, frames[1:]))
+
+
+def test_sampler_keeps_every_frame_of_slower_stream():
+    timestamps = [frame_timestamp(0, i, 5) for i in range(20)]
+    assert kept(FrameSampler(10), timestamps) == timestamps
+
+
+def test_sampler_after_gap():
+    sampler = FrameSampler(5)
+    assert kept(sampler, [0, 100, 200, 5000, 5050, 5200, 5400]) == [0, 200, 5000, 5200, 5400]
+
+
+def test_preview_path():
+    assert preview_path("out/episode_0.mcap") == "out/episode_0.preview.mcap"
+
+
+def test_preview_sink(tmp_path):
+    output = tmp_path / "episode_0.mcap"
+    preview = PreviewSink(str(output), Preview(fps=10, width=16, backend="pil"), "cdr")
+    frame = np.zeros((24, 32, 3), dtype=np.uint8)
+    with McapSink(str(output), "cdr", preview=preview) as sink:
+        joints = sink.channel_id("/data/action", "aloha_14dof")
+        camera = sink.channel_id("/data/cam_high", "foxglove.CompressedImage")
+        depth = sink.channel_id("/data/depth", "foxglove.RawImage")
+        for i in range(10):
+            ts = frame_timestamp(0, i, 50)
+            sink.add(joints, ts, encode_joint_state("cdr", ts, np.zeros(14)))
+            sink.add(camera, ts, encode_compressed_image("cdr", ts, "cam_high", b"\xff\xd8full", "jpeg"),
+                     preview.frame_message("/data/cam_high", ts, "cam_high", frame))
+            sink.add(depth, ts, b"depth")  # no thumbnail: left out
+
+    with open(preview_path(output), "rb") as f:
+        messages = [(channel.topic, message.log_time) for _, channel, message in make_reader(f).iter_messages()]
+    assert [log_time for topic, log_time in messages if topic == "/data/action"] == [
+        frame_timestamp(0, i, 50) * 1_000_000 for i in range(10)
+    ]
+    assert [log_time for topic, log_time in messages if topic == "/data/cam_high"] == [0, 100_000_000]
+    assert "/data/depth" not in {topic for topic, _ in messages}
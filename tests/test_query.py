@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from mcap.reader import make_reader
+
+from common.encoding import encode_compressed_image, encode_joint_state
+from common.sink import McapSink
+from tools.query import IndexedReader, decompress, iter_chunk_messages, parse_message, query
+
+
+@pytest.fixture(scope="module")
+def episode(tmp_path_factory):
+    """Two joint channels and a camera over 10 s, in many small chunks."""
+    path = tmp_path_factory.mktemp("query") / "episode.mcap"
+    rng = np.random.default_rng(0)
+    with McapSink(str(path), "cdr", chunk_size=2048) as sink:
+        qpos = sink.channel_id("/data/observation.state", "aloha_14dof")
+        action = sink.channel_id("/data/action", "aloha_14dof")
+        camera = sink.channel_id("/data/observation.images.cam_high", "foxglove.CompressedImage")
+        for ts in range(0, 10_000, 20):
+            sink.add(qpos, ts, encode_joint_state("cdr", ts, rng.normal(size=14)))
+            sink.add(action, ts, encode_joint_state("cdr", ts, rng.normal(size=14)))
+            if ts % 100 == 0:
+                sink.add(camera, ts, encode_compressed_image("cdr", ts, "cam_high", rng.bytes(500), "jpeg"))
+    return str(path)
+
+
+def expected_messages(path, topics=None, start_time=None, end_time=None):
+    with open(path, "rb") as f:
+        return [
+            (channel.topic, message.log_time, message.data)
+            for _, channel, message in make_reader(f).iter_messages(topics, start_time, end_time)
+        ]
+
+
+def as_tuples(messages):
+    return [(channel.topic, message.log_time, message.data) for _, channel, message in messages]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+@pytest.mark.parametrize("topics, start_time, end_time", [
+    (None, None, None),
+    (["/data/action"], None, None),
+    (["/data/observation.*"], 2_000_000_000, 3_500_000_000),
+    (None, 5_000_000_000, 5_000_000_001),
+    (["/data/action"], 20_000_000_000, None),
+])
+def test_iter_messages_matches_mcap_reader(episode, workers, topics, start_time, end_time):
+    with IndexedReader(episode, workers) as reader:
+        assert reader.indexed
+        messages = as_tuples(reader.iter_messages(topics, start_time, end_time))
+    if topics == ["/data/observation.*"]:
+        topics = ["/data/observation.state", "/data/observation.images.cam_high"]
+    expected = expected_messages(episode, topics, start_time, end_time)
+    assert sorted(messages) == sorted(expected)
+    assert [log_time for _, log_time, _ in messages] == sorted(log_time for _, log_time, _ in messages)
+
+
+def test_plan_skips_chunks(episode):
+    with IndexedReader(episode) as reader:
+        chunks = reader.plan(["/data/action"], 1_000_000_000, 1_200_000_000)
+        assert 0 < len(chunks) < len(reader.summary.chunk_indexes)
+        assert sum(len(entries) for _, entries in chunks) == 10
+
+
+def test_chunk_parsing(episode):
+    with IndexedReader(episode) as reader:
+        chunk_index = reader.summary.chunk_indexes[0]
+        data = decompress(
+            chunk_index.compression, reader.read_chunk_records(chunk_index), chunk_index.uncompressed_size
+        )
+        entries = reader._index_entries(chunk_index, set(reader.channels()), None, None)
+    messages = list(iter_chunk_messages(data))
+    assert len(messages) == len(entries) > 0
+    # message index offsets point at the records iter_chunk_messages walks through
+    assert sorted(offset for offset, _ in messages) == sorted(entries["offset"].tolist())
+    for offset, message in messages:
+        assert parse_message(data, offset) == message
+        assert message.log_time == message.publish_time
+        assert chunk_index.message_start_time <= message.log_time <= chunk_index.message_end_time
+
+
+def test_query_function(episode):
+    assert as_tuples(query(episode, ["/data/action"], end_time=100_000_000)) == expected_messages(
+        episode, ["/data/action"], end_time=100_000_000
+    )
@@ -0,0 +1,65 @@
+import numpy as np
+
+from benchmarks.fixtures import make_rh20t_scene
+from rh20t.build import mcap_builder, scene_prometheus_path
+from rh20t.samples import load_samples
+
+
+def save(path, data):
+    np.save(path, np.array(data, dtype=object), allow_pickle=True)
+    return path
+
+
+def test_load_samples_list_layout(tmp_path):
+    # force_torque / high_freq_data: {serial: [{"timestamp": t, <field>: array}, ...]}, unsorted
+    path = save(tmp_path / "force_torque.npy", {
+        "cam_1": [
+            {"timestamp": 20, "zeroed": np.arange(6.0) + 2, "raw": np.arange(6.0), "note": "x"},
+            {"timestamp": 10, "zeroed": np.arange(6.0) + 1, "raw": np.arange(6.0), "note": "y"},
+        ],
+        "cam_2": [],
+    })
+    streams = {(serial, field): (timestamps, values) for serial, field, timestamps, values in load_samples(path)}
+    assert set(streams) == {("cam_1", "zeroed"), ("cam_1", "raw")}  # strings and empty serials skipped
+    timestamps, values = streams["cam_1", "zeroed"]
+    assert timestamps.dtype == np.int64 and timestamps.tolist() == [10, 20]
+    np.testing.assert_array_equal(values, [np.arange(6.0) + 1, np.arange(6.0) + 2])
+
+
+def test_load_samples_dict_layouts(tmp_path):
+    joint = save(tmp_path / "joint.npy", {"045": {30: np.ones(7), 10: np.zeros(7)}})
+    ((serial, field, timestamps, values),) = load_samples(joint)
+    assert (serial, field, timestamps.tolist()) == ("045", None, [10, 30])
+    np.testing.assert_array_equal(values, [np.zeros(7), np.ones(7)])
+
+    gripper = save(tmp_path / "gripper.npy", {"045": {
+        5: {"gripper_command": [1.0, 2.0, 3.0], "gripper_info": [4.0, 5.0, 6.0]},
+        1: {"gripper_command": [0.0, 0.0, 0.0], "gripper_info": [1.0, 2.0]},  # ragged
+    }})
+    ((serial, field, timestamps, values),) = load_samples(gripper)
+    assert (field, timestamps.tolist(), values.tolist()) == ("gripper_command", [1, 5], [[0, 0, 0], [1, 2, 3]])
+
+
+def test_load_samples_scalars(tmp_path):
+    path = save(tmp_path / "tcp.npy", {"cam_1": [{"timestamp": 1, "width": 0.5}, {"timestamp": 2, "width": 0.25}]})
+    ((_, field, _, values),) = load_samples(path)
+    assert field == "width" and values.shape == (2, 1)
+
+
+def test_scene_prometheus_path():
+    assert scene_prometheus_path("/tmp/mcap_builder.prom", "scene_1") == "/tmp/mcap_builder.scene_1.prom"
+    assert scene_prometheus_path("/tmp/metrics", "scene_1") == "/tmp/metrics.scene_1.prom"
+
+
+def test_prometheus_textfile_per_scene(tmp_path):
+    # Scenes of one run (tools/batch.py) share prometheus_path: each keeps its own textfile.
+    prometheus_path = str(tmp_path / "mcap_builder.prom")
+    for scene in ("scene_a", "scene_b"):
+        scene_path = make_rh20t_scene(str(tmp_path / scene), frames=2, tcp_hz=10, high_freq_hz=10)
+        mcap_builder(str(tmp_path / f"{scene}.mcap"), scene_path, prometheus_path=prometheus_path)
+    for scene in ("scene_a", "scene_b"):
+        with open(scene_prometheus_path(prometheus_path, scene)) as f:
+            text = f.read()
+        assert f'builder="rh20t",scene="{scene}"' in text
+        assert "mcap_builder_stage_seconds_total" in text
+    assert not (tmp_path / "mcap_builder.prom").exists()
@@ -0,0 +1,209 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from mcap.reader import make_reader
+from mcap.records import Channel, Schema
+from mcap_ros2._dynamic import generate_dynamic
+from mcap_ros2.decoder import DecoderFactory as Ros2DecoderFactory
+
+from common.encoding import (
+    SCHEMAS, encode_compressed_image, encode_compressed_video, encode_joint_states, encode_poses, encode_raw_image,
+    encode_vector_batch, encode_vectors, schema_file,
+)
+from common.sink import McapSink
+from tools.query import MessageDecoder, to_plain
+from tools.rosbag import (
+    CDR_READERS, ROS2_TYPES, CdrWriter, float64_multi_arrays, mcap_to_rosbag, plan_channels, to_joint_state,
+)
+
+
+def decode_ros2(ros2_type, data):
+    return to_plain(generate_dynamic(ros2_type, schema_file(ROS2_TYPES[ros2_type]).decode())[ros2_type](data))
+
+
+def test_cdr_writer_alignment():
+    writer = CdrWriter()
+    writer.pack("B", 1, alignment=1)
+    writer.float64s([1.5])  # length at offset 4, data 8-aligned at offset 8
+    writer.string("ab")
+    writer.uint8s(b"\x07")
+    assert writer.getvalue() == (
+        b"\x00\x01\x00\x00" + b"\x01\x00\x00\x00" + b"\x01\x00\x00\x00" + np.float64(1.5).tobytes()
+        + b"\x03\x00\x00\x00ab\x00" + b"\x00" + b"\x01\x00\x00\x00\x07"
+    )
+
+
+def test_joint_state_fields():
+    for topic, field in [("/data/action", "position"), ("/data/observation.velocity", "velocity"),
+                         ("/data/observation.effort", "effort")]:
+        fields = {"timestamp": {"sec": 3, "nsec": 5}, "joint_state": np.arange(14.0)}
+        ((log_time, data),) = to_joint_state(topic, fields, 42)
+        message = decode_ros2("sensor_msgs/msg/JointState", data)
+        assert log_time == 42 and message["header"]["stamp"] == {"sec": 3, "nanosec": 5}
+        for name in ("position", "velocity", "effort"):
+            assert list(message[name]) == (list(range(14)) if name == field else [])
+
+
+@pytest.mark.parametrize("label", ["", "v", "val", "values", "values_"])
+@pytest.mark.parametrize("dim", [1, 3, 6])
+def test_float64_multi_arrays_layout(label, dim):
+    values = np.random.default_rng(dim).normal(size=(4, dim))
+    messages = float64_multi_arrays(values, label)
+    assert len(messages) == 4
+    for message, row in zip(messages, values):
+        decoded = decode_ros2("std_msgs/msg/Float64MultiArray", message)
+        assert decoded["layout"]["dim"] == [{"label": label, "size": dim, "stride": dim}]
+        assert decoded["layout"]["data_offset"] == 0
+        assert list(decoded["data"]) == row.tolist()
+
+
+def test_cdr_readers_match_ros2_decoder(tmp_path):
+    rng = np.random.default_rng(0)
+    timestamps = np.array([1_000, 1_020, 2_999])
+    path = tmp_path / "cdr.mcap"
+    with McapSink(str(path), "cdr") as sink:
+        for name, messages in [
+            ("aloha_14dof", encode_joint_states("cdr", timestamps, rng.normal(size=(3, 14)))),
+            ("aloha_2dof", encode_joint_states("cdr", timestamps, rng.normal(size=(3, 2)))),
+            ("GripperPose", encode_poses("cdr", timestamps.tolist(), rng.normal(size=(3, 7)))),
+            ("Vector", encode_vectors("cdr", timestamps, rng.normal(size=(3, 5)))),
+            ("VectorBatch", [encode_vector_batch("cdr", timestamps, rng.normal(size=(3, 6)))]),
+        ]:
+            sink.add_batch(sink.channel_id(f"/{name}", name), timestamps[:len(messages)], messages)
+
+    decoder = MessageDecoder()
+    with open(path, "rb") as f:
+        for schema, channel, message in make_reader(f).iter_messages():
+            fields = CDR_READERS[channel.topic[1:]](message.data)
+            expected = decoder.decode(schema, channel, message)
+            assert fields.keys() == expected.keys()
+            for key, value in fields.items():
+                if key == "timestamp":
+                    assert value == {"sec": expected[key]["sec"], "nsec": expected[key]["nanosec"]}
+                elif isinstance(value, dict):
+                    assert value == expected[key]
+                else:
+                    np.testing.assert_array_equal(value, expected[key])
+
+
+def summary_of(channels):
+    """Summary stand-in: {id: (topic, message encoding, schema name)}."""
+    summary = SimpleNamespace(schemas={}, channels={})
+    for channel_id, (topic, message_encoding, schema_name) in channels.items():
+        summary.schemas[channel_id] = Schema(id=channel_id, name=schema_name, encoding="ros2msg", data=b"definition")
+        summary.channels[channel_id] = Channel(
+            id=channel_id, topic=topic, message_encoding=message_encoding, metadata={}, schema_id=channel_id,
+        )
+    return summary
+
+
+def test_plan_channels():
+    plans = plan_channels(summary_of({
+        1: ("/camera", "cdr", SCHEMAS["foxglove.CompressedImage"][3]),  # already the ROS 2 type
+        2: ("/action", "json", "aloha_14dof"),
+        3: ("/unknown", "json", "my.Type"),
+        4: ("/state", "cdr", SCHEMAS["aloha_14dof"][3]),
+        5: ("/other", "cdr", "my_msgs/msg/Other"),
+        6: ("/pose", "protobuf", SCHEMAS["GripperPose"][1]),
+    }))
+    assert {channel_id: plan[:2] + (plan[3],) for channel_id, plan in plans.items()} == {
+        1: ("copy", "sensor_msgs/msg/CompressedImage", 1),
+        2: ("convert", "sensor_msgs/msg/JointState", 2),
+        3: ("skip", "my.Type", 0),
+        4: ("convert", "sensor_msgs/msg/JointState", 3),
+        5: ("copy", "my_msgs/msg/Other", 4),
+        6: ("convert", "geometry_msgs/msg/PoseStamped", 5),
+    }
+    assert plans[1][2] == plans[5][2] == b"definition"
+    assert plans[2][2] == schema_file("joint_state.msg")
+
+
+def write_episode(path, encoding):
+    """The same episode in `encoding`: every schema mapped by tools/rosbag.py, in several chunks."""
+    rng = np.random.default_rng(0)
+    timestamps = np.arange(1_700_000_000_000, 1_700_000_000_000 + 40 * 20, 20)
+    with McapSink(str(path), encoding, chunk_size=4096) as sink:
+        for topic, schema_name, values in [
+            ("/data/action", "aloha_14dof", rng.normal(size=(40, 14))),
+            ("/data/observation.velocity", "aloha_14dof", rng.normal(size=(40, 14))),
+            ("/data/base_action", "aloha_2dof", rng.normal(size=(40, 2))),
+        ]:
+            sink.add_batch(sink.channel_id(topic, schema_name), timestamps, encode_joint_states(encoding, timestamps, values))
+        sink.add_batch(sink.channel_id("/tcp", "GripperPose"), timestamps, encode_poses(
+            encoding, timestamps.tolist(), rng.normal(size=(40, 7))
+        ))
+        sink.add_batch(sink.channel_id("/joint", "Vector"), timestamps, encode_vectors(
+            encoding, timestamps, rng.normal(size=(40, 7))
+        ))
+        batch = sink.channel_id("/force_torque", "VectorBatch")
+        force_torque = rng.normal(size=(40, 6))
+        for i in range(0, 40, 10):
+            sink.add(batch, timestamps[i], encode_vector_batch(encoding, timestamps[i:i + 10], force_torque[i:i + 10]))
+        images = sink.channel_id("/camera/color", "foxglove.CompressedImage")
+        depth = sink.channel_id("/camera/depth", "foxglove.RawImage")
+        video = sink.channel_id("/camera/video", "foxglove.CompressedVideo")
+        for ts in timestamps[::4].tolist():
+            sink.add(images, ts, encode_compressed_image(encoding, ts, "cam_1", rng.bytes(700), "jpeg"))
+            sink.add(depth, ts, encode_raw_image(encoding, ts, "cam_1", rng.integers(0, 4000, (6, 8), np.uint16), "16UC1"))
+            sink.add(video, ts, encode_compressed_video(encoding, ts, "cam_1", rng.bytes(300), "h264"))
+
+
+def read_bag(bag_path):
+    """{topic: [(schema name, log_time, decoded fields)]} of the bag's mcap file."""
+    (mcap_file,) = bag_path.glob("*.mcap")
+    messages = {}
+    with open(mcap_file, "rb") as f:
+        reader = make_reader(f, decoder_factories=[Ros2DecoderFactory()])
+        assert reader.get_header().profile == "ros2"
+        for schema, channel, message, value in reader.iter_decoded_messages(log_time_order=False):
+            assert channel.message_encoding == "cdr"
+            messages.setdefault(channel.topic, []).append((schema.name, message.log_time, to_plain(value)))
+    return messages
+
+
+def test_encodings_and_workers_give_the_same_bag(tmp_path):
+    bags = {}
+    for encoding in ["json", "protobuf", "cdr"]:
+        write_episode(tmp_path / f"{encoding}.mcap", encoding)
+        for workers in [1, 2]:
+            bag_path = tmp_path / f"{encoding}_{workers}"
+            counts = mcap_to_rosbag(tmp_path / f"{encoding}.mcap", bag_path, workers=workers)
+            assert (bag_path / "metadata.yaml").exists()
+            bags[encoding, workers] = read_bag(bag_path)
+            assert {topic: count for topic, (_, count) in counts.items()} == {
+                topic: len(messages) for topic, messages in bags[encoding, workers].items()
+            }
+
+    reference = bags["cdr", 1]
+    assert len(reference["/force_torque"]) == 40  # one Float64MultiArray per sample
+    assert {topic: messages[0][0] for topic, messages in reference.items()} == {
+        "/data/action": "sensor_msgs/msg/JointState",
+        "/data/observation.velocity": "sensor_msgs/msg/JointState",
+        "/data/base_action": "sensor_msgs/msg/JointState",
+        "/tcp": "geometry_msgs/msg/PoseStamped",
+        "/joint": "std_msgs/msg/Float64MultiArray",
+        "/force_torque": "std_msgs/msg/Float64MultiArray",
+        "/camera/color": "sensor_msgs/msg/CompressedImage",
+        "/camera/depth": "sensor_msgs/msg/Image",
+        "/camera/video": "foxglove_msgs/msg/CompressedVideo",
+    }
+    for key, bag in bags.items():
+        assert bag == reference, key
+
+
+def test_failed_conversion_can_be_rerun(tmp_path, monkeypatch):
+    write_episode(tmp_path / "cdr.mcap", "cdr")
+    bag_path = tmp_path / "bag"
+
+    def fail(self, function, args):
+        raise RuntimeError("conversion failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr("tools.rosbag.Converter.run", fail)
+        with pytest.raises(RuntimeError, match="conversion failed"):
+            mcap_to_rosbag(tmp_path / "cdr.mcap", bag_path)
+    assert not bag_path.exists()
+
+    mcap_to_rosbag(tmp_path / "cdr.mcap", bag_path)
+    assert sorted(path.name for path in bag_path.iterdir()) == ["bag_0.mcap", "metadata.yaml"]
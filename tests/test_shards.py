@@ -0,0 +1,73 @@
+import os
+import time
+
+from common.shards import ShardQueue, make_plan
+
+
+def test_make_plan_first_wins(tmp_path):
+    plan = make_plan(tmp_path, list(range(5)), shard_size=2)
+    assert plan["shards"] == {"shard_000000": [0, 1], "shard_000001": [2, 3], "shard_000002": [4]}
+    assert make_plan(tmp_path, list(range(10)), shard_size=5) == plan
+
+
+def test_shard_queue_claim_complete(tmp_path):
+    make_plan(tmp_path, ["a", "b"], shard_size=1)
+    first = ShardQueue(tmp_path, owner="first")
+    second = ShardQueue(tmp_path, owner="second")
+    assert first.claim() == "shard_000000"
+    assert second.claim() == "shard_000001"
+    assert first.claim(wait=False) is None  # both leased
+    assert first.status()["leased"] == 2
+
+    second.release("shard_000000")  # not its lease
+    assert first.lease_owner("shard_000000") == "first"
+    first.complete("shard_000000", {"episodes": 1})
+    second.complete("shard_000001")
+    assert first.pending() == []
+    assert first.claim() is None
+    assert first.status() == {"total": 2, "done": 2, "failed": 0, "leased": 0, "stale": 0, "waiting": 0}
+
+
+def test_shard_queue_reclaims_stale_lease(tmp_path, caplog):
+    make_plan(tmp_path, ["a"], shard_size=1)
+    lost = ShardQueue(tmp_path, lease_timeout=60, owner="lost")
+    assert lost.claim() == "shard_000000"
+    other = ShardQueue(tmp_path, lease_timeout=60, owner="other")
+    assert other.claim(wait=False) is None
+
+    # the lost worker stopped touching its lease 2 minutes ago
+    lease = tmp_path / "leases" / "shard_000000.lease"
+    old = time.time() - 120
+    os.utime(lease, (old, old))
+    assert other.is_stale("shard_000000")
+    assert other.status()["stale"] == 1
+    with caplog.at_level("WARNING", logger="common.shards"):
+        assert other.claim(wait=False) == "shard_000000"
+    assert "Reclaim stale lease of shard_000000" in caplog.text
+    assert other.lease_owner("shard_000000") == "other"
+    lost.release("shard_000000")  # no longer its lease: kept
+    assert lease.exists()
+
+
+def test_shard_queue_max_attempts(tmp_path):
+    make_plan(tmp_path, ["a"], shard_size=1)
+    queue = ShardQueue(tmp_path, max_attempts=2, owner="worker")
+    for attempt in range(2):
+        assert queue.claim(wait=False) == "shard_000000"
+        queue.fail("shard_000000", RuntimeError(f"attempt {attempt}"))
+    assert queue.attempts("shard_000000") == 2
+    assert queue.claim(wait=False) is None
+    assert queue.status()["failed"] == 1
+
+
+def test_shard_queue_heartbeat(tmp_path):
+    make_plan(tmp_path, ["a"], shard_size=1)
+    queue = ShardQueue(tmp_path, lease_timeout=1.0, heartbeat=0.05, owner="worker")
+    shard = queue.claim()
+    lease = tmp_path / "leases" / f"{shard}.lease"
+    old = time.time() - 0.9
+    os.utime(lease, (old, old))
+    with queue.heartbeat(shard):
+        time.sleep(0.3)
+    assert not queue.is_stale(shard)
+    assert time.time() - os.stat(lease).st_mtime < 0.5
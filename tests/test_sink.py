@@ -0,0 +1,168 @@
+import os
+
+
+import numpy as np
+import pytest
+from mcap.reader import make_reader
+
+from common.encoding import encode_compressed_image, encode_joint_state
+from common.sink import AsyncWriter, JointStateBlock, McapSink
+
+
+def read_messages(path):
+    with open(path, "rb") as f:
+        return [
+            (channel.topic, message.log_time, message.data)
+            for _, channel, message in make_reader(f).iter_messages(log_time_order=False)
+        ]
+
+
+def test_sink_caches_schemas_and_channels(tmp_path):
+    path = tmp_path / "episode.mcap"
+    states = [encode_joint_state("cdr", ts, np.full(14, ts, dtype=float)) for ts in range(3)]
+    with McapSink(str(path), "cdr") as sink:
+        action = sink.channel_id("/data/action", "aloha_14dof")
+        state = sink.channel_id("/data/observation.state", "aloha_14dof")
+        assert sink.channel_id("/data/action", "aloha_14dof") == action != state
+        sink.add(action, 0, states[0])
+        sink.add_batch(state, [0, 1, 2], states)
+        sink.add(action, 1, states[1])
+
+    assert read_messages(path) == [
+        ("/data/action", 0, states[0]),
+        *(("/data/observation.state", ts * 1_000_000, data) for ts, data in enumerate(states)),
+        ("/data/action", 1_000_000, states[1]),
+    ]
+    with open(path, "rb") as f:
+        summary = make_reader(f).get_summary()
+    assert len(summary.schemas) == 1 and len(summary.channels) == 2
+    assert {channel.message_encoding for channel in summary.channels.values()} == {"cdr"}
+
+
+def test_sink_writes_part_file_until_closed(tmp_path):
+    path = tmp_path / "episode.mcap"
+    with McapSink(str(path), "json") as sink:
+        sink.add(sink.channel_id("/data/action", "aloha_14dof"), 0, encode_joint_state("json", 0, np.zeros(14)))
+        assert os.listdir(tmp_path) == ["episode.mcap.part"]
+    assert os.listdir(tmp_path) == ["episode.mcap"]
+
+
+def test_sink_error_leaves_no_file(tmp_path):
+    path = tmp_path / "episode.mcap"
+    with pytest.raises(RuntimeError):
+        with McapSink(str(path), "json") as sink:
+            sink.add(sink.channel_id("/data/action", "aloha_14dof"), 0, encode_joint_state("json", 0, np.zeros(14)))
+            raise RuntimeError("reader failed")
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("encoding", ["json", "protobuf", "cdr"])
+def test_joint_state_block_order(tmp_path, encoding):
+    rng = np.random.default_rng(1)
+    rows = rng.normal(size=(10, 14))
+    images = [rng.bytes(40) for _ in range(10)]
+
+    def write(path, use_block):
+        with McapSink(str(path), encoding) as sink:
+            joints = sink.channel_id("/data/qpos", "aloha_14dof")
+            camera = sink.channel_id("/data/cam", "foxglove.CompressedImage")
+            block = JointStateBlock(sink, frames=3) if use_block else None
+            buffer = np.empty(14)
+            for ts, (row, image) in enumerate(zip(rows, images)):
+                image_data = encode_compressed_image(encoding, ts, "cam", image, "jpeg")
+                if use_block:
+                    buffer[:] = row  # reused buffer, as aloha_raw iter_rows
+                    block.add_joint_state(joints, ts, buffer)
+                    block.add(camera, ts, image_data)
+                    block.end_frame()
+                else:
+                    sink.add(joints, ts, encode_joint_state(encoding, ts, row))
+                    sink.add(camera, ts, image_data)
+            if use_block:
+                block.flush()
+
+    write(tmp_path / "direct.mcap", use_block=False)
+    write(tmp_path / "block.mcap", use_block=True)
+    assert read_messages(tmp_path / "block.mcap") == read_messages(tmp_path / "direct.mcap")
+
+
+def build(path, encoding, async_writes, queue_size=4):
+    """A small episode: joint states and images interleaved, one batch; chunks small enough to split."""
+    rng = np.random.default_rng(0)
+    with McapSink(str(path), encoding, async_writes=async_writes, queue_size=queue_size, chunk_size=4096) as sink:
+        joints = sink.channel_id("/data/action", "aloha_14dof")
+        camera = sink.channel_id("/data/cam_high", "foxglove.CompressedImage")
+        for ts in range(0, 2000, 20):
+            sink.add(joints, ts, encode_joint_state(encoding, ts, rng.normal(size=14)))
+            sink.add(camera, ts, encode_compressed_image(encoding, ts, "cam_high", rng.bytes(300), "jpeg"))
+        batch = sink.channel_id("/data/base_action", "aloha_2dof")
+        timestamps = list(range(0, 2000, 20))
+        sink.add_batch(batch, timestamps, [encode_joint_state(encoding, ts, rng.normal(size=2)) for ts in timestamps])
+
+
+@pytest.mark.parametrize("encoding", ["json", "protobuf", "cdr"])
+def test_async_writes_same_file(tmp_path, encoding):
+    build(tmp_path / "sync.mcap", encoding, async_writes=False)
+    build(tmp_path / "async.mcap", encoding, async_writes=True)
+    assert (tmp_path / "sync.mcap").read_bytes() == (tmp_path / "async.mcap").read_bytes()
+    assert not os.path.exists(tmp_path / "async.mcap.part")
+
+
+class RecordingWriter:
+    """Stands for mcap.writer.Writer: records the calls, fails on the message `fail_on`."""
+
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+        self.schemas = self.channels = 0
+
+    def register_schema(self, name, encoding, data):
+        self.schemas += 1
+        return self.schemas
+
+    def register_channel(self, topic, message_encoding, schema_id, metadata):
+        self.channels += 1
+        return self.channels
+
+    def add_message(self, channel_id, log_time, data, publish_time, sequence=0):
+        if data == self.fail_on:
+            raise OSError("disk full")
+        self.calls.append((channel_id, log_time, data))
+
+    def finish(self):
+        self.calls.append("finish")
+
+
+def test_async_writer_keeps_order():
+    writer = RecordingWriter()
+    async_writer = AsyncWriter(writer, queue_size=2)
+    assert async_writer.register_schema("s", "json", b"") == 1
+    assert [async_writer.register_channel(f"/t{i}", "json", 1) for i in range(3)] == [1, 2, 3]
+    expected = []
+    for i in range(50):
+        async_writer.add_message(i % 3 + 1, i, b"%d" % i, i)
+        expected.append((i % 3 + 1, i, b"%d" % i))
+    async_writer.add_messages(1, [50, 51], [b"50", b"51"])
+    async_writer.finish()
+    assert writer.calls == expected + [(1, 50, b"50"), (1, 51, b"51"), "finish"]
+
+
+def test_async_writer_raises_thread_error():
+    writer = RecordingWriter(fail_on=b"3")
+    async_writer = AsyncWriter(writer, queue_size=1)
+    with pytest.raises(OSError, match="disk full"):
+        for i in range(1000):
+            async_writer.add_message(1, i, b"%d" % i, i)
+        async_writer.finish()
+    # nothing after the failed message was written
+    assert writer.calls == [(1, i, b"%d" % i) for i in range(3)]
+    async_writer.abort()
+
+
+def test_async_sink_error_leaves_no_file(tmp_path):
+    path = tmp_path / "episode.mcap"
+    with pytest.raises(RuntimeError):
+        with McapSink(str(path), "json", async_writes=True) as sink:
+            sink.add(sink.channel_id("/data/action", "aloha_14dof"), 0, encode_joint_state("json", 0, np.zeros(14)))
+            raise RuntimeError("reader failed")
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from common.video import iter_video_packets
+
+
+def write_h264(path, frames=12, b_frames=0):
+    import av
+
+    with av.open(str(path), "w") as container:
+        stream = container.add_stream("libx264", rate=10)
+        stream.width, stream.height, stream.pix_fmt = 64, 48, "yuv420p"
+        stream.options = {"bf": str(b_frames), "g": "6"}
+        for i in range(frames):
+            image = np.full((48, 64, 3), i * 20, dtype=np.uint8)
+            image[:, i * 4:i * 4 + 8] = 255
+            for packet in stream.encode(av.VideoFrame.from_ndarray(image, format="rgb24")):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return path
+
+
+def test_packets_in_presentation_order(tmp_path):
+    packets = list(iter_video_packets(write_h264(tmp_path / "color.mp4")))
+    assert [frame_index for frame_index, _, _ in packets] == list(range(12))
+    assert {video_format for _, _, video_format in packets} == {"h264"}
+    # Annex B start codes, SPS/PPS in front of the keyframes
+    assert all(data.startswith((b"\x00\x00\x00\x01", b"\x00\x00\x01")) for _, data, _ in packets)
+
+
+def test_b_frames_rejected(tmp_path):
+    with pytest.raises(ValueError, match="B-frames"):
+        list(iter_video_packets(write_h264(tmp_path / "color.mp4", b_frames=2)))
@@ -0,0 +1,179 @@
+"""
+Batch conversion of a corpus: RH20T scenes or LeRobot / raw ALOHA episodes found under a root,
+split in shards claimed by worker processes through lease files (common/shards.py).
+
+    $ export PYTHONPATH=/project/path
+    $ python tools/batch.py rh20t /data/RH20T output_rh20t --processes 8 --options '{"encoding": "cdr"}'
+
+Run the same command on several machines sharing `work_dir` (default output_root/.batch) to
+spread the shards over them: a worker that dies leaves a lease which stops being refreshed,
+its shard is claimed again by another worker after lease_timeout. Builds are idempotent
+(manifest.json skips finished outputs, outputs are renamed from `.part` when complete),
+so a rerun or a re-claimed shard only builds what is missing.
+
+Outputs mirror the input tree: output_root/<scene parent>/<scene name>.mcap for RH20T,
+output_root/<dataset>/episode_<n>.mcap for episodes.
+"""
+import json
+import os
+import time
+from collections import defaultdict
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Literal, Optional
+
+import tyro
+
+from common.manifest import Manifest
+from common.registry import load_builder
+from common.shards import PLAN_FILE, ShardQueue, make_plan
+
+Builder = Literal["rh20t", "aloha_lerobot", "aloha_raw"]
+
+
+def discover_rh20t_scenes(root):
+    """Scene directories (with transformed/ or cam_* sub directories) under root, relative to it."""
+    scenes = []
+    for path, dirs, _ in os.walk(root):
+        if "transformed" in dirs or any(name.startswith("cam_") for name in dirs):
+            scenes.append(os.path.relpath(path, root))
+            dirs.clear()  # do not walk into the scene
+        dirs.sort()
+    return sorted(scenes)
+
+
+def discover_lerobot_episodes(root):
+    """[dataset directory relative to root, episode index] of every LeRobot dataset (meta/episodes.jsonl)."""
+    units = []
+    for path, dirs, _ in os.walk(root):
+        episodes_file = os.path.join(path, "meta", "episodes.jsonl")
+        if os.path.exists(episodes_file):
+            with open(episodes_file, "r") as f:
+                episodes = sorted(json.loads(line)["episode_index"] for line in f if line.strip())
+            units += [[os.path.relpath(path, root), ep_idx] for ep_idx in episodes]
+            dirs.clear()
+        dirs.sort()
+    return units
+
+
+def discover_aloha_raw_episodes(root):
+    """[dataset directory relative to root, episode index] of every episode_<n>.hdf5."""
+    units = []
+    for path, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in files:
+            stem, extension = os.path.splitext(name)
+            if extension == ".hdf5" and stem.startswith("episode_") and stem[8:].isdigit():
+                units.append([os.path.relpath(path, root), int(stem[8:])])
+    return sorted(units)
+
+
+DISCOVER = {
+    "rh20t": discover_rh20t_scenes,
+    "aloha_lerobot": discover_lerobot_episodes,
+    "aloha_raw": discover_aloha_raw_episodes,
+}
+
+
+def prepare_output(output_dir):
+    """Output directory with a manifest, so episode builders of other shards accept it as non empty."""
+    os.makedirs(output_dir, exist_ok=True)
+    Manifest(output_dir).create()
+
+
+def run_shard(builder, units, input_root, output_root, options):
+    """Build the units of one shard. Return the number of outputs; raise if any unit failed."""
+    errors = []
+    mcap_builder = load_builder(builder)
+    if builder == "rh20t":
+        for scene in units:
+            output_dir = os.path.normpath(os.path.join(output_root, os.path.dirname(scene)))
+            os.makedirs(output_dir, exist_ok=True)
+            output_mcap = os.path.join(output_dir, f"{os.path.basename(scene)}.mcap")
+            try:
+                mcap_builder(output_mcap, os.path.join(input_root, scene), **options)
+            except Exception as e:
+                errors.append(f"{scene}: {e!r}")
+    else:
+        datasets = defaultdict(list)
+        for dataset, ep_idx in units:
+            datasets[dataset].append(ep_idx)
+        for dataset, episodes in datasets.items():
+            output_dir = os.path.normpath(os.path.join(output_root, dataset))
+            prepare_output(output_dir)
+            try:
+                mcap_builder(os.path.join(input_root, dataset), output_dir, episodes=tuple(episodes), **options)
+            except Exception as e:
+                errors.append(f"{dataset} {episodes}: {e!r}")
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return len(units)
+
+
+def run_worker(work_dir, builder, input_root, output_root, options, lease_timeout, heartbeat, max_attempts):
+    """Claim and build shards until every shard is done or failed max_attempts times."""
+    queue = ShardQueue(work_dir, lease_timeout, heartbeat, max_attempts)
+    while (shard := queue.claim()) is not None:
+        start = time.time()
+        with queue.heartbeat(shard):
+            try:
+                built = run_shard(builder, queue.shards[shard], input_root, output_root, options)
+            except Exception as e:
+                print(f"Shard {shard} failed (attempt {queue.attempts(shard) + 1}/{max_attempts}): {e}")
+                queue.fail(shard, e)
+                continue
+        queue.complete(shard, {"units": built, "seconds": time.time() - start})
+        print(f"Finish shard {shard} ({built} units) in {time.time() - start:.2f} seconds")
+
+
+def main(
+        builder: tyro.conf.Positional[Builder],
+        input_root: tyro.conf.Positional[Path],
+        output_root: tyro.conf.Positional[Path],
+        work_dir: Optional[Path] = None,
+        shard_size: int = 16,
+        processes: int = 1,
+        options: str = "{}",
+        lease_timeout: float = 600.0,
+        heartbeat: float = 30.0,
+        max_attempts: int = 3,
+        status: bool = False,
+):
+    """
+    Convert every RH20T scene / LeRobot episode / raw ALOHA episode under input_root.
+    - work_dir: plan, leases and shard results, shared by all workers (default output_root/.batch).
+      The plan is made by the first worker; later runs with the same work_dir resume it.
+    - shard_size: scenes / episodes per shard.
+    - processes: worker processes on this machine (run the command on other machines to add more).
+    - options: builder options as JSON, e.g. '{"encoding": "cdr", "image_format": "jpeg"}'.
+    - lease_timeout / heartbeat: a shard whose lease was not refreshed for lease_timeout
+      seconds (refreshed every heartbeat seconds) is claimed again.
+    - max_attempts: a failing shard is retried up to this many times.
+    - status: print the shard counts and exit.
+    """
+    input_root, output_root = os.path.abspath(input_root), os.path.abspath(output_root)
+    work_dir = os.path.abspath(work_dir or os.path.join(output_root, ".batch"))
+    if status:
+        print(ShardQueue(work_dir, lease_timeout, heartbeat, max_attempts).status())
+        return
+    if not os.path.exists(os.path.join(work_dir, PLAN_FILE)):
+        start = time.time()
+        units = DISCOVER[builder](input_root)
+        plan = make_plan(work_dir, units, shard_size)
+        print(f"Found {len(units)} units in {time.time() - start:.2f} seconds, {len(plan['shards'])} shards")
+
+    args = (work_dir, builder, input_root, output_root, json.loads(options), lease_timeout, heartbeat, max_attempts)
+    if processes > 1:
+        context = get_context("spawn")
+        workers = [context.Process(target=run_worker, args=args) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    else:
+        run_worker(*args)
+    print(ShardQueue(work_dir, lease_timeout, heartbeat, max_attempts).status())
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
@@ -0,0 +1,96 @@
+"""
+Backfill the dataset catalog (common/catalog.py) of an output directory.
+
+    $ export PYTHONPATH=/project/path
+    $ python tools/catalog.py output_dir --workers 16
+    $ sqlite3 output_dir/catalog.sqlite "SELECT source, message_count FROM channels WHERE topic = '/data/action'"
+
+Every `*.mcap` under output_dir (recursively) is cataloged from its summary section only,
+so thousands of files are indexed in seconds. Files already in the catalog with the same
+size and mtime are skipped, rows of deleted files are removed. Source and builder of
+files recorded by a builder are kept when they are re-indexed.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import tyro
+
+from common.catalog import Catalog, summary_rows
+from common.preview import PREVIEW_SUFFIX
+
+
+def find_mcap_files(output_dir):
+    """
+    MCAP files under output_dir, without the `.part` files of builds in progress and
+    without the `.preview.mcap` copies (common/preview.py).
+    """
+    return sorted(
+        str(path) for path in Path(output_dir).rglob("*.mcap")
+        if path.is_file() and not path.name.endswith(PREVIEW_SUFFIX)
+    )
+
+
+def index_directory(output_dir, catalog_path=None, workers=8, force=False):
+    """
+    Catalog every MCAP file of output_dir. Return (indexed, skipped up to date, failed, removed)
+    file counts; files without summary section are reported and left out.
+    """
+    mcap_files = find_mcap_files(output_dir)
+    with Catalog(output_dir, catalog_path) as catalog:
+        states = catalog.file_states()
+        pending = []
+        for mcap_file in mcap_files:
+            stat = os.stat(mcap_file)
+            state = states.get(catalog.relative_path(mcap_file))
+            if force or state is None or state[:2] != (stat.st_size, stat.st_mtime_ns):
+                pending.append((mcap_file, state))
+
+        def read_rows(item):
+            mcap_file, state = item
+            try:
+                # Keep source / builder recorded by the builder
+                return mcap_file, summary_rows(mcap_file, *(state[2:] if state else ())), None
+            except Exception as e:
+                return mcap_file, None, e
+
+        failed = 0
+        # Summaries are small reads at the end of each file: threads overlap the I/O latency
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for mcap_file, rows, error in executor.map(read_rows, pending):
+                if error is not None:
+                    print(f"Skip {mcap_file}: {error}")
+                    failed += 1
+                    continue
+                catalog.record_rows(mcap_file, rows)
+
+        existing = {catalog.relative_path(mcap_file) for mcap_file in mcap_files}
+        removed = [path for path in states if path not in existing]
+        catalog.remove(removed)
+    return len(pending) - failed, len(mcap_files) - len(pending), failed, len(removed)
+
+
+def main(
+        output_dir: tyro.conf.Positional[Path],
+        catalog_path: Optional[Path] = None,
+        workers: int = 8,
+        force: bool = False,
+):
+    """
+    Backfill output_dir/catalog.sqlite from the summary section of every MCAP file under output_dir.
+    - catalog_path: write the catalog to this file instead (paths stay relative to output_dir).
+    - workers: threads reading summaries.
+    - force: re-index files even if their size and mtime did not change.
+    """
+    start = time.perf_counter()
+    indexed, skipped, failed, removed = index_directory(output_dir, catalog_path, workers, force)
+    print(
+        f"Cataloged {output_dir}: {indexed} indexed, {skipped} up to date, {failed} failed, "
+        f"{removed} removed in {time.perf_counter() - start:.2f} seconds"
+    )
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
@@ -0,0 +1,511 @@
+"""
+Indexed MCAP query: extract some topics over a time range without scanning the file.
+
+    $ export PYTHONPATH=/project/path
+    $ python tools/query.py scene.mcap --topics "/data/*/color" --start 30 --end 40 --output cut.mcap
+    $ python tools/query.py episode_0.mcap --topics /data/observation.state --output state/
+
+Only the summary section is read to plan the query (schemas, channels, chunk indexes).
+For every chunk overlapping the time range, the message index records of the selected
+channels (stored right after the chunk) give the log time and offset of each message:
+chunks without a selected message in range are never read, the others are read and
+decompressed in a thread pool (zstd / lz4 release the GIL), and only the selected
+messages are sliced out of them. The cost follows the size of the result, not of the file.
+Files without chunk indexes (unchunked, or no summary) fall back to a linear scan.
+"""
+import base64
+import heapq
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import tyro
+from mcap.reader import NonSeekingReader, SeekingReader
+from mcap.records import Message
+
+from common.encoding import SCHEMAS
+from common.metrics import NULL_METRICS
+from common.sink import McapSink
+
+MESSAGE_OPCODE = 0x05
+MESSAGE_INDEX_OPCODE = 0x07
+MESSAGE_INDEX_ENTRY = np.dtype([("log_time", "<u8"), ("offset", "<u8")])
+# opcode (1) + record length (8)
+RECORD_PREFIX = 9
+# channel_id (2) + sequence (4) + log_time (8) + publish_time (8)
+MESSAGE_HEADER = 22
+
+
+def schema_names(name):
+    """Names of schema `name` (common.encoding.SCHEMAS) in every encoding: json, protobuf, ros2msg."""
+    return {name, SCHEMAS[name][1], SCHEMAS[name][3]}
+
+
+COMPRESSED_IMAGE_SCHEMAS = schema_names("foxglove.CompressedImage")
+RAW_IMAGE_SCHEMAS = schema_names("foxglove.RawImage")
+COMPRESSED_VIDEO_SCHEMAS = schema_names("foxglove.CompressedVideo")
+
+
+def decompress(compression, data, uncompressed_size):
+    if compression == "":
+        return data
+    if compression == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=uncompressed_size)
+    if compression == "lz4":
+        import lz4.frame
+        return lz4.frame.decompress(data)
+    raise ValueError(f"Unsupported chunk compression: {compression}")
+
+
+class IndexedReader:
+    """
+    Random access to the messages of one MCAP file through its summary and indexes.
+    Times are in nanoseconds, `end_time` is exclusive (as in mcap.reader).
+    """
+
+    def __init__(self, path, workers=4, metrics=NULL_METRICS):
+        self.path = path
+        self.workers = workers
+        self.metrics = metrics
+        self._file = open(path, "rb")
+        self._fd = self._file.fileno()
+        self.file_size = os.fstat(self._fd).st_size
+        with metrics.timer("summary_read"):
+            self.summary = SeekingReader(self._file).get_summary()
+        self.stats = {"chunks": 0, "chunks_read": 0, "bytes_read": 0}
+        self._stats_lock = threading.Lock()  # chunks are read in pool threads
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    @property
+    def indexed(self):
+        return self.summary is not None and len(self.summary.chunk_indexes) > 0
+
+    def channels(self, topics=None):
+        """{channel_id: channel} whose topic equals or matches (fnmatch) one of `topics`, all if None."""
+        channels = self.summary.channels if self.summary is not None else {}
+        if not topics:
+            return dict(channels)
+        return {
+            channel_id: channel for channel_id, channel in channels.items()
+            if any(channel.topic == topic or fnmatchcase(channel.topic, topic) for topic in topics)
+        }
+
+    def schema(self, channel):
+        return self.summary.schemas.get(channel.schema_id) if channel.schema_id else None
+
+    def _pread(self, size, offset):
+        data = os.pread(self._fd, size, offset)
+        with self._stats_lock:
+            self.stats["bytes_read"] += len(data)
+        return data
+
+    def _index_entries(self, chunk_index, channel_ids, start_time, end_time):
+        """
+        (log_time, offset) records of the selected messages of one chunk, from its message
+        index records, sorted by (log_time, offset). None if the chunk has no message index.
+        """
+        offsets = {
+            channel_id: offset for channel_id, offset in chunk_index.message_index_offsets.items()
+            if channel_id in channel_ids
+        }
+        if not offsets:
+            return np.empty(0, MESSAGE_INDEX_ENTRY)
+        if not chunk_index.message_index_length:
+            return None
+        # Message index records of a chunk are contiguous, right after it
+        region_start = chunk_index.chunk_start_offset + chunk_index.chunk_length
+        first = min(offsets.values())
+        region = self._pread(
+            chunk_index.message_index_length - (first - region_start), first
+        )
+        entries = []
+        for offset in offsets.values():
+            position = offset - first
+            if region[position] != MESSAGE_INDEX_OPCODE:
+                raise ValueError(f"{self.path}: no message index record at offset {offset}")
+            count = int.from_bytes(region[position + 11:position + 15], "little") // MESSAGE_INDEX_ENTRY.itemsize
+            records = np.frombuffer(region, MESSAGE_INDEX_ENTRY, count, position + 15)
+            keep = np.ones(count, dtype=bool)
+            if start_time is not None:
+                keep &= records["log_time"] >= start_time
+            if end_time is not None:
+                keep &= records["log_time"] < end_time
+            entries.append(records[keep])
+        entries = np.concatenate(entries)
+        return entries[np.lexsort((entries["offset"], entries["log_time"]))]
+
+    def plan(self, topics=None, start_time=None, end_time=None):
+        """
+        [(chunk_index, entries)] of the chunks to read, sorted by message start time.
+        Chunks outside [start_time, end_time), or whose message index has no selected
+        message in range, are left out: only the summary and message indexes are read.
+        """
+        channel_ids = set(self.channels(topics))
+        chunks = []
+        for chunk_index in self.summary.chunk_indexes:
+            self.stats["chunks"] += 1
+            if start_time is not None and chunk_index.message_end_time < start_time:
+                continue
+            if end_time is not None and chunk_index.message_start_time >= end_time:
+                continue
+            if not channel_ids.intersection(chunk_index.message_index_offsets):
+                continue
+            with self.metrics.timer("message_index_read"):
+                entries = self._index_entries(chunk_index, channel_ids, start_time, end_time)
+            if entries is None or len(entries):
+                chunks.append((chunk_index, entries))
+        chunks.sort(key=lambda chunk: (chunk[0].message_start_time, chunk[0].chunk_start_offset))
+        return chunks
+
+    def read_chunk_records(self, chunk_index):
+        """Compressed records of one chunk (as stored, see `decompress`), read with one pread."""
+        with self.metrics.timer("chunk_read"):
+            record = self._pread(chunk_index.chunk_length, chunk_index.chunk_start_offset)
+        position = RECORD_PREFIX + 8 + 8 + 8 + 4  # start time, end time, uncompressed size, crc
+        compression_length = int.from_bytes(record[position:position + 4], "little")
+        position += 4 + compression_length
+        records_length = int.from_bytes(record[position:position + 8], "little")
+        position += 8
+        return memoryview(record)[position:position + records_length]
+
+    def _read_chunk(self, chunk_index, entries, channel_ids, start_time, end_time):
+        """Read and decompress one chunk, return its selected messages as [(log_time, offset, Message)]."""
+        compressed = self.read_chunk_records(chunk_index)
+        with self.metrics.timer("chunk_decompress"):
+            data = decompress(chunk_index.compression, compressed, chunk_index.uncompressed_size)
+        with self._stats_lock:
+            self.stats["chunks_read"] += 1
+
+        messages = []
+        if entries is not None:
+            for log_time, offset in entries.tolist():
+                messages.append((log_time, offset, parse_message(data, offset)))
+            return messages
+        # No message index: walk the records of the chunk
+        for offset, message in iter_chunk_messages(data):
+            if (
+                    message.channel_id in channel_ids
+                    and (start_time is None or message.log_time >= start_time)
+                    and (end_time is None or message.log_time < end_time)
+            ):
+                messages.append((message.log_time, offset, message))
+        messages.sort(key=lambda item: (item[0], item[1]))
+        return messages
+
+    def iter_messages(self, topics=None, start_time=None, end_time=None):
+        """
+        Yield (schema, channel, message) of `topics` (exact names or fnmatch patterns, all if None)
+        logged in [start_time, end_time), in log time order.
+        """
+        if not self.indexed:
+            yield from self._scan(topics, start_time, end_time)
+            return
+        channels = self.channels(topics)
+        chunks = self.plan(topics, start_time, end_time)
+        channel_ids = set(channels)
+        schemas = {channel_id: self.schema(channel) for channel_id, channel in channels.items()}
+
+        # Chunks are read / decompressed ahead in the pool, results are consumed in plan order.
+        # A message can be yielded once no later chunk can start before it (chunks may overlap).
+        pending = []
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+            window = deque()
+            next_chunk = 0
+            for chunk_idx in range(len(chunks)):
+                while next_chunk < len(chunks) and len(window) < 2 * max(self.workers, 1):
+                    chunk_index, entries = chunks[next_chunk]
+                    window.append(executor.submit(
+                        self._read_chunk, chunk_index, entries, channel_ids, start_time, end_time
+                    ))
+                    next_chunk += 1
+                chunk_index = chunks[chunk_idx][0]
+                for log_time, offset, message in window.popleft().result():
+                    heapq.heappush(pending, (log_time, chunk_index.chunk_start_offset, offset, message))
+                bound = chunks[chunk_idx + 1][0].message_start_time if chunk_idx + 1 < len(chunks) else None
+                while pending and (bound is None or pending[0][0] < bound):
+                    message = heapq.heappop(pending)[3]
+                    yield schemas[message.channel_id], channels[message.channel_id], message
+
+    def _scan(self, topics, start_time, end_time):
+        """Linear scan for files without chunk indexes: reads the whole file."""
+        self._file.seek(0)
+        self.stats["bytes_read"] += self.file_size
+        for schema, channel, message in NonSeekingReader(self._file).iter_messages():
+            if topics and not any(channel.topic == topic or fnmatchcase(channel.topic, topic) for topic in topics):
+                continue
+            if start_time is not None and message.log_time < start_time:
+                continue
+            if end_time is not None and message.log_time >= end_time:
+                continue
+            yield schema, channel, message
+
+
+def parse_message(data, offset):
+    """Message record at `offset` of a decompressed chunk."""
+    length = int.from_bytes(data[offset + 1:offset + RECORD_PREFIX], "little")
+    header = offset + RECORD_PREFIX
+    return Message(
+        channel_id=int.from_bytes(data[header:header + 2], "little"),
+        sequence=int.from_bytes(data[header + 2:header + 6], "little"),
+        log_time=int.from_bytes(data[header + 6:header + 14], "little"),
+        publish_time=int.from_bytes(data[header + 14:header + 22], "little"),
+        data=bytes(data[header + MESSAGE_HEADER:header + length]),
+    )
+
+
+def iter_chunk_messages(data):
+    """Yield (offset, Message) of every message record of a decompressed chunk, in file order."""
+    offset, size = 0, len(data)
+    while offset < size:
+        length = int.from_bytes(data[offset + 1:offset + RECORD_PREFIX], "little")
+        if data[offset] == MESSAGE_OPCODE:
+            yield offset, parse_message(data, offset)
+        offset += RECORD_PREFIX + length
+
+
+def query(path, topics=None, start_time=None, end_time=None, workers=4, metrics=NULL_METRICS):
+    """Yield (schema, channel, message) of `topics` in [start_time, end_time) (ns) of the MCAP file `path`."""
+    with IndexedReader(path, workers, metrics) as reader:
+        yield from reader.iter_messages(topics, start_time, end_time)
+
+
+def export_mcap(messages, output_path, metrics=NULL_METRICS, **writer_options):
+    """Copy (schema, channel, message) tuples to a new MCAP file, messages untouched. Return the count."""
+    count = 0
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with McapSink(output_path, metrics=metrics, **writer_options) as sink:
+        for schema, channel, message in messages:
+            sink.add_record(sink.copy_channel(schema, channel), message)
+            count += 1
+    return count
+
+
+class MessageDecoder:
+    """Decode messages of any encoding (json, protobuf, ros2 cdr) to plain dicts, one decoder per schema."""
+
+    def __init__(self):
+        self._decoders = {}
+        self._factories = None
+
+    def _decoder(self, schema, channel):
+        key = (channel.message_encoding, schema.id if schema else 0)
+        decoder = self._decoders.get(key)
+        if decoder is None:
+            if channel.message_encoding == "json":
+                decoder = json.loads
+            else:
+                if self._factories is None:
+                    from mcap_protobuf.decoder import DecoderFactory as ProtobufDecoderFactory
+                    from mcap_ros2.decoder import DecoderFactory as Ros2DecoderFactory
+                    self._factories = [ProtobufDecoderFactory(), Ros2DecoderFactory()]
+                for factory in self._factories:
+                    decoder = factory.decoder_for(channel.message_encoding, schema)
+                    if decoder is not None:
+                        break
+                if decoder is None:
+                    raise ValueError(f"No decoder for {channel.topic} ({channel.message_encoding})")
+            self._decoders[key] = decoder
+        return decoder
+
+    def decode(self, schema, channel, message):
+        return to_plain(self._decoder(schema, channel)(message.data))
+
+
+def to_plain(value):
+    """Decoded protobuf / ros2 message -> dicts, lists and scalars."""
+    if hasattr(value, "DESCRIPTOR"):
+        return {field.name: to_plain(getattr(value, field.name)) for field in value.DESCRIPTOR.fields}
+    if hasattr(value, "__slots__") and not isinstance(value, (bytes, str)):
+        return {name: to_plain(getattr(value, name)) for name in value.__slots__}
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) or type(value).__name__.startswith("Repeated"):
+        return [to_plain(item) for item in value]
+    return value
+
+
+def message_bytes(value):
+    """`data` field of an image / video message: raw bytes, or base64 in json."""
+    return base64.b64decode(value) if isinstance(value, str) else bytes(value)
+
+
+def numeric_fields(value, prefix=""):
+    """{field path: number or list of numbers} of a decoded message, headers and timestamps left out."""
+    fields = {}
+    for key, item in value.items():
+        if key in ("timestamp", "header"):
+            continue
+        path = f"{prefix}{key}"
+        if isinstance(item, dict):
+            fields.update(numeric_fields(item, f"{path}."))
+        elif isinstance(item, bool) or isinstance(item, (int, float)):
+            fields[path] = item
+        elif isinstance(item, list) and item and all(isinstance(x, (int, float)) for x in item):
+            fields[path] = item
+    return fields
+
+
+def topic_file_name(topic):
+    return topic.strip("/").replace("/", "__") or "root"
+
+
+def raw_image_array(fields):
+    data = np.frombuffer(message_bytes(fields["data"]), dtype=np.uint8)
+    height, width, step = fields["height"], fields["width"], fields["step"]
+    rows = data[:height * step].reshape(height, step)
+    image_encoding = fields["encoding"]
+    if image_encoding in ("16UC1", "mono16"):
+        return rows.view("<u2")[:, :width]
+    channels = {"rgb8": 3, "bgr8": 3, "rgba8": 4, "bgra8": 4}.get(image_encoding, 1)
+    return rows[:, :width * channels].reshape(height, width, channels).squeeze()
+
+
+def export_files(messages, output_dir):
+    """
+    Write (schema, channel, message) tuples as plain files in `output_dir`, one entry per topic:
+    - compressed images: <topic>/<log_time>.<format> (JPEG / PNG bytes as stored),
+    - raw images: <topic>/<log_time>.png (8/16 bit), or .npy for other encodings,
+    - compressed video: <topic>.<format> (Annex B / OBU stream) and <topic>.npz (log_time),
+    - everything else: <topic>.npz with log_time (ns) and one array per numeric field;
+      VectorBatch messages are unpacked to one row per sample (log_time = sample time).
+    Return {topic: message count}.
+    """
+    import cv2
+    os.makedirs(output_dir, exist_ok=True)
+    decoder = MessageDecoder()
+    counts = defaultdict(int)
+    columns = defaultdict(lambda: defaultdict(list))
+    videos = {}
+    try:
+        for schema, channel, message in messages:
+            topic, name = channel.topic, topic_file_name(channel.topic)
+            schema_name = schema.name if schema else ""
+            fields = decoder.decode(schema, channel, message)
+            counts[topic] += 1
+            if schema_name in COMPRESSED_IMAGE_SCHEMAS:
+                os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+                image_path = os.path.join(output_dir, name, f"{message.log_time}.{fields['format'] or 'bin'}")
+                with open(image_path, "wb") as f:
+                    f.write(message_bytes(fields["data"]))
+            elif schema_name in RAW_IMAGE_SCHEMAS:
+                os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+                image = raw_image_array(fields)
+                if fields["encoding"] in ("rgb8", "rgba8"):
+                    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR if image.shape[-1] == 3 else cv2.COLOR_RGBA2BGRA)
+                if fields["encoding"] in ("rgb8", "bgr8", "rgba8", "bgra8", "mono8", "8UC1", "16UC1", "mono16"):
+                    cv2.imwrite(os.path.join(output_dir, name, f"{message.log_time}.png"), image)
+                else:
+                    np.save(os.path.join(output_dir, name, f"{message.log_time}.npy"), image)
+            elif schema_name in COMPRESSED_VIDEO_SCHEMAS:
+                if topic not in videos:
+                    videos[topic] = open(os.path.join(output_dir, f"{name}.{fields['format']}"), "wb")
+                videos[topic].write(message_bytes(fields["data"]))
+                columns[topic]["log_time"].append(message.log_time)
+            elif "sample_time_ns" in fields:
+                values = np.asarray(fields["values"], dtype=np.float64).reshape(-1, fields["dim"])
+                columns[topic]["log_time"].extend(fields["sample_time_ns"])
+                columns[topic]["values"].extend(values)
+            else:
+                columns[topic]["log_time"].append(message.log_time)
+                for path, value in numeric_fields(fields).items():
+                    columns[topic][path].append(value)
+    finally:
+        for video in videos.values():
+            video.close()
+
+    for topic, topic_columns in columns.items():
+        arrays = {}
+        for path, values in topic_columns.items():
+            if len({np.shape(value) for value in values}) > 1:
+                # Ragged rows: flat values and the start offset of each row
+                arrays[f"{path}.offsets"] = np.cumsum([0] + [len(value) for value in values])
+                values = np.concatenate([np.ravel(value) for value in values])
+            arrays[path] = np.asarray(values, dtype=np.uint64 if path == "log_time" else None)
+        np.savez(os.path.join(output_dir, f"{topic_file_name(topic)}.npz"), **arrays)
+    return dict(counts)
+
+
+def print_info(reader):
+    """Topics, message counts, time range and chunks of the file, from its summary only."""
+    summary = reader.summary
+    if summary is None:
+        print(f"{reader.path}: no summary section, queries will scan the whole file")
+        return
+    statistics = summary.statistics
+    counts = statistics.channel_message_counts if statistics else {}
+    if statistics:
+        print(
+            f"{reader.path}: {statistics.message_count} messages, "
+            f"{statistics.message_start_time / 1e9:.3f} - {statistics.message_end_time / 1e9:.3f} s, "
+            f"{len(summary.chunk_indexes)} chunks, {reader.file_size / 1e6:.1f} MB"
+        )
+    for channel_id, channel in sorted(summary.channels.items(), key=lambda item: item[1].topic):
+        schema = reader.schema(channel)
+        print(f"  {channel.topic:60s} {counts.get(channel_id, '?'):>8} {schema.name if schema else ''}")
+
+
+def main(
+        mcap_path: tyro.conf.Positional[Path],
+        output: Optional[Path] = None,
+        topics: Tuple[str, ...] = (),
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        absolute: bool = False,
+        workers: int = 4,
+):
+    """
+    Extract topics and a time range of an MCAP file, reading only the chunks that hold them.
+    - output: "*.mcap" writes a new MCAP file (messages copied as-is), anything else is a
+      directory of numpy / image files (see export_files). Without output, print the topics,
+      message counts and time range of the file (summary only).
+    - topics: exact topic names or fnmatch patterns ("/data/*/color"), all topics if empty.
+    - start / end: seconds from the first message of the file, or Unix time in seconds with
+      absolute = True; end is exclusive.
+    - workers: threads reading and decompressing chunks.
+    """
+    with IndexedReader(mcap_path, workers) as reader:
+        if output is None:
+            print_info(reader)
+            return
+        origin = 0
+        if not absolute:
+            statistics = reader.summary.statistics if reader.summary is not None else None
+            if (start is not None or end is not None) and statistics is None:
+                raise ValueError(f"{mcap_path} has no statistics, use absolute times")
+            origin = statistics.message_start_time if statistics else 0
+        start_time = origin + round(start * 1e9) if start is not None else None
+        end_time = origin + round(end * 1e9) if end is not None else None
+
+        query_start = time.perf_counter()
+        messages = reader.iter_messages(list(topics) or None, start_time, end_time)
+        if str(output).endswith(".mcap"):
+            count = export_mcap(messages, output)
+        else:
+            count = sum(export_files(messages, output).values())
+        stats = reader.stats
+        print(
+            f"{count} messages to {output} in {time.perf_counter() - query_start:.2f} s: "
+            f"read {stats['chunks_read']}/{stats['chunks']} chunks, "
+            f"{stats['bytes_read'] / 1e6:.1f} of {reader.file_size / 1e6:.1f} MB"
+        )
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
@@ -0,0 +1,618 @@
+"""
+MCAP (any encoding of this repo) -> ROS 2 bag, with standard ROS 2 message types in CDR.
+
+    $ export PYTHONPATH=/project/path
+    $ python tools/rosbag.py episode_0.mcap output_bag --workers 4
+
+Schema mapping (json, protobuf or cdr input):
+- aloha_14dof / aloha_2dof   -> sensor_msgs/msg/JointState (position; velocity / effort for
+                                topics ending in "velocity" / "effort")
+- GripperPose                -> geometry_msgs/msg/PoseStamped
+- Vector                     -> std_msgs/msg/Float64MultiArray
+- VectorBatch                -> std_msgs/msg/Float64MultiArray, one message per sample
+- foxglove.CompressedImage   -> sensor_msgs/msg/CompressedImage
+- foxglove.RawImage          -> sensor_msgs/msg/Image
+- foxglove.CompressedVideo   -> foxglove_msgs/msg/CompressedVideo
+Channels already in CDR with the target type (images and video of a cdr build) are copied
+byte for byte. Other cdr channels are copied with their own schema; other channels are skipped.
+
+The input is streamed chunk by chunk (chunk index of the summary): compressed chunks are
+sent to `workers` processes which decompress them, serialize their messages and build the
+compressed output chunk (common.chunks); one writer in this process appends the chunks in
+input order. At most 2 * workers chunks are in flight.
+
+Output: the rosbag2 "mcap" storage (bag directory with <name>_0.mcap, profile ros2, and
+metadata.yaml) written directly, no ROS install needed; or, with writer = "rosbag2",
+through rosbag2_py (sqlite3 or mcap storage, create_topic per topic) when ROS 2 is sourced.
+"""
+import base64
+import os
+import struct
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+import tyro
+from mcap.reader import NonSeekingReader
+from mcap.writer import CompressionType
+
+from common.chunks import ChunkWriter, build_chunk
+from common.encoding import CDR_HEADER, SCHEMAS, schema_file
+from common.metrics import NULL_METRICS
+from tools.query import IndexedReader, MessageDecoder, decompress, iter_chunk_messages
+
+# ROS 2 type -> ros2msg definition (schema/*.msg)
+ROS2_TYPES = {
+    "sensor_msgs/msg/JointState": "joint_state.msg",
+    "geometry_msgs/msg/PoseStamped": "pose_stamped.msg",
+    "std_msgs/msg/Float64MultiArray": "float64_multi_array.msg",
+    "sensor_msgs/msg/CompressedImage": SCHEMAS["foxglove.CompressedImage"][2],
+    "sensor_msgs/msg/Image": SCHEMAS["foxglove.RawImage"][2],
+    "foxglove_msgs/msg/CompressedVideo": SCHEMAS["foxglove.CompressedVideo"][2],
+}
+
+# common.encoding.SCHEMAS name -> ROS 2 type
+ROS2_MAPPING = {
+    "aloha_14dof": "sensor_msgs/msg/JointState",
+    "aloha_2dof": "sensor_msgs/msg/JointState",
+    "GripperPose": "geometry_msgs/msg/PoseStamped",
+    "Vector": "std_msgs/msg/Float64MultiArray",
+    "VectorBatch": "std_msgs/msg/Float64MultiArray",
+    "foxglove.CompressedImage": "sensor_msgs/msg/CompressedImage",
+    "foxglove.RawImage": "sensor_msgs/msg/Image",
+    "foxglove.CompressedVideo": "foxglove_msgs/msg/CompressedVideo",
+}
+
+# schema name in any encoding (json / protobuf / ros2msg) -> common.encoding.SCHEMAS name
+SCHEMA_NAMES = {
+    schema_name: name for name, entry in SCHEMAS.items() for schema_name in (name, entry[1], entry[3])
+}
+
+# Per rosbag2: topics recorded with the default reliable / volatile QoS
+OFFERED_QOS_PROFILES = (
+    "- history: 3\n  depth: 0\n  reliability: 1\n  durability: 2\n"
+    "  deadline:\n    sec: 2147483647\n    nsec: 4294967295\n"
+    "  lifespan:\n    sec: 2147483647\n    nsec: 4294967295\n"
+    "  liveliness: 1\n  liveliness_lease_duration:\n    sec: 2147483647\n    nsec: 4294967295\n"
+    "  avoid_ros_namespace_conventions: false"
+)
+
+
+class CdrWriter:
+    """XCDR1 little endian serializer, alignment relative to the end of the encapsulation header."""
+
+    def __init__(self):
+        self.parts = [CDR_HEADER]
+        self.size = 0
+
+    def _append(self, data, alignment=1):
+        padding = -self.size % alignment
+        if padding:
+            self.parts.append(b"\x00" * padding)
+        self.parts.append(data)
+        self.size += padding + memoryview(data).nbytes
+
+    def pack(self, fmt, *values, alignment=4):
+        self._append(struct.pack(f"<{fmt}", *values), alignment)
+
+    def time(self, sec, nsec):
+        self.pack("iI", sec, nsec)
+
+    def string(self, value):
+        value = value.encode("utf-8") + b"\x00"
+        self.pack("I", len(value))
+        self._append(value)
+
+    def strings(self, values):
+        self.pack("I", len(values))
+        for value in values:
+            self.string(value)
+
+    def float64s(self, values):
+        values = np.ascontiguousarray(values, dtype="<f8")
+        self.pack("I", values.size)
+        if values.size:
+            self._append(values.data, 8)
+
+    def uint8s(self, data):
+        self.pack("I", memoryview(data).nbytes)
+        self._append(data)
+
+    def getvalue(self):
+        return b"".join(self.parts)
+
+
+def stamp(fields, log_time):
+    """(sec, nsec) of a decoded message: its own timestamp / header stamp in any encoding, else log_time."""
+    value = fields.get("timestamp")
+    if value is None and isinstance(fields.get("header"), dict):
+        value = fields["header"].get("stamp")
+    if isinstance(value, dict):
+        sec = value.get("sec", value.get("seconds", 0))
+        nsec = value.get("nsec", value.get("nanosec", value.get("nanos", 0)))
+        return int(sec), int(nsec)
+    if isinstance(value, (int, float)) and value:
+        # json GripperPose stores the timestamp in milliseconds
+        ts = int(value)
+        return ts // 1000, ts % 1000 * 1_000_000
+    return log_time // 1_000_000_000, log_time % 1_000_000_000
+
+
+def frame_id(fields):
+    header = fields.get("header")
+    return fields.get("frame_id") or (header.get("frame_id", "") if isinstance(header, dict) else "")
+
+
+def message_bytes(value):
+    return base64.b64decode(value) if isinstance(value, str) else value
+
+
+def header(writer, sec, nsec, frame=""):
+    writer.time(sec, nsec)
+    writer.string(frame)
+
+
+def to_joint_state(topic, fields, log_time):
+    writer = CdrWriter()
+    header(writer, *stamp(fields, log_time))
+    writer.strings([])
+    # position, velocity, effort: only the field of this topic is filled
+    target = "velocity" if topic.endswith("velocity") else "effort" if topic.endswith("effort") else "position"
+    for field in ("position", "velocity", "effort"):
+        writer.float64s(fields["joint_state"] if field == target else ())
+    return [(log_time, writer.getvalue())]
+
+
+def to_pose_stamped(topic, fields, log_time):
+    writer = CdrWriter()
+    header(writer, *stamp(fields, log_time))
+    position, orientation = fields["position"], fields["orientation"]
+    writer.pack(
+        "7d", position["x"], position["y"], position["z"],
+        orientation["x"], orientation["y"], orientation["z"], orientation["w"], alignment=8,
+    )
+    return [(log_time, writer.getvalue())]
+
+
+def float64_multi_arrays(values, label="values"):
+    """
+    One Float64MultiArray per row of `values` [N, D] (layout: one dimension `label` of size D).
+    Rows have the same size: they are laid out in one numpy record array and cut out of its buffer.
+    """
+    values = np.asarray(values, dtype="<f8")
+    values = values.reshape(-1, values.shape[-1] if values.ndim else 1)
+    n, dim = values.shape
+    label = label.encode("utf-8") + b"\x00"
+    records = np.zeros(n, dtype=np.dtype([
+        ("header", "V4"), ("dims", "<u4"), ("label_length", "<u4"), ("label", f"V{len(label)}"),
+        ("pad", f"V{-(8 + len(label)) % 4}"), ("size", "<u4"), ("stride", "<u4"), ("data_offset", "<u4"),
+        ("length", "<u4"), ("pad8", f"V{-(8 + len(label) + -(8 + len(label)) % 4 + 16) % 8}"),
+        ("data", "<f8", (dim,)),
+    ]))
+    records["header"] = np.frombuffer(CDR_HEADER, dtype="V4")[0]
+    records["dims"] = 1
+    records["label_length"] = len(label)
+    records["label"] = np.frombuffer(label, dtype=f"V{len(label)}")[0]
+    records["size"] = records["stride"] = records["length"] = dim
+    records["data"] = values
+    buffer = records.tobytes()
+    size = records.dtype.itemsize
+    return [buffer[i:i + size] for i in range(0, len(buffer), size)]
+
+
+def to_float64_multi_array(topic, fields, log_time):
+    return [(log_time, float64_multi_arrays(fields["values"])[0])]
+
+
+def to_float64_multi_arrays(topic, fields, log_time):
+    """VectorBatch: one Float64MultiArray per sample, at the sample time."""
+    values = np.asarray(fields["values"], dtype=np.float64).reshape(-1, fields["dim"])
+    return list(zip(np.asarray(fields["sample_time_ns"], dtype=np.int64).tolist(), float64_multi_arrays(values)))
+
+
+def to_compressed_image(topic, fields, log_time):
+    writer = CdrWriter()
+    header(writer, *stamp(fields, log_time), frame_id(fields))
+    writer.string(fields["format"])
+    writer.uint8s(message_bytes(fields["data"]))
+    return [(log_time, writer.getvalue())]
+
+
+def to_image(topic, fields, log_time):
+    writer = CdrWriter()
+    header(writer, *stamp(fields, log_time), frame_id(fields))
+    writer.pack("II", fields["height"], fields["width"])
+    writer.string(fields["encoding"])
+    writer.pack("B", fields.get("is_bigendian", 0), alignment=1)
+    writer.pack("I", fields["step"])
+    writer.uint8s(message_bytes(fields["data"]))
+    return [(log_time, writer.getvalue())]
+
+
+def to_compressed_video(topic, fields, log_time):
+    writer = CdrWriter()
+    writer.time(*stamp(fields, log_time))
+    writer.string(frame_id(fields))
+    writer.uint8s(message_bytes(fields["data"]))
+    writer.string(fields["format"])
+    return [(log_time, writer.getvalue())]
+
+
+CONVERTERS = {
+    "aloha_14dof": to_joint_state,
+    "aloha_2dof": to_joint_state,
+    "GripperPose": to_pose_stamped,
+    "Vector": to_float64_multi_array,
+    "VectorBatch": to_float64_multi_arrays,
+    "foxglove.CompressedImage": to_compressed_image,
+    "foxglove.RawImage": to_image,
+    "foxglove.CompressedVideo": to_compressed_video,
+}
+
+
+def read_cdr_joint_state(data):
+    sec, nsec = struct.unpack_from("<iI", data, 4)
+    return {"timestamp": {"sec": sec, "nsec": nsec}, "joint_state": np.frombuffer(data, "<f8", offset=12)}
+
+
+def read_cdr_pose(data):
+    sec, nsec, x, y, z, qx, qy, qz, qw = struct.unpack_from("<iI7d", data, 4)
+    return {
+        "timestamp": {"sec": sec, "nsec": nsec},
+        "position": {"x": x, "y": y, "z": z},
+        "orientation": {"x": qx, "y": qy, "z": qz, "w": qw},
+    }
+
+
+def read_cdr_vector(data):
+    sec, nsec, n = struct.unpack_from("<iII", data, 4)
+    return {"timestamp": {"sec": sec, "nsec": nsec}, "values": np.frombuffer(data, "<f8", n, 20)}
+
+
+def read_cdr_vector_batch(data):
+    sec, nsec, n = struct.unpack_from("<iII", data, 4)
+    dim, size = struct.unpack_from("<II", data, 20 + 8 * n)
+    return {
+        "timestamp": {"sec": sec, "nsec": nsec},
+        "sample_time_ns": np.frombuffer(data, "<u8", n, 20),
+        "dim": dim,
+        "values": np.frombuffer(data, "<f8", size, 28 + 8 * n),
+    }
+
+
+# Numeric messages of this repo in cdr (layouts of common.encoding), read with numpy
+# instead of the generic ros2 decoder, which unpacks arrays one element at a time
+CDR_READERS = {
+    "aloha_14dof": read_cdr_joint_state,
+    "aloha_2dof": read_cdr_joint_state,
+    "GripperPose": read_cdr_pose,
+    "Vector": read_cdr_vector,
+    "VectorBatch": read_cdr_vector_batch,
+}
+
+
+def plan_channels(summary):
+    """
+    {channel_id: (mode, ROS 2 type, schema definition, output channel id)} with mode "copy"
+    (CDR bytes kept), "convert" (common.encoding schema -> standard ROS 2 type) or "skip".
+    Output channel ids follow the input channel ids, skipped channels left out.
+    """
+    plans = {}
+    output_id = 0
+    for channel_id, channel in sorted(summary.channels.items()):
+        schema = summary.schemas.get(channel.schema_id)
+        schema_name = schema.name if schema else ""
+        name = SCHEMA_NAMES.get(schema_name)
+        ros2_type = ROS2_MAPPING.get(name)
+        if channel.message_encoding == "cdr" and (ros2_type is None or ros2_type == schema_name):
+            output_id += 1
+            plans[channel_id] = ("copy", schema_name, schema.data if schema else b"", output_id)
+        elif ros2_type is not None:
+            output_id += 1
+            plans[channel_id] = ("convert", ros2_type, schema_file(ROS2_TYPES[ros2_type]), output_id)
+        else:
+            plans[channel_id] = ("skip", schema_name, b"", 0)
+    return plans
+
+
+class Converter:
+    """Input messages -> (output channel id, log_time, CDR bytes), one instance per process."""
+
+    def __init__(self, summary, plans, chunk_compression=None):
+        self.summary = summary
+        self.plans = plans
+        self.chunk_compression = chunk_compression
+        self.decoder = MessageDecoder()
+
+    def convert(self, messages):
+        out = []
+        for message in messages:
+            mode, _, _, output_id = self.plans[message.channel_id]
+            if mode == "copy":
+                out.append((output_id, message.log_time, message.data))
+            elif mode == "convert":
+                channel = self.summary.channels[message.channel_id]
+                name = SCHEMA_NAMES[self.summary.schemas[channel.schema_id].name]
+                if channel.message_encoding == "cdr" and name in CDR_READERS:
+                    fields = CDR_READERS[name](message.data)
+                else:
+                    fields = self.decoder.decode(self.summary.schemas[channel.schema_id], channel, message)
+                for log_time, data in CONVERTERS[name](channel.topic, fields, message.log_time):
+                    out.append((output_id, log_time, data))
+        return out
+
+    def run(self, function, args):
+        """
+        Convert one work item (see iter_work). With chunk_compression set, return the output as one
+        compressed common.chunks.BuiltChunk, so the writer only copies bytes; else the message list.
+        """
+        if function == "chunk":
+            compression, data, uncompressed_size = args
+            records = decompress(compression, data, uncompressed_size)
+            messages = (message for _, message in iter_chunk_messages(records))
+        else:
+            messages = args
+        out = self.convert(messages)
+        if self.chunk_compression is None:
+            return out
+        return build_chunk(
+            ((channel_id, 0, log_time, log_time, data) for channel_id, log_time, data in out),
+            self.chunk_compression,
+        )
+
+
+# Converter of each worker process, set by init_worker
+_converter = None
+
+
+def init_worker(summary, plans, chunk_compression):
+    global _converter
+    _converter = Converter(summary, plans, chunk_compression)
+
+
+def run_worker(function, args):
+    return _converter.run(function, args)
+
+
+def iter_work(reader, batch_size=1000):
+    """Input split in work items: ("chunk", compressed records) per chunk, or message batches without chunk index."""
+    if reader.indexed:
+        for chunk_index in sorted(reader.summary.chunk_indexes, key=lambda index: index.chunk_start_offset):
+            data = bytes(reader.read_chunk_records(chunk_index))
+            yield "chunk", (chunk_index.compression, data, chunk_index.uncompressed_size)
+        return
+    reader._file.seek(0)
+    batch = []
+    for _, _, message in NonSeekingReader(reader._file).iter_messages(log_time_order=False):
+        batch.append(message)
+        if len(batch) == batch_size:
+            yield "messages", batch
+            batch = []
+    if batch:
+        yield "messages", batch
+
+
+class McapBagWriter:
+    """
+    rosbag2 "mcap" storage written directly: <bag>/<bag name>_0.mcap (profile ros2, written as .part
+    then renamed) and metadata.yaml. Work items come back as built chunks: see common.chunks.
+    """
+
+    def __init__(self, bag_path, compression="zstd"):
+        self.bag_path = bag_path
+        self.file_name = f"{os.path.basename(os.path.normpath(bag_path))}_0.mcap"
+        self.output_path = os.path.join(bag_path, self.file_name)
+        self.part_path = f"{self.output_path}.part"
+        self.chunk_compression = CompressionType[compression.upper()]
+        self.topics = {}  # channel id -> (topic, ROS 2 type)
+        self._file = None
+        self.writer = None
+
+    def open(self):
+        os.makedirs(self.bag_path)
+        self._file = open(self.part_path, "wb")
+        self.writer = ChunkWriter(self._file)
+        self.writer.start(profile="ros2")
+        return self
+
+    def create_topic(self, topic, ros2_type, definition):
+        schema_id = next(
+            (schema.id for schema in self.writer.schemas.values() if schema.name == ros2_type and schema.data == definition),
+            None,
+        ) or self.writer.register_schema(ros2_type, "ros2msg", definition)
+        channel_id = self.writer.register_channel(
+            topic, "cdr", schema_id, {"offered_qos_profiles": OFFERED_QOS_PROFILES}
+        )
+        self.topics[channel_id] = (topic, ros2_type)
+        return channel_id
+
+    def write(self, chunk):
+        self.writer.add_chunk(chunk)
+
+    def close(self):
+        self.writer.finish()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.part_path, self.output_path)
+        with open(os.path.join(self.bag_path, "metadata.yaml"), "w") as f:
+            f.write(self.metadata_yaml())
+
+    def abort(self):
+        """Drop the .part file and the bag directory created by open, unless something else was written in it."""
+        self._file.close()
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+        try:
+            os.rmdir(self.bag_path)
+        except OSError:
+            pass
+
+    def topic_counts(self):
+        counts = self.writer.statistics.channel_message_counts
+        return {topic: (ros2_type, counts.get(channel_id, 0)) for channel_id, (topic, ros2_type) in self.topics.items()}
+
+    def metadata_yaml(self):
+        statistics = self.writer.statistics
+        start = statistics.message_start_time
+        duration = statistics.message_end_time - start
+        count = statistics.message_count
+        lines = [
+            "rosbag2_bagfile_information:",
+            "  version: 5",
+            "  storage_identifier: mcap",
+            f"  duration:\n    nanoseconds: {duration}",
+            f"  starting_time:\n    nanoseconds_since_epoch: {start}",
+            f"  message_count: {count}",
+            "  topics_with_message_count:",
+        ]
+        qos = "\n".join(f"          {line}" for line in OFFERED_QOS_PROFILES.split("\n"))
+        for topic, (ros2_type, n) in self.topic_counts().items():
+            lines += [
+                "    - topic_metadata:",
+                f"        name: {topic}",
+                f"        type: {ros2_type}",
+                "        serialization_format: cdr",
+                f"        offered_qos_profiles: |\n{qos}",
+                f"      message_count: {n}",
+            ]
+        lines += [
+            '  compression_format: ""',
+            '  compression_mode: ""',
+            "  relative_file_paths:",
+            f"    - {self.file_name}",
+            "  files:",
+            f"    - path: {self.file_name}",
+            f"      starting_time:\n        nanoseconds_since_epoch: {start}",
+            f"      duration:\n        nanoseconds: {duration}",
+            f"      message_count: {count}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class Rosbag2Writer:
+    """rosbag2_py.SequentialWriter (ROS 2 must be sourced), every topic declared with create_topic."""
+
+    chunk_compression = None  # work items come back as message lists
+
+    def __init__(self, bag_path, storage_id="mcap"):
+        import rosbag2_py
+        self.rosbag2_py = rosbag2_py
+        self.bag_path = bag_path
+        self.storage_id = storage_id
+        self.writer = rosbag2_py.SequentialWriter()
+        self.topics = {}  # channel id -> topic
+        self.counts = {}
+
+    def open(self):
+        self.writer.open(
+            self.rosbag2_py.StorageOptions(uri=str(self.bag_path), storage_id=self.storage_id),
+            self.rosbag2_py.ConverterOptions(input_serialization_format="cdr", output_serialization_format="cdr"),
+        )
+        return self
+
+    def create_topic(self, topic, ros2_type, definition):
+        self.writer.create_topic(self.rosbag2_py.TopicMetadata(name=topic, type=ros2_type, serialization_format="cdr"))
+        channel_id = len(self.topics) + 1
+        self.topics[channel_id] = (topic, ros2_type)
+        self.counts[channel_id] = 0
+        return channel_id
+
+    def write(self, messages):
+        for channel_id, log_time, data in messages:
+            self.writer.write(self.topics[channel_id][0], data, log_time)
+            self.counts[channel_id] += 1
+
+    def topic_counts(self):
+        return {topic: (ros2_type, self.counts[channel_id]) for channel_id, (topic, ros2_type) in self.topics.items()}
+
+    def close(self):
+        del self.writer  # the bag is finalized when the writer is destroyed
+
+    def abort(self):
+        self.close()
+
+
+def mcap_to_rosbag(
+        mcap_path, bag_path, workers=1, writer="mcap", storage_id="mcap", compression="zstd", metrics=NULL_METRICS,
+):
+    """
+    Convert `mcap_path` to a ROS 2 bag directory `bag_path` (must not exist).
+    Return {topic: (ROS 2 type, message count)}.
+    """
+    if os.path.exists(bag_path):
+        raise FileExistsError(f"Bag {bag_path} already exists")
+    with IndexedReader(mcap_path, metrics=metrics) as reader:
+        summary = reader.summary
+        if summary is None:
+            raise ValueError(f"{mcap_path} has no summary section, run `mcap recover` on it first")
+        plans = plan_channels(summary)
+        for channel_id, (mode, schema_name, _, _) in plans.items():
+            if mode == "skip":
+                print(f"Skip {summary.channels[channel_id].topic}: no ROS 2 mapping for {schema_name or 'schemaless'}")
+
+        bag = McapBagWriter(bag_path, compression) if writer == "mcap" else Rosbag2Writer(bag_path, storage_id)
+        bag.open()
+        try:
+            for channel_id, (mode, ros2_type, definition, output_id) in sorted(plans.items()):
+                if mode != "skip":
+                    assert bag.create_topic(summary.channels[channel_id].topic, ros2_type, definition) == output_id
+
+            if workers > 1:
+                # Serialization (and output chunk compression) in worker processes, one writer here,
+                # results written in input order
+                with ProcessPoolExecutor(
+                        max_workers=workers, mp_context=get_context("spawn"),
+                        initializer=init_worker, initargs=(summary, plans, bag.chunk_compression),
+                ) as executor:
+                    window = deque()
+                    for function, args in iter_work(reader):
+                        window.append(executor.submit(run_worker, function, args))
+                        if len(window) >= 2 * workers:
+                            with metrics.timer("bag_write"):
+                                bag.write(window.popleft().result())
+                    while window:
+                        with metrics.timer("bag_write"):
+                            bag.write(window.popleft().result())
+            else:
+                converter = Converter(summary, plans, bag.chunk_compression)
+                for function, args in iter_work(reader):
+                    with metrics.timer("serialize"):
+                        result = converter.run(function, args)
+                    with metrics.timer("bag_write"):
+                        bag.write(result)
+        except BaseException:
+            bag.abort()
+            raise
+        bag.close()
+    return bag.topic_counts()
+
+
+def main(
+        mcap_path: tyro.conf.Positional[Path],
+        bag_path: tyro.conf.Positional[Path],
+        workers: int = 1,
+        writer: Literal["mcap", "rosbag2"] = "mcap",
+        storage_id: Literal["mcap", "sqlite3"] = "mcap",
+        compression: Literal["zstd", "lz4", "none"] = "zstd",
+):
+    """
+    Convert an MCAP file of this repo (json, protobuf or cdr) to a ROS 2 bag directory.
+    - workers > 1: decompress and serialize input chunks in that many processes, one writer.
+    - writer: "mcap" writes the rosbag2 mcap storage directly (no ROS install needed),
+      "rosbag2" goes through rosbag2_py with storage_id (sqlite3 or mcap).
+    - compression: chunk compression of the "mcap" writer.
+    """
+    start = time.perf_counter()
+    topics = mcap_to_rosbag(mcap_path, bag_path, workers, writer, storage_id, compression)
+    for topic, (ros2_type, count) in topics.items():
+        print(f"  {topic:60s} {count:>8} {ros2_type}")
+    print(f"Converted {mcap_path} to {bag_path} in {time.perf_counter() - start:.2f} seconds")
+
+
+if __name__ == '__main__':
+    tyro.cli(main)